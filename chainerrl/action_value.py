@@ -51,6 +51,13 @@ class ActionValue(with_metaclass(ABCMeta, object)):
         """
         raise NotImplementedError()
 
+    def __getitem__(self, i):
+        """Get the action values of a part of the batch, e.g. av[i:i+1].
+
+        Subclasses are not required to support this.
+        """
+        raise NotImplementedError()
+
 
 class DiscreteActionValue(ActionValue):
     """Q-function output for discrete action space.
@@ -100,6 +107,10 @@ class DiscreteActionValue(ActionValue):
     def compute_expectation(self, beta):
         return F.sum(F.softmax(beta * self.q_values) * self.q_values, axis=1)
 
+    def __getitem__(self, i):
+        return DiscreteActionValue(
+            self.q_values[i], q_values_formatter=self.q_values_formatter)
+
     def __repr__(self):
         return 'DiscreteActionValue greedy_actions:{} q_values:{}'.format(
             self.greedy_actions.data,
@@ -182,6 +193,11 @@ class DistributionalDiscreteActionValue(ActionValue):
     def compute_expectation(self, beta):
         return F.sum(F.softmax(beta * self.q_values) * self.q_values, axis=1)
 
+    def __getitem__(self, i):
+        return DistributionalDiscreteActionValue(
+            self.q_dist[i], self.z_values,
+            q_values_formatter=self.q_values_formatter)
+
     def __repr__(self):
         return 'DistributionalDiscreteActionValue greedy_actions:{} q_values:{}'.format(  # NOQA
             self.greedy_actions.data,
@@ -262,6 +278,11 @@ class QuadraticActionValue(ActionValue):
         return (self.evaluate_actions(actions) -
                 self.evaluate_actions(argmax_actions))
 
+    def __getitem__(self, i):
+        return QuadraticActionValue(
+            self.mu[i], self.mat[i], self.v[i],
+            min_action=self.min_action, max_action=self.max_action)
+
     def __repr__(self):
         return 'QuadraticActionValue greedy_actions:{} v:{}'.format(
             self.greedy_actions.data, self.v.data)
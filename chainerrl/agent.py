@@ -99,6 +99,71 @@ class Agent(with_metaclass(ABCMeta, object)):
         """
         pass
 
+    def batch_act(self, batch_obs):
+        """Select a batch of actions for evaluation.
+
+        Agents that support acting in multiple environments at once override
+        the batch_* methods, which select actions for all the environments by
+        a single forward computation of a batch of observations.
+
+        Args:
+            batch_obs (Sequence of ~object): Observations of environments.
+
+        Returns:
+            Sequence of ~object: Actions.
+        """
+        raise NotImplementedError()
+
+    def batch_act_and_train(self, batch_obs):
+        """Select a batch of actions for training.
+
+        Args:
+            batch_obs (Sequence of ~object): Observations of environments.
+
+        Returns:
+            Sequence of ~object: Actions.
+        """
+        raise NotImplementedError()
+
+    def batch_observe(self, batch_obs, batch_reward, batch_done, batch_reset):
+        """Observe a batch of consequences of actions for evaluation.
+
+        Args:
+            batch_obs (Sequence of ~object): Observations of environments.
+            batch_reward (Sequence of float): Rewards.
+            batch_done (Sequence of bool): Whether each environment reached a
+                terminal state.
+            batch_reset (Sequence of bool): Whether each environment is going
+                to be reset without reaching a terminal state, e.g. due to a
+                time limit.
+
+        Returns:
+            None
+        """
+        raise NotImplementedError()
+
+    def batch_observe_and_train(self, batch_obs, batch_reward, batch_done,
+                                batch_reset):
+        """Observe a batch of consequences of actions for training.
+
+        An episode of an environment ends when its done or reset is True, and
+        its next observation given to batch_act_and_train is regarded as the
+        initial observation of a new episode.
+
+        Args:
+            batch_obs (Sequence of ~object): Observations of environments.
+            batch_reward (Sequence of float): Rewards.
+            batch_done (Sequence of bool): Whether each environment reached a
+                terminal state.
+            batch_reset (Sequence of bool): Whether each environment is going
+                to be reset without reaching a terminal state, e.g. due to a
+                time limit.
+
+        Returns:
+            None
+        """
+        raise NotImplementedError()
+
 
 class AttributeSavingMixin(object):
     """Mixin that provides save and load functionalities."""
@@ -0,0 +1,284 @@
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+from logging import getLogger
+
+import chainer
+from chainer import cuda
+from chainer import functions as F
+import numpy as np
+
+from chainerrl import agent
+from chainerrl.agents.a3c import A3CModel
+from chainerrl.misc.batch_states import batch_states
+from chainerrl.recurrent import mask_recurrent_state_at
+from chainerrl.recurrent import Recurrent
+from chainerrl.recurrent import state_set
+from chainerrl.recurrent import unchain_backward
+
+logger = getLogger(__name__)
+
+
+def compute_n_step_returns(rewards, dones, resets, reset_values,
+                           next_values, gamma):
+    """Compute n-step returns of multiple environments at once.
+
+    Episodes that end within the arrays are handled: returns are not
+    bootstrapped from terminal states, and returns of episodes that are
+    reset without reaching terminal states are bootstrapped from the values
+    of their last observations.
+
+    Args:
+        rewards (ndarray): Rewards of shape (T, N).
+        dones (ndarray): Done flags of shape (T, N).
+        resets (ndarray): Reset flags of shape (T, N).
+        reset_values (ndarray): Values of the next observations, which are
+            used only where resets are True, of shape (T, N).
+        next_values (ndarray): Values of the observations that follow the
+            last time step, of shape (N,).
+        gamma (float): Discount factor.
+    Returns:
+        ndarray: n-step returns of shape (T, N).
+    """
+    returns = np.empty_like(rewards)
+    R = next_values
+    for t in reversed(range(len(rewards))):
+        R = np.where(resets[t], reset_values[t], R)
+        R = rewards[t] + gamma * np.logical_not(dones[t]) * R
+        returns[t] = R
+    return returns
+
+
+class A2C(agent.AttributeSavingMixin, agent.Agent):
+    """A2C: Advantage Actor-Critic.
+
+    A synchronous variant of A3C, which collects `t_max` time steps from
+    multiple environments with one batched forward pass per step and then
+    updates the model once using n-step returns. Losses are averaged over
+    time steps and environments.
+
+    Only the batch_* methods of Agent can be used for training. Recurrent
+    models are supported, whose states are kept separately for each
+    environment.
+
+    See https://blog.openai.com/baselines-acktr-a2c/
+
+    Args:
+        model (A3CModel): Model to train
+        optimizer (chainer.Optimizer): optimizer used to train the model
+        t_max (int): The model is updated after every t_max steps of
+            environments
+        gamma (float): Discount factor [0,1]
+        beta (float): Weight coefficient for the entropy regularizaiton term.
+        gpu (int): GPU device id if not None nor negative
+        phi (callable): Feature extractor function
+        pi_loss_coef (float): Weight coefficient for the loss of the policy
+        v_loss_coef (float): Weight coefficient for the loss of the value
+            function
+        act_deterministically (bool): If set true, choose most probable actions
+            in act method.
+        average_entropy_decay (float): Decay rate of average entropy, only used
+            for recording statistics
+        average_value_decay (float): Decay rate of average value, only used
+            for recording statistics
+        batch_states (callable): method which makes a batch of observations.
+            default is `chainerrl.misc.batch_states.batch_states`
+    """
+
+    saved_attributes = ['model', 'optimizer']
+
+    def __init__(self, model, optimizer, t_max, gamma, beta=1e-2,
+                 gpu=None, phi=lambda x: x,
+                 pi_loss_coef=1.0, v_loss_coef=0.5,
+                 act_deterministically=False,
+                 average_entropy_decay=0.999,
+                 average_value_decay=0.999,
+                 batch_states=batch_states):
+
+        assert isinstance(model, A3CModel)
+        self.model = model
+
+        if gpu is not None and gpu >= 0:
+            cuda.get_device_from_id(gpu).use()
+            self.model.to_gpu(device=gpu)
+
+        self.optimizer = optimizer
+
+        self.t_max = t_max
+        self.gamma = gamma
+        self.beta = beta
+        self.phi = phi
+        self.pi_loss_coef = pi_loss_coef
+        self.v_loss_coef = v_loss_coef
+        self.act_deterministically = act_deterministically
+        self.average_value_decay = average_value_decay
+        self.average_entropy_decay = average_entropy_decay
+        self.batch_states = batch_states
+
+        self.xp = self.model.xp
+        self.t = 0
+        self._reset_rollout()
+        self.train_recurrent_states = None
+        self.test_recurrent_states = None
+
+        # Stats
+        self.average_value = 0
+        self.average_entropy = 0
+
+    def _reset_rollout(self):
+        self.past_action_log_prob = []
+        self.past_action_entropy = []
+        self.past_values = []
+        self.past_rewards = []
+        self.past_dones = []
+        self.past_resets = []
+        self.past_reset_values = []
+
+    def _compute_values(self, batch_obs):
+        """Compute values of observations without updating any state."""
+        with chainer.no_backprop_mode():
+            statevar = self.batch_states(batch_obs, self.xp, self.phi)
+            with state_set(self.model, self.train_recurrent_states):
+                _, vout = self.model.pi_and_v(statevar)
+        return cuda.to_cpu(vout.data[:, 0])
+
+    def update(self, next_values):
+        assert self.past_rewards
+
+        returns = compute_n_step_returns(
+            rewards=np.asarray(self.past_rewards, dtype=np.float32),
+            dones=np.asarray(self.past_dones),
+            resets=np.asarray(self.past_resets),
+            reset_values=np.asarray(self.past_reset_values,
+                                    dtype=np.float32),
+            next_values=next_values,
+            gamma=self.gamma)
+        returns = self.xp.asarray(returns)
+
+        log_probs = F.stack(self.past_action_log_prob)
+        entropy = F.stack(self.past_action_entropy)
+        values = F.stack(self.past_values)
+        advantages = returns - values.data
+
+        # Log probability is increased proportionally to advantage
+        pi_loss = - F.mean(log_probs * advantages)
+        # Entropy is maximized
+        pi_loss -= self.beta * F.mean(entropy)
+        v_loss = F.mean((values - returns) ** 2) / 2
+
+        if self.pi_loss_coef != 1.0:
+            pi_loss *= self.pi_loss_coef
+
+        if self.v_loss_coef != 1.0:
+            v_loss *= self.v_loss_coef
+
+        logger.debug('pi_loss:%s v_loss:%s', pi_loss.data, v_loss.data)
+
+        total_loss = pi_loss + v_loss
+
+        self.model.cleargrads()
+        total_loss.backward()
+        self.optimizer.update()
+        logger.debug('update')
+
+        # Truncate the computational graph kept by recurrent states
+        unchain_backward(self.train_recurrent_states)
+        self._reset_rollout()
+
+    def batch_act(self, batch_obs):
+        with chainer.no_backprop_mode():
+            statevar = self.batch_states(batch_obs, self.xp, self.phi)
+            with state_set(self.model, self.test_recurrent_states):
+                pout, _ = self.model.pi_and_v(statevar)
+                if isinstance(self.model, Recurrent):
+                    self.test_recurrent_states = self.model.get_state()
+            if self.act_deterministically:
+                return cuda.to_cpu(pout.most_probable.data)
+            else:
+                return cuda.to_cpu(pout.sample().data)
+
+    def batch_act_and_train(self, batch_obs):
+        statevar = self.batch_states(batch_obs, self.xp, self.phi)
+        with state_set(self.model, self.train_recurrent_states):
+            pout, vout = self.model.pi_and_v(statevar)
+            if isinstance(self.model, Recurrent):
+                self.train_recurrent_states = self.model.get_state()
+        # Do not backprop through sampled actions
+        batch_action = pout.sample().data
+        self.past_action_log_prob.append(pout.log_prob(batch_action))
+        self.past_action_entropy.append(pout.entropy)
+        self.past_values.append(vout[:, 0])
+
+        # Update stats
+        self.average_value += (
+            (1 - self.average_value_decay) *
+            (float(vout.data.mean()) - self.average_value))
+        self.average_entropy += (
+            (1 - self.average_entropy_decay) *
+            (float(pout.entropy.data.mean()) - self.average_entropy))
+
+        return cuda.to_cpu(batch_action)
+
+    def batch_observe(self, batch_obs, batch_reward, batch_done, batch_reset):
+        if isinstance(self.model, Recurrent):
+            indices_that_ended = [
+                i for i in range(len(batch_obs))
+                if batch_done[i] or batch_reset[i]]
+            if indices_that_ended:
+                self.test_recurrent_states = mask_recurrent_state_at(
+                    self.test_recurrent_states, indices_that_ended)
+
+    def batch_observe_and_train(self, batch_obs, batch_reward, batch_done,
+                                batch_reset):
+        n_envs = len(batch_obs)
+        self.t += n_envs
+
+        batch_done = np.asarray(batch_done, dtype=bool)
+        # Episodes that are reset without reaching terminal states need to be
+        # bootstrapped from their last observations
+        batch_reset = np.logical_and(batch_reset,
+                                     np.logical_not(batch_done))
+        rollout_is_full = len(self.past_rewards) + 1 == self.t_max
+        if rollout_is_full or batch_reset.any():
+            values = self._compute_values(batch_obs)
+        else:
+            values = np.zeros(n_envs, dtype=np.float32)
+        self.past_rewards.append(batch_reward)
+        self.past_dones.append(batch_done)
+        self.past_resets.append(batch_reset)
+        self.past_reset_values.append(values)
+
+        if rollout_is_full:
+            self.update(values)
+
+        if isinstance(self.model, Recurrent):
+            indices_that_ended = list(np.flatnonzero(
+                np.logical_or(batch_done, batch_reset)))
+            if indices_that_ended:
+                self.train_recurrent_states = mask_recurrent_state_at(
+                    self.train_recurrent_states, indices_that_ended)
+
+    def act_and_train(self, obs, reward):
+        raise NotImplementedError(
+            'A2C supports only batch training. Use batch_act_and_train')
+
+    def act(self, obs):
+        return self.batch_act([obs])[0]
+
+    def stop_episode_and_train(self, state, reward, done=False):
+        raise NotImplementedError(
+            'A2C supports only batch training. Use batch_observe_and_train')
+
+    def stop_episode(self):
+        self.test_recurrent_states = None
+
+    def get_statistics(self):
+        return [
+            ('average_value', self.average_value),
+            ('average_entropy', self.average_entropy),
+        ]
@@ -97,9 +97,17 @@ class A3C(agent.AttributeSavingMixin, agent.AsyncAgent):
             in act method.
         batch_states (callable): method which makes a batch of observations.
             default is `chainerrl.misc.batch_states.batch_states`
+        grad_accumulation_steps (int): Number of updates whose gradients are
+            accumulated in the process-local model before they are applied
+            to the globally shared model.
     """
 
     process_idx = None
+    # InferenceClient used by act and act_and_train if not None
+    inference_client = None
+    # GradientSlots to which gradients are pushed instead of being applied
+    # by this process if not None
+    gradient_slots = None
     saved_attributes = ['model', 'optimizer']
 
     def __init__(self, model, optimizer, t_max, gamma, beta=1e-2,
@@ -111,7 +119,8 @@ class A3C(agent.AttributeSavingMixin, agent.AsyncAgent):
                  act_deterministically=False,
                  average_entropy_decay=0.999,
                  average_value_decay=0.999,
-                 batch_states=batch_states):
+                 batch_states=batch_states,
+                 grad_accumulation_steps=1):
 
         assert isinstance(model, A3CModel)
         # Globally shared model
@@ -120,6 +129,8 @@ class A3C(agent.AttributeSavingMixin, agent.AsyncAgent):
         # Thread specific model
         self.model = copy.deepcopy(self.shared_model)
         async.assert_params_not_shared(self.shared_model, self.model)
+        # Lay out params like shared ones so that they are synced at once
+        async.make_params_contiguous(self.model)
 
         self.optimizer = optimizer
 
@@ -137,12 +148,17 @@ class A3C(agent.AttributeSavingMixin, agent.AsyncAgent):
         self.average_value_decay = average_value_decay
         self.average_entropy_decay = average_entropy_decay
         self.batch_states = batch_states
+        self.grad_accumulation_steps = grad_accumulation_steps
 
         self.t = 0
+        self.n_accumulated_grads = 0
+        # Value of gradient_slots.update_count at the last synchronization
+        self.synced_version = 0
         self.t_start = 0
         self.past_action_log_prob = {}
         self.past_action_entropy = {}
         self.past_states = {}
+        self.past_actions = {}
         self.past_rewards = {}
         self.past_values = {}
         self.average_reward = 0
@@ -154,6 +170,8 @@ class A3C(agent.AttributeSavingMixin, agent.AsyncAgent):
         self.average_entropy = 0
 
     def sync_parameters(self):
+        if self.gradient_slots is not None:
+            self.synced_version = self.gradient_slots.update_count.value
         copy_param.copy_param(target_link=self.model,
                               source_link=self.shared_model)
 
@@ -161,9 +179,30 @@ class A3C(agent.AttributeSavingMixin, agent.AsyncAgent):
     def shared_attributes(self):
         return ('shared_model', 'optimizer')
 
+    def compute_past_outputs(self):
+        """Compute outputs of the model for actions chosen by the server.
+
+        Since outputs of the inference server are not differentiable, the
+        forward pass to backprop through is computed at once for all the
+        states since the last update.
+        """
+        steps = range(self.t_start, self.t)
+        states = np.concatenate([self.past_states[i] for i in steps])
+        actions = np.asarray([self.past_actions[i] for i in steps])
+        pout, vout = self.model.pi_and_v(states)
+        log_probs = pout.log_prob(actions)
+        entropies = pout.entropy
+        for k, i in enumerate(steps):
+            self.past_action_log_prob[i] = log_probs[k:k + 1]
+            self.past_action_entropy[i] = entropies[k:k + 1]
+            self.past_values[i] = vout[k:k + 1]
+
     def update(self, statevar):
         assert self.t_start < self.t
 
+        if self.inference_client is not None:
+            self.compute_past_outputs()
+
         if statevar is None:
             R = 0
         else:
@@ -218,33 +257,53 @@ class A3C(agent.AttributeSavingMixin, agent.AsyncAgent):
         total_loss = pi_loss + F.reshape(v_loss, pi_loss.data.shape)
 
         # Compute gradients using thread-specific model
-        self.model.zerograds()
+        if self.n_accumulated_grads == 0:
+            self.model.zerograds()
         total_loss.backward()
-        # Copy the gradients to the globally shared model
-        self.shared_model.zerograds()
-        copy_param.copy_grad(
-            target_link=self.shared_model, source_link=self.model)
-        # Update the globally shared model
-        if self.process_idx == 0:
-            norm = sum(np.sum(np.square(param.grad))
-                       for param in self.optimizer.target.params())
-            logger.debug('grad norm:%s', norm)
-        self.optimizer.update()
-        if self.process_idx == 0:
-            logger.debug('update')
+        self.n_accumulated_grads += 1
+        if self.n_accumulated_grads >= self.grad_accumulation_steps:
+            self.update_shared_model()
 
-        self.sync_parameters()
         if isinstance(self.model, Recurrent):
             self.model.unchain_backward()
 
         self.past_action_log_prob = {}
         self.past_action_entropy = {}
         self.past_states = {}
+        self.past_actions = {}
         self.past_rewards = {}
         self.past_values = {}
 
         self.t_start = self.t
 
+    def update_shared_model(self):
+        """Update the globally shared model by the accumulated gradients.
+
+        If gradient_slots is set, the gradients are pushed to it instead. If
+        its slot is still full, they keep being accumulated and are pushed
+        by a later call.
+        """
+        if self.gradient_slots is not None:
+            if not self.gradient_slots.push(
+                    self.process_idx, self.model, self.synced_version):
+                return
+        else:
+            # Copy the gradients to the globally shared model
+            self.shared_model.zerograds()
+            copy_param.copy_grad(
+                target_link=self.shared_model, source_link=self.model)
+            # Update the globally shared model
+            if self.process_idx == 0:
+                norm = sum(np.sum(np.square(param.grad))
+                           for param in self.optimizer.target.params())
+                logger.debug('grad norm:%s', norm)
+            self.optimizer.update()
+            if self.process_idx == 0:
+                logger.debug('update')
+
+        self.n_accumulated_grads = 0
+        self.sync_parameters()
+
     def act_and_train(self, obs, reward):
 
         statevar = self.batch_states([obs], np, self.phi)
@@ -255,26 +314,38 @@ class A3C(agent.AttributeSavingMixin, agent.AsyncAgent):
             self.update(statevar)
 
         self.past_states[self.t] = statevar
-        pout, vout = self.model.pi_and_v(statevar)
-        action = pout.sample().data  # Do not backprop through sampled actions
-        self.past_action_log_prob[self.t] = pout.log_prob(action)
-        self.past_action_entropy[self.t] = pout.entropy
-        self.past_values[self.t] = vout
+        if self.inference_client is not None:
+            # Batched with requests of the other processes. The outputs to
+            # backprop through are computed by update.
+            action, _, v, pout = self.inference_client.compute(obs)
+            self.past_actions[self.t] = action
+        else:
+            pout, vout = self.model.pi_and_v(statevar)
+            # Do not backprop through sampled actions
+            action = pout.sample().data
+            self.past_action_log_prob[self.t] = pout.log_prob(action)
+            self.past_action_entropy[self.t] = pout.entropy
+            self.past_values[self.t] = vout
+            action = action[0]
+            v = vout.data[0]
         self.t += 1
-        action = action[0]
         if self.process_idx == 0:
             logger.debug('t:%s r:%s a:%s pout:%s',
                          self.t, reward, action, pout)
         # Update stats
         self.average_value += (
             (1 - self.average_value_decay) *
-            (float(vout.data[0]) - self.average_value))
+            (float(v) - self.average_value))
         self.average_entropy += (
             (1 - self.average_entropy_decay) *
             (float(pout.entropy.data[0]) - self.average_entropy))
         return action
 
     def act(self, obs):
+        if self.inference_client is not None:
+            # Batched with requests of the other processes
+            return self.inference_client.act(
+                obs, deterministic=self.act_deterministically)
         # Use the process-local model for acting
         with chainer.no_backprop_mode():
             statevar = self.batch_states([obs], np, self.phi)
@@ -305,7 +376,10 @@ class A3C(agent.AttributeSavingMixin, agent.AsyncAgent):
                               source_link=self.model)
 
     def get_statistics(self):
-        return [
+        stats = [
             ('average_value', self.average_value),
             ('average_entropy', self.average_entropy),
         ]
+        if self.gradient_slots is not None:
+            stats.extend(self.gradient_slots.get_statistics())
+        return stats
@@ -242,6 +242,25 @@ def compute_loss_with_kl_constraint(distrib, another_distrib, original_loss,
     return loss, float(kl.data)
 
 
+def _unpad_episode(batch):
+    """Convert a padded batch of a single episode to a list of transitions.
+
+    Probabilities stored as `mu`, e.g. by SharedEpisodicReplayBuffer, are
+    restored as SoftmaxDistributions.
+    """
+    episode = []
+    for t in range(int(batch['length'][0])):
+        transition = dict((key, value[0, t]) for key, value in batch.items()
+                          if key not in ('length', 'mask'))
+        if 'mu' in transition:
+            # Zero probabilities are restored as -inf logits
+            with np.errstate(divide='ignore'):
+                logits = np.log(transition['mu'][None])
+            transition['mu'] = distribution.SoftmaxDistribution(logits)
+        episode.append(transition)
+    return episode
+
+
 class ACER(agent.AttributeSavingMixin, agent.AsyncAgent):
     """ACER (Actor-Critic with Experience Replay).
 
@@ -292,6 +311,8 @@ class ACER(agent.AttributeSavingMixin, agent.AsyncAgent):
     """
 
     process_idx = None
+    # InferenceClient used by act and act_and_train if not None
+    inference_client = None
     saved_attributes = ['model', 'optimizer']
 
     def __init__(self, model, optimizer, t_max, gamma, replay_buffer,
@@ -323,6 +344,8 @@ class ACER(agent.AttributeSavingMixin, agent.AsyncAgent):
         # Thread specific model
         self.model = copy.deepcopy(self.shared_model)
         async.assert_params_not_shared(self.shared_model, self.model)
+        # Lay out params like shared ones so that they are synced at once
+        async.make_params_contiguous(self.model)
 
         self.optimizer = optimizer
 
@@ -370,6 +393,8 @@ class ACER(agent.AttributeSavingMixin, agent.AsyncAgent):
         self.past_action_distrib = {}
         self.past_action_values = {}
         self.past_avg_action_distrib = {}
+        # Action distributions of the inference server that chose actions
+        self.past_action_distrib_mu = {}
         self.t_start = self.t
 
     def sync_parameters(self):
@@ -540,7 +565,12 @@ class ACER(agent.AttributeSavingMixin, agent.AsyncAgent):
         if len(self.replay_buffer) < self.replay_start_size:
             return
 
-        episode = self.replay_buffer.sample_episodes(1, self.t_max)[0]
+        episode = self.replay_buffer.sample_episodes(1, self.t_max)
+        if isinstance(episode, dict):
+            # Padded arrays, e.g. of SharedEpisodicReplayBuffer
+            episode = _unpad_episode(episode)
+        else:
+            episode = episode[0]
 
         with state_reset(self.model):
             with state_reset(self.shared_average_model):
@@ -587,10 +617,30 @@ class ACER(agent.AttributeSavingMixin, agent.AsyncAgent):
                     avg_action_distribs=avg_action_distribs,
                     action_values=action_values)
 
+    def compute_past_outputs(self):
+        """Compute outputs of the model for actions chosen by the server.
+
+        Since outputs of the inference server are not differentiable, the
+        forward passes to backprop through are computed for all the states
+        since the last update.
+        """
+        for t in range(self.t_start, self.t):
+            statevar = self.past_states[t]
+            action_distrib, action_value, v = self.model(statevar)
+            self.past_action_distrib[t] = action_distrib
+            self.past_action_values[t] = action_value
+            self.past_values[t] = v
+            with chainer.no_backprop_mode():
+                avg_action_distrib, _, _ = self.shared_average_model(
+                    statevar)
+            self.past_avg_action_distrib[t] = avg_action_distrib
+
     def update_on_policy(self, statevar):
         assert self.t_start < self.t
 
         if not self.disable_online_update:
+            if self.inference_client is not None:
+                self.compute_past_outputs()
             if statevar is None:
                 R = 0
             else:
@@ -606,7 +656,10 @@ class ACER(agent.AttributeSavingMixin, agent.AsyncAgent):
                 values=self.past_values,
                 action_values=self.past_action_values,
                 action_distribs=self.past_action_distrib,
-                action_distribs_mu=None,
+                # Actions chosen by the inference server are corrected by
+                # importance sampling since its params can differ from
+                # the process-local ones
+                action_distribs_mu=self.past_action_distrib_mu or None,
                 avg_action_distribs=self.past_avg_action_distrib)
 
         self.init_history_data_for_online_update()
@@ -623,17 +676,24 @@ class ACER(agent.AttributeSavingMixin, agent.AsyncAgent):
                 self.update_from_replay()
 
         self.past_states[self.t] = statevar
-        action_distrib, action_value, v = self.model(statevar)
-        self.past_action_values[self.t] = action_value
-        action = action_distrib.sample().data[0]
-
-        # Save values for a later update
-        self.past_values[self.t] = v
-        self.past_action_distrib[self.t] = action_distrib
-        with chainer.no_backprop_mode():
-            avg_action_distrib, _, _ = self.shared_average_model(
-                statevar)
-        self.past_avg_action_distrib[self.t] = avg_action_distrib
+        if self.inference_client is not None:
+            # Batched with requests of the other processes. The outputs to
+            # backprop through are computed by update_on_policy.
+            action, _, v, action_distrib = self.inference_client.compute(obs)
+            self.past_action_distrib_mu[self.t] = action_distrib
+        else:
+            action_distrib, action_value, v = self.model(statevar)
+            self.past_action_values[self.t] = action_value
+            action = action_distrib.sample().data[0]
+
+            # Save values for a later update
+            self.past_values[self.t] = v
+            self.past_action_distrib[self.t] = action_distrib
+            with chainer.no_backprop_mode():
+                avg_action_distrib, _, _ = self.shared_average_model(
+                    statevar)
+            self.past_avg_action_distrib[self.t] = avg_action_distrib
+            v = v.data[0]
 
         self.past_actions[self.t] = action
 
@@ -645,7 +705,7 @@ class ACER(agent.AttributeSavingMixin, agent.AsyncAgent):
         # Update stats
         self.average_value += (
             (1 - self.average_value_decay) *
-            (float(v.data[0]) - self.average_value))
+            (float(v) - self.average_value))
         self.average_entropy += (
             (1 - self.average_entropy_decay) *
             (float(action_distrib.entropy.data[0]) - self.average_entropy))
@@ -671,6 +731,10 @@ class ACER(agent.AttributeSavingMixin, agent.AsyncAgent):
         return action
 
     def act(self, obs):
+        if self.inference_client is not None:
+            # Batched with requests of the other processes
+            return self.inference_client.act(
+                obs, deterministic=self.act_deterministically)
         # Use the process-local model for acting
         with chainer.no_backprop_mode():
             statevar = np.expand_dims(self.phi(obs), 0)
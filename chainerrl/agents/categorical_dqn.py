@@ -87,6 +87,8 @@ class CategoricalDQN(dqn.DQN):
 
         batch_rewards = exp_batch['reward']
         batch_terminal = exp_batch['is_state_terminal']
+        if 'discount' in exp_batch:
+            gamma = exp_batch['discount'][..., None]
 
         batch_size = exp_batch['reward'].shape[0]
         z_values = target_next_qout.z_values
@@ -17,9 +17,12 @@ from chainerrl.agent import Agent
 from chainerrl.agent import AttributeSavingMixin
 from chainerrl.misc.batch_states import batch_states
 from chainerrl.misc.copy_param import synchronize_parameters
+from chainerrl.recurrent import mask_recurrent_state_at
 from chainerrl.recurrent import Recurrent
 from chainerrl.recurrent import RecurrentChainMixin
 from chainerrl.recurrent import state_kept
+from chainerrl.recurrent import state_set
+from chainerrl.replay_buffer import batch_episodes
 from chainerrl.replay_buffer import batch_experiences
 from chainerrl.replay_buffer import ReplayUpdater
 
@@ -136,6 +139,13 @@ class DDPG(AttributeSavingMixin, Agent):
         self.t = 0
         self.last_state = None
         self.last_action = None
+        # Per-env states of the batch_* methods. A transition of an env
+        # whose episode continues is appended when its next action is chosen.
+        self.batch_last_obs = []
+        self.batch_last_action = []
+        self.batch_last_reward = []
+        self.train_recurrent_states = None
+        self.test_recurrent_states = None
         self.target_model = copy.deepcopy(self.model)
         disable_train(self.target_model['q_function'])
         disable_train(self.target_model['policy'])
@@ -260,21 +270,10 @@ class DDPG(AttributeSavingMixin, Agent):
         self.actor_optimizer.update(lambda: self.compute_actor_loss(batch))
 
     def update_from_episodes(self, episodes, errors_out=None):
-        # Sort episodes desc by their lengths
-        sorted_episodes = list(reversed(sorted(episodes, key=len)))
-        max_epi_len = len(sorted_episodes[0])
-
-        # Precompute all the input batches
-        batches = []
-        for i in range(max_epi_len):
-            transitions = []
-            for ep in sorted_episodes:
-                if len(ep) <= i:
-                    break
-                transitions.append(ep[i])
-            batch = batch_experiences(
-                transitions, xp=self.xp, phi=self.phi)
-            batches.append(batch)
+        # Precompute all the input batches, sorted desc by episode lengths
+        _, lengths, batches = batch_episodes(
+            episodes, xp=self.xp, phi=self.phi)
+        max_epi_len = int(lengths[0])
 
         with self.model.state_reset():
             with self.target_model.state_reset():
@@ -345,6 +344,108 @@ class DDPG(AttributeSavingMixin, Agent):
                           self.t, action.data[0], q.data)
         return cuda.to_cpu(action.data[0])
 
+    def _batch_select_greedy_actions(self, batch_obs, test):
+        if test:
+            recurrent_states = self.test_recurrent_states
+        else:
+            recurrent_states = self.train_recurrent_states
+        with chainer.using_config('train', False), \
+                chainer.no_backprop_mode(), \
+                state_set(self.model, recurrent_states):
+            batch_s = self.batch_states(batch_obs, self.xp, self.phi)
+            batch_action = self.policy(batch_s).sample()
+            # Q is not needed here, but log it just for information
+            q = self.q_function(batch_s, batch_action)
+            if isinstance(self.model, Recurrent):
+                recurrent_states = self.model.get_state()
+        if test:
+            self.test_recurrent_states = recurrent_states
+        else:
+            self.train_recurrent_states = recurrent_states
+
+        # Update stats
+        self.average_q *= self.average_q_decay
+        self.average_q += (1 - self.average_q_decay) * float(q.data.mean())
+
+        self.logger.debug('t:%s a:%s q:%s',
+                          self.t, batch_action.data, q.data)
+        return list(cuda.to_cpu(batch_action.data))
+
+    def batch_act(self, batch_obs):
+        return self._batch_select_greedy_actions(batch_obs, test=True)
+
+    def batch_act_and_train(self, batch_obs):
+        n_envs = len(batch_obs)
+        if len(self.batch_last_obs) != n_envs:
+            self.batch_last_obs = [None] * n_envs
+            self.batch_last_action = [None] * n_envs
+            self.batch_last_reward = [None] * n_envs
+
+        batch_greedy_action = self._batch_select_greedy_actions(
+            batch_obs, test=False)
+        batch_action = [
+            self.explorer.select_action(
+                self.t, lambda: batch_greedy_action[i])
+            for i in range(n_envs)]
+
+        for i in range(n_envs):
+            if self.batch_last_obs[i] is not None:
+                # Add a transition to the replay buffer
+                self.replay_buffer.append(
+                    state=self.batch_last_obs[i],
+                    action=self.batch_last_action[i],
+                    reward=self.batch_last_reward[i],
+                    next_state=batch_obs[i],
+                    next_action=batch_action[i],
+                    is_state_terminal=False,
+                    env_id=i)
+        self.batch_last_obs = list(batch_obs)
+        self.batch_last_action = list(batch_action)
+
+        return batch_action
+
+    def batch_observe(self, batch_obs, batch_reward, batch_done, batch_reset):
+        indices_that_ended = [
+            i for i in range(len(batch_obs))
+            if batch_done[i] or batch_reset[i]]
+        if indices_that_ended:
+            self.test_recurrent_states = mask_recurrent_state_at(
+                self.test_recurrent_states, indices_that_ended)
+
+    def batch_observe_and_train(self, batch_obs, batch_reward, batch_done,
+                                batch_reset):
+        indices_that_ended = []
+        for i in range(len(batch_obs)):
+            self.t += 1
+
+            # Update the target network
+            if self.t % self.target_update_interval == 0:
+                self.sync_target_network()
+
+            assert self.batch_last_obs[i] is not None
+            if batch_done[i] or batch_reset[i]:
+                # Add the last transition of the episode
+                self.replay_buffer.append(
+                    state=self.batch_last_obs[i],
+                    action=self.batch_last_action[i],
+                    reward=batch_reward[i],
+                    next_state=batch_obs[i],
+                    next_action=self.batch_last_action[i],
+                    is_state_terminal=batch_done[i],
+                    env_id=i)
+                self.replay_buffer.stop_current_episode(env_id=i)
+                self.batch_last_obs[i] = None
+                self.batch_last_action[i] = None
+                indices_that_ended.append(i)
+            else:
+                self.batch_last_reward[i] = batch_reward[i]
+
+            self.replay_updater.update_if_necessary(self.t)
+
+        if indices_that_ended:
+            self.train_recurrent_states = mask_recurrent_state_at(
+                self.train_recurrent_states, indices_that_ended)
+
     def stop_episode_and_train(self, state, reward, done=False):
 
         assert self.last_state is not None
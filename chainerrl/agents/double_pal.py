@@ -43,9 +43,10 @@ class DoublePAL(pal.PAL):
 
             batch_rewards = exp_batch['reward']
             batch_terminal = exp_batch['is_state_terminal']
+            batch_discount = exp_batch.get('discount', self.gamma)
 
             # T Q: Bellman operator
-            t_q = batch_rewards + self.gamma * \
+            t_q = batch_rewards + batch_discount * \
                 (1.0 - batch_terminal) * next_q_max
 
             # T_PAL Q: persistent advantage learning operator
@@ -35,9 +35,10 @@ class AbstractDPP(with_metaclass(ABCMeta, DQN)):
 
         batch_rewards = exp_batch['reward']
         batch_terminal = exp_batch['is_state_terminal']
+        batch_discount = exp_batch.get('discount', self.gamma)
 
         return (batch_rewards +
-                self.gamma * (1 - batch_terminal) * next_q_expect)
+                batch_discount * (1 - batch_terminal) * next_q_expect)
 
     def _compute_y_and_t(self, exp_batch, gamma):
 
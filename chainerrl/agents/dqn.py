@@ -12,12 +12,16 @@ from logging import getLogger
 import chainer
 from chainer import cuda
 import chainer.functions as F
+import numpy as np
 
 from chainerrl import agent
 from chainerrl.misc.batch_states import batch_states
 from chainerrl.misc.copy_param import synchronize_parameters
+from chainerrl.recurrent import mask_recurrent_state_at
 from chainerrl.recurrent import Recurrent
 from chainerrl.recurrent import state_reset
+from chainerrl.recurrent import state_set
+from chainerrl.replay_buffer import batch_episodes
 from chainerrl.replay_buffer import batch_experiences
 from chainerrl.replay_buffer import ReplayUpdater
 
@@ -88,7 +92,8 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
         q_function (StateQFunction): Q-function
         optimizer (Optimizer): Optimizer that is already setup
         replay_buffer (ReplayBuffer): Replay buffer
-        gamma (float): Discount factor
+        gamma (float): Discount factor. Sampled transitions that have
+            `discount`, e.g. n-step transitions, are discounted by it instead.
         explorer (Explorer): Explorer that specifies an exploration strategy.
         gpu (int): GPU device id if not None nor negative.
         replay_start_size (int): if the replay buffer's size is less than
@@ -112,6 +117,9 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
         logger (Logger): Logger used
         batch_states (callable): method which makes a batch of observations.
             default is `chainerrl.misc.batch_states.batch_states`
+        n_prefetch (int): Number of minibatches sampled and batched in
+            advance by a background thread. See ReplayUpdater for its
+            limitations.
     """
 
     saved_attributes = ('model', 'target_model', 'optimizer')
@@ -128,7 +136,8 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
                  batch_accumulator='mean', episodic_update=False,
                  episodic_update_len=None,
                  logger=getLogger(__name__),
-                 batch_states=batch_states):
+                 batch_states=batch_states,
+                 n_prefetch=0):
         self.model = q_function
         self.q_function = q_function  # For backward compatibility
 
@@ -151,8 +160,12 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
         assert batch_accumulator in ('mean', 'sum')
         self.logger = logger
         self.batch_states = batch_states
+        batch_func = None
         if episodic_update:
             update_func = self.update_from_episodes
+        elif n_prefetch > 0:
+            update_func = self._update_from_batch
+            batch_func = self._batch_experiences
         else:
             update_func = self.update
         self.replay_updater = ReplayUpdater(
@@ -164,11 +177,20 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
             n_times_update=n_times_update,
             replay_start_size=replay_start_size,
             update_interval=update_interval,
+            batch_func=batch_func,
+            n_prefetch=n_prefetch,
         )
 
         self.t = 0
         self.last_state = None
         self.last_action = None
+        # Per-env states of the batch_* methods. A transition of an env
+        # whose episode continues is appended when its next action is chosen.
+        self.batch_last_obs = []
+        self.batch_last_action = []
+        self.batch_last_reward = []
+        self.train_recurrent_states = None
+        self.test_recurrent_states = None
         self.target_model = None
         self.sync_target_network()
         # For backward compatibility
@@ -201,26 +223,43 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
 
         This function is thread-safe.
         Args:
-          experiences (list): list of dict that contains
+          experiences (list or dict): list of dict that contains
             state: cupy.ndarray or numpy.ndarray
             action: int [0, n_action_types)
             reward: float32
             next_state: cupy.ndarray or numpy.ndarray
             next_legal_actions: list of booleans; True means legal
+            or dict of batched arrays of the same keys
           gamma (float): discount factor
         Returns:
           None
         """
 
-        has_weight = 'weight' in experiences[0]
+        self._update_from_batch(
+            self._batch_experiences(experiences), errors_out=errors_out)
+
+    def _batch_experiences(self, experiences):
+        if self.gpu is not None and self.gpu >= 0:
+            # The current device is thread-local and this method can be called
+            # from a prefetching thread of ReplayUpdater
+            cuda.get_device_from_id(self.gpu).use()
         exp_batch = batch_experiences(experiences, xp=self.xp, phi=self.phi,
                                       batch_states=self.batch_states)
-        if has_weight:
+        if isinstance(experiences, dict):
+            # A batch of arrays sampled from ArrayReplayBuffer
+            if 'weight' in experiences:
+                exp_batch['weights'] = self.xp.asarray(
+                    experiences['weight'], dtype=self.xp.float32)
+        elif 'weight' in experiences[0]:
             exp_batch['weights'] = self.xp.asarray(
                 [elem['weight'] for elem in experiences],
                 dtype=self.xp.float32)
-            if errors_out is None:
-                errors_out = []
+        return exp_batch
+
+    def _update_from_batch(self, exp_batch, errors_out=None):
+        has_weight = 'weights' in exp_batch
+        if has_weight and errors_out is None:
+            errors_out = []
         loss = self._compute_loss(
             exp_batch, self.gamma, errors_out=errors_out)
         if has_weight:
@@ -243,44 +282,32 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
             episodes, weights = episodes
             if errors_out is None:
                 errors_out = []
+        indices, lengths, batches = batch_episodes(
+            episodes, xp=self.xp, phi=self.phi,
+            batch_states=self.batch_states)
+        max_epi_len = int(lengths[0])
         if errors_out is None:
             errors_out_step = None
         else:
             del errors_out[:]
-            for _ in episodes:
-                errors_out.append(0.0)
+            errors_sum = np.zeros(len(lengths), dtype=np.float32)
             errors_out_step = []
         with state_reset(self.model):
             with state_reset(self.target_model):
                 loss = 0
-                tmp = list(reversed(sorted(
-                    enumerate(episodes), key=lambda x: len(x[1]))))
-                sorted_episodes = [elem[1] for elem in tmp]
-                indices = [elem[0] for elem in tmp]  # argsort
-                max_epi_len = len(sorted_episodes[0])
-                for i in range(max_epi_len):
-                    transitions = []
-                    weights_step = []
-                    for ep, index in zip(sorted_episodes, indices):
-                        if len(ep) <= i:
-                            break
-                        transitions.append(ep[i])
-                        if has_weights:
-                            weights_step.append(weights[index])
-                    batch = batch_experiences(transitions,
-                                              xp=self.xp,
-                                              phi=self.phi,
-                                              batch_states=self.batch_states)
+                for i, batch in enumerate(batches):
                     if i == 0:
                         self.input_initial_batch_to_target_model(batch)
+                    batchsize = len(batch['reward'])
                     if has_weights:
                         batch['weights'] = self.xp.asarray(
-                            weights_step, dtype=self.xp.float32)
+                            np.asarray(weights)[indices[:batchsize]],
+                            dtype=self.xp.float32)
                     loss += self._compute_loss(batch, self.gamma,
                                                errors_out=errors_out_step)
                     if errors_out is not None:
-                        for err, index in zip(errors_out_step, indices):
-                            errors_out[index] += err
+                        errors_sum[indices[:len(errors_out_step)]] += \
+                            errors_out_step
                 loss /= max_epi_len
 
                 # Update stats
@@ -291,6 +318,8 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
                 self.model.cleargrads()
                 loss.backward()
                 self.optimizer.update()
+        if errors_out is not None:
+            errors_out.extend(errors_sum)
         if has_weights:
             self.replay_buffer.update_errors(errors_out)
 
@@ -302,8 +331,11 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
 
         batch_rewards = exp_batch['reward']
         batch_terminal = exp_batch['is_state_terminal']
+        # n-step transitions have their own discount
+        batch_discount = exp_batch.get('discount', self.gamma)
 
-        return batch_rewards + self.gamma * (1.0 - batch_terminal) * next_q_max
+        return (batch_rewards +
+                batch_discount * (1.0 - batch_terminal) * next_q_max)
 
     def _compute_y_and_t(self, exp_batch, gamma):
         batch_size = exp_batch['reward'].shape[0]
@@ -339,9 +371,7 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
         if errors_out is not None:
             del errors_out[:]
             delta = F.sum(abs(y - t), axis=1)
-            delta = cuda.to_cpu(delta.data)
-            for e in delta:
-                errors_out.append(e)
+            errors_out.extend(cuda.to_cpu(delta.data))
 
         if 'weights' in exp_batch:
             return compute_weighted_value_loss(
@@ -410,13 +440,14 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
         if self.last_state is not None:
             assert self.last_action is not None
             # Add a transition to the replay buffer
-            self.replay_buffer.append(
-                state=self.last_state,
-                action=self.last_action,
-                reward=reward,
-                next_state=obs,
-                next_action=action,
-                is_state_terminal=False)
+            with self.replay_updater.lock:
+                self.replay_buffer.append(
+                    state=self.last_state,
+                    action=self.last_action,
+                    reward=reward,
+                    next_state=obs,
+                    next_action=action,
+                    is_state_terminal=False)
 
         self.last_state = obs
         self.last_action = action
@@ -427,6 +458,121 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
 
         return self.last_action
 
+    def _evaluate_model_and_update_recurrent_states(self, batch_obs, test):
+        batch_x = self.batch_states(batch_obs, self.xp, self.phi)
+        if not isinstance(self.model, Recurrent):
+            return self.model(batch_x)
+        if test:
+            with state_set(self.model, self.test_recurrent_states):
+                batch_av = self.model(batch_x)
+                self.test_recurrent_states = self.model.get_state()
+        else:
+            with state_set(self.model, self.train_recurrent_states):
+                batch_av = self.model(batch_x)
+                self.train_recurrent_states = self.model.get_state()
+        return batch_av
+
+    def batch_act(self, batch_obs):
+        with chainer.using_config('train', False):
+            with chainer.no_backprop_mode():
+                batch_av = self._evaluate_model_and_update_recurrent_states(
+                    batch_obs, test=True)
+                batch_maxq = cuda.to_cpu(batch_av.max.data)
+                batch_argmax = cuda.to_cpu(batch_av.greedy_actions.data)
+
+        # Update stats
+        self.average_q *= self.average_q_decay
+        self.average_q += (1 - self.average_q_decay) * float(
+            batch_maxq.mean())
+
+        return list(batch_argmax)
+
+    def batch_act_and_train(self, batch_obs):
+        n_envs = len(batch_obs)
+        if len(self.batch_last_obs) != n_envs:
+            self.batch_last_obs = [None] * n_envs
+            self.batch_last_action = [None] * n_envs
+            self.batch_last_reward = [None] * n_envs
+
+        with chainer.using_config('train', False):
+            with chainer.no_backprop_mode():
+                batch_av = self._evaluate_model_and_update_recurrent_states(
+                    batch_obs, test=False)
+                batch_maxq = cuda.to_cpu(batch_av.max.data)
+                batch_argmax = cuda.to_cpu(batch_av.greedy_actions.data)
+
+                batch_action = [
+                    self.explorer.select_action(
+                        self.t, lambda: batch_argmax[i],
+                        action_value=batch_av[i:i + 1])
+                    for i in range(n_envs)]
+
+        # Update stats
+        self.average_q *= self.average_q_decay
+        self.average_q += (1 - self.average_q_decay) * float(
+            batch_maxq.mean())
+
+        for i in range(n_envs):
+            if self.batch_last_obs[i] is not None:
+                # Add a transition to the replay buffer
+                with self.replay_updater.lock:
+                    self.replay_buffer.append(
+                        state=self.batch_last_obs[i],
+                        action=self.batch_last_action[i],
+                        reward=self.batch_last_reward[i],
+                        next_state=batch_obs[i],
+                        next_action=batch_action[i],
+                        is_state_terminal=False,
+                        env_id=i)
+        self.batch_last_obs = list(batch_obs)
+        self.batch_last_action = list(batch_action)
+
+        return batch_action
+
+    def batch_observe(self, batch_obs, batch_reward, batch_done, batch_reset):
+        if isinstance(self.model, Recurrent):
+            indices_that_ended = [
+                i for i in range(len(batch_obs))
+                if batch_done[i] or batch_reset[i]]
+            if indices_that_ended:
+                self.test_recurrent_states = mask_recurrent_state_at(
+                    self.test_recurrent_states, indices_that_ended)
+
+    def batch_observe_and_train(self, batch_obs, batch_reward, batch_done,
+                                batch_reset):
+        indices_that_ended = []
+        for i in range(len(batch_obs)):
+            self.t += 1
+
+            # Update the target network
+            if self.t % self.target_update_interval == 0:
+                self.sync_target_network()
+
+            assert self.batch_last_obs[i] is not None
+            if batch_done[i] or batch_reset[i]:
+                # Add the last transition of the episode
+                with self.replay_updater.lock:
+                    self.replay_buffer.append(
+                        state=self.batch_last_obs[i],
+                        action=self.batch_last_action[i],
+                        reward=batch_reward[i],
+                        next_state=batch_obs[i],
+                        next_action=self.batch_last_action[i],
+                        is_state_terminal=batch_done[i],
+                        env_id=i)
+                    self.replay_buffer.stop_current_episode(env_id=i)
+                self.batch_last_obs[i] = None
+                self.batch_last_action[i] = None
+                indices_that_ended.append(i)
+            else:
+                self.batch_last_reward[i] = batch_reward[i]
+
+            self.replay_updater.update_if_necessary(self.t)
+
+        if isinstance(self.model, Recurrent) and indices_that_ended:
+            self.train_recurrent_states = mask_recurrent_state_at(
+                self.train_recurrent_states, indices_that_ended)
+
     def stop_episode_and_train(self, state, reward, done=False):
         """Observe a terminal state and a reward.
 
@@ -437,13 +583,14 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
         assert self.last_action is not None
 
         # Add a transition to the replay buffer
-        self.replay_buffer.append(
-            state=self.last_state,
-            action=self.last_action,
-            reward=reward,
-            next_state=state,
-            next_action=self.last_action,
-            is_state_terminal=done)
+        with self.replay_updater.lock:
+            self.replay_buffer.append(
+                state=self.last_state,
+                action=self.last_action,
+                reward=reward,
+                next_state=state,
+                next_action=self.last_action,
+                is_state_terminal=done)
 
         self.stop_episode()
 
@@ -452,7 +599,8 @@ class DQN(agent.AttributeSavingMixin, agent.Agent):
         self.last_action = None
         if isinstance(self.model, Recurrent):
             self.model.reset_state()
-        self.replay_buffer.stop_current_episode()
+        with self.replay_updater.lock:
+            self.replay_buffer.stop_current_episode()
 
     def get_statistics(self):
         return [
@@ -44,6 +44,8 @@ class NSQ(AttributeSavingMixin, AsyncAgent):
     """
 
     process_idx = None
+    # InferenceClient used by act and act_and_train if not None
+    inference_client = None
     saved_attributes = ['q_function', 'target_q_function', 'optimizer']
 
     def __init__(self, q_function, optimizer,
@@ -56,6 +58,9 @@ class NSQ(AttributeSavingMixin, AsyncAgent):
         self.q_function = copy.deepcopy(self.shared_q_function)
 
         async.assert_params_not_shared(self.shared_q_function, self.q_function)
+        # Lay out params like shared ones so that they are synced at once
+        async.make_params_contiguous(self.q_function)
+        async.make_params_contiguous(self.target_q_function)
 
         self.optimizer = optimizer
 
@@ -73,6 +78,7 @@ class NSQ(AttributeSavingMixin, AsyncAgent):
         self.t_start = 0
         self.past_action_values = {}
         self.past_states = {}
+        self.past_actions = {}
         self.past_rewards = {}
         self.average_q = 0
 
@@ -85,9 +91,26 @@ class NSQ(AttributeSavingMixin, AsyncAgent):
         return ('shared_q_function', 'target_q_function', 'optimizer',
                 't_global')
 
+    def compute_past_action_values(self):
+        """Compute Q-values of actions chosen by the inference server.
+
+        Since outputs of the inference server are not differentiable, the
+        forward pass to backprop through is computed at once for all the
+        states since the last update.
+        """
+        steps = range(self.t_start, self.t)
+        states = np.concatenate([self.past_states[i] for i in steps])
+        actions = np.asarray([self.past_actions[i] for i in steps])
+        qs = self.q_function(states).evaluate_actions(actions)
+        for k, i in enumerate(steps):
+            self.past_action_values[i] = qs[k:k + 1]
+
     def update(self, statevar):
         assert self.t_start < self.t
 
+        if self.inference_client is not None:
+            self.compute_past_action_values()
+
         # Update
         if statevar is None:
             R = 0
@@ -127,6 +150,7 @@ class NSQ(AttributeSavingMixin, AsyncAgent):
 
         self.past_action_values = {}
         self.past_states = {}
+        self.past_actions = {}
         self.past_rewards = {}
 
         self.t_start = self.t
@@ -144,12 +168,22 @@ class NSQ(AttributeSavingMixin, AsyncAgent):
         if isinstance(self.target_q_function, Recurrent):
             # Evaluate it to update states
             self.target_q_function(statevar)
-        qout = self.q_function(statevar)
-        action = self.explorer.select_action(
-            self.t_global.value, lambda: qout.greedy_actions.data[0],
-            action_value=qout)
-        q = qout.evaluate_actions(np.asarray([action]))
-        self.past_action_values[self.t] = q
+        if self.inference_client is not None:
+            # Batched with requests of the other processes. The Q-values to
+            # backprop through are computed by update.
+            greedy_action, _, _, qout = self.inference_client.compute(obs)
+            action = self.explorer.select_action(
+                self.t_global.value, lambda: greedy_action,
+                action_value=qout)
+            q = qout.evaluate_actions(np.asarray([action]))
+        else:
+            qout = self.q_function(statevar)
+            action = self.explorer.select_action(
+                self.t_global.value, lambda: qout.greedy_actions.data[0],
+                action_value=qout)
+            q = qout.evaluate_actions(np.asarray([action]))
+            self.past_action_values[self.t] = q
+        self.past_actions[self.t] = action
         self.t += 1
         self.average_q += ((1 - self.average_q_decay) *
                            (float(q.data[0]) - self.average_q))
@@ -165,6 +199,9 @@ class NSQ(AttributeSavingMixin, AsyncAgent):
         return action
 
     def act(self, obs):
+        if self.inference_client is not None:
+            # Batched with requests of the other processes
+            return self.inference_client.act(obs, deterministic=True)
         statevar = self.batch_states([obs], np, self.phi)
         qout = self.q_function(statevar)
         self.logger.debug('act action_value: %s', qout)
@@ -21,7 +21,7 @@ from chainerrl.misc import copy_param
 from chainerrl.recurrent import Recurrent
 from chainerrl.recurrent import state_kept
 from chainerrl.recurrent import state_reset
-from chainerrl.replay_buffer import batch_experiences
+from chainerrl.replay_buffer import batch_episodes
 
 
 def asfloat(x):
@@ -90,6 +90,8 @@ class PCL(agent.AttributeSavingMixin, agent.AsyncAgent):
     """
 
     process_idx = None
+    # InferenceClient used by act and act_and_train if not None
+    inference_client = None
     saved_attributes = ['model', 'optimizer']
     shared_attributes = ['shared_model', 'optimizer']
 
@@ -124,6 +126,8 @@ class PCL(agent.AttributeSavingMixin, agent.AsyncAgent):
             # Thread specific model
             self.model = copy.deepcopy(self.shared_model)
             async.assert_params_not_shared(self.shared_model, self.model)
+            # Lay out params like shared ones so that they are synced at once
+            async.make_params_contiguous(self.model)
         else:
             self.model = model
         self.xp = self.model.xp
@@ -172,6 +176,7 @@ class PCL(agent.AttributeSavingMixin, agent.AsyncAgent):
         self.init_history_data_for_online_update()
 
     def init_history_data_for_online_update(self):
+        self.past_states = {}
         self.past_actions = {}
         self.past_rewards = {}
         self.past_values = {}
@@ -286,9 +291,15 @@ class PCL(agent.AttributeSavingMixin, agent.AsyncAgent):
             # Prioritized replay
             episodes, weights = episodes
         else:
-            weights = [1] * len(episodes)
-        sorted_episodes = list(reversed(sorted(episodes, key=len)))
-        max_epi_len = len(sorted_episodes[0])
+            weights = None
+        indices, lengths, batches = batch_episodes(
+            episodes, xp=self.xp, phi=self.phi,
+            batch_states=self.batch_states)
+        if weights is None:
+            weights = [1] * len(indices)
+        else:
+            # Losses are computed in the sorted order
+            weights = [weights[i] for i in indices]
 
         with state_reset(self.model):
             # Batch computation of multiple episodes
@@ -298,16 +309,7 @@ class PCL(agent.AttributeSavingMixin, agent.AsyncAgent):
             log_probs = {}
             next_action_distrib = None
             next_v = None
-            for t in range(max_epi_len):
-                transitions = []
-                for ep in sorted_episodes:
-                    if len(ep) <= t:
-                        break
-                    transitions.append(ep[t])
-                batch = batch_experiences(transitions,
-                                          xp=self.xp,
-                                          phi=self.phi,
-                                          batch_states=self.batch_states)
+            for t, batch in enumerate(batches):
                 batchsize = batch['action'].shape[0]
                 if next_action_distrib is not None:
                     action_distrib = next_action_distrib[0:batchsize]
@@ -322,12 +324,12 @@ class PCL(agent.AttributeSavingMixin, agent.AsyncAgent):
                 log_probs[t] = action_distrib.log_prob(batch['action'])
             # Loss is computed one by one episode
             losses = []
-            for i, ep in enumerate(sorted_episodes):
+            for i, epi_len in enumerate(lengths):
                 e_values = {}
                 e_next_values = {}
                 e_rewards = {}
                 e_log_probs = {}
-                for t in range(len(ep)):
+                for t in range(epi_len):
                     assert values[t].shape[0] > i
                     assert next_values[t].shape[0] > i
                     assert rewards[t].shape[0] > i
@@ -338,7 +340,7 @@ class PCL(agent.AttributeSavingMixin, agent.AsyncAgent):
                     e_log_probs[t] = log_probs[t][i:i + 1]
                 losses.append(self.compute_loss(
                     t_start=0,
-                    t_stop=len(ep),
+                    t_stop=int(epi_len),
                     rewards=e_rewards,
                     values=e_values,
                     next_values=e_next_values,
@@ -347,10 +349,26 @@ class PCL(agent.AttributeSavingMixin, agent.AsyncAgent):
                 losses, weights) / self.batchsize
             self.update(loss)
 
+    def compute_past_outputs(self):
+        """Compute outputs of the model for actions chosen by the server.
+
+        Since outputs of the inference server are not differentiable, the
+        forward pass to backprop through is computed at once for all the
+        states since the last update.
+        """
+        steps = range(self.t_start, self.t)
+        states = self.xp.concatenate([self.past_states[t] for t in steps])
+        action_distrib, v = self.model(states)
+        for k, t in enumerate(steps):
+            self.past_action_distrib[t] = action_distrib[k:k + 1]
+            self.past_values[t] = v[k:k + 1]
+
     def update_on_policy(self, statevar):
         assert self.t_start < self.t
 
         if not self.disable_online_update:
+            if self.inference_client is not None:
+                self.compute_past_outputs()
             next_values = {}
             for t in range(self.t_start + 1, self.t):
                 next_values[t - 1] = self.past_values[t]
@@ -391,26 +409,33 @@ class PCL(agent.AttributeSavingMixin, agent.AsyncAgent):
                 for _ in range(self.n_times_replay):
                     self.update_from_replay()
 
-        action_distrib, v = self.model(statevar)
-        action = chainer.cuda.to_cpu(action_distrib.sample().data)[0]
+        if self.inference_client is not None:
+            # Batched with requests of the other processes. The outputs to
+            # backprop through are computed by update_on_policy.
+            action, _, v, action_distrib = self.inference_client.compute(obs)
+        else:
+            action_distrib, v = self.model(statevar)
+            action = chainer.cuda.to_cpu(action_distrib.sample().data)[0]
+            # Save values for a later update
+            self.past_values[self.t] = v
+            self.past_action_distrib[self.t] = action_distrib
+            v = float(v.data)
         if self.explorer is not None:
             action = self.explorer.select_action(self.t, lambda: action)
 
-        # Save values for a later update
-        self.past_values[self.t] = v
+        self.past_states[self.t] = statevar
         self.past_actions[self.t] = action
-        self.past_action_distrib[self.t] = action_distrib
 
         self.t += 1
 
         if self.process_idx == 0:
             self.logger.debug(
                 't:%s r:%s a:%s action_distrib:%s v:%s',
-                self.t, reward, action, action_distrib, float(v.data))
+                self.t, reward, action, action_distrib, float(v))
         # Update stats
         self.average_value += (
             (1 - self.average_value_decay) *
-            (float(v.data[0]) - self.average_value))
+            (float(v) - self.average_value))
         self.average_entropy += (
             (1 - self.average_entropy_decay) *
             (float(action_distrib.entropy.data[0]) - self.average_entropy))
@@ -436,6 +461,10 @@ class PCL(agent.AttributeSavingMixin, agent.AsyncAgent):
         return action
 
     def act(self, obs):
+        if self.inference_client is not None:
+            # Batched with requests of the other processes
+            return self.inference_client.act(
+                obs, deterministic=self.act_deterministically)
         # Use the process-local model for acting
         with chainer.no_backprop_mode():
             statevar = self.batch_states([obs], self.xp, self.phi)
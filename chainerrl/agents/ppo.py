@@ -6,13 +6,13 @@ from builtins import *  # NOQA
 from future import standard_library
 standard_library.install_aliases()
 
-import copy
-
 import chainer
 from chainer import cuda
 import chainer.functions as F
+import numpy as np
 
 from chainerrl import agent
+from chainerrl.misc.advantage import compute_gae
 from chainerrl.misc.batch_states import batch_states
 
 
@@ -24,6 +24,101 @@ def _elementwise_clip(x, x_min, x_max):
     return F.minimum(F.maximum(x, x_min), x_max)
 
 
+def _yield_minibatch_indices(dataset_size, minibatch_size, epochs):
+    """Yield indices of shuffled minibatches for multiple epochs.
+
+    Indices of all the epochs are concatenated before being split, so every
+    minibatch is full except possibly the last one, like
+    `chainer.iterators.SerialIterator` with `shuffle=True`.
+
+    Args:
+        dataset_size (int): Number of samples in a dataset.
+        minibatch_size (int): Number of samples in each minibatch.
+        epochs (int): Number of passes over the dataset.
+    Yields:
+        ndarray: Indices of samples in a minibatch.
+    """
+    indices = np.concatenate(
+        [np.random.permutation(dataset_size) for _ in range(epochs)])
+    for start in range(0, len(indices), minibatch_size):
+        yield indices[start:start + minibatch_size]
+
+
+class _RolloutBuffer(object):
+    """Transitions of parallel environments stored in preallocated arrays.
+
+    Arrays are of shape (n_steps, n_envs, ...), where row t holds the
+    transitions from the observations given at the t-th step. Each row is
+    written in two stages: states, actions, log probabilities and values when
+    actions are chosen, and rewards, values of next states and whether
+    episodes end when they are observed. Only the last row can be incomplete.
+
+    Args:
+        n_envs (int): Number of environments.
+        n_steps (int): Maximum number of rows.
+    """
+
+    def __init__(self, n_envs, n_steps):
+        self.n_envs = n_envs
+        self.n_steps = n_steps
+        self.columns = None
+        self.n_rows = 0
+        # Whether the transition of each env in the last row still waits for
+        # the value of its next state
+        self.pending = np.zeros(n_envs, dtype=bool)
+
+    @property
+    def n_complete_rows(self):
+        return self.n_rows - int(self.pending.any())
+
+    def _allocate(self, states, actions):
+        shape = (self.n_steps, self.n_envs)
+        self.columns = {
+            'state': np.zeros(shape + states.shape[1:], dtype=states.dtype),
+            'action': np.zeros(shape + actions.shape[1:],
+                               dtype=actions.dtype),
+            'log_prob': np.zeros(shape, dtype=np.float32),
+            'v_pred': np.zeros(shape, dtype=np.float32),
+            'reward': np.zeros(shape, dtype=np.float32),
+            'next_v_pred': np.zeros(shape, dtype=np.float32),
+            'nonterminal': np.zeros(shape, dtype=np.float32),
+            'episode_end': np.zeros(shape, dtype=bool),
+        }
+
+    def add_actions(self, states, actions, log_probs, vs):
+        """Start a new row with the actions chosen in all the envs."""
+        assert not self.pending.any()
+        assert self.n_rows < self.n_steps
+        if self.columns is None:
+            self._allocate(states, actions)
+        t = self.n_rows
+        self.columns['state'][t] = states
+        self.columns['action'][t] = actions
+        self.columns['log_prob'][t] = log_probs
+        self.columns['v_pred'][t] = vs.reshape(self.n_envs)
+        self.n_rows += 1
+        self.pending[:] = True
+
+    def set_rewards(self, indices, rewards):
+        self.columns['reward'][self.n_rows - 1, indices] = rewards
+
+    def set_next_values(self, indices, next_vs, nonterminals, episode_ends):
+        """Complete the transitions of given envs in the last row."""
+        t = self.n_rows - 1
+        self.columns['next_v_pred'][t, indices] = next_vs
+        self.columns['nonterminal'][t, indices] = nonterminals
+        self.columns['episode_end'][t, indices] = episode_ends
+        self.pending[indices] = False
+
+    def discard_complete_rows(self):
+        """Discard complete rows, keeping the incomplete one if any."""
+        n = self.n_complete_rows
+        if n < self.n_rows:
+            for column in self.columns.values():
+                column[0] = column[self.n_rows - 1]
+        self.n_rows -= n
+
+
 class PPO(agent.AttributeSavingMixin, agent.Agent):
     """Proximal Policy Optimization
 
@@ -102,49 +197,82 @@ class PPO(agent.AttributeSavingMixin, agent.Agent):
         self.batch_states = batch_states
 
         self.xp = self.model.xp
-        self.last_state = None
 
-        self.memory = []
-        self.last_episode = []
+        # Transitions used for next update iteration, which is recreated when
+        # the number of envs changes
+        self.rollout = None
 
-    def _act(self, state):
-        xp = self.xp
+    def _get_rollout(self, n_envs):
+        if self.rollout is None or self.rollout.n_envs != n_envs:
+            # One more row for the transitions whose next values are unknown
+            n_steps = -(-self.update_interval // n_envs) + 1
+            self.rollout = _RolloutBuffer(n_envs, n_steps)
+        return self.rollout
+
+    def _batch_act(self, batch_obs):
+        """Choose actions for a batch of observations.
+
+        Returns:
+            States on the host, actions, values and log probabilities of the
+            actions as numpy.ndarray.
+        """
+        b_state = self.batch_states(batch_obs, np, self.phi)
         with chainer.using_config('train', False):
-            b_state = self.batch_states([state], xp, self.phi)
             with chainer.no_backprop_mode():
-                action_distrib, v = self.model(b_state)
-                action = action_distrib.sample()
-            return cuda.to_cpu(action.data)[0], cuda.to_cpu(v.data)[0]
+                action_distrib, batch_v = self.model(self.xp.asarray(b_state))
+                batch_action = action_distrib.sample()
+                batch_log_prob = action_distrib.log_prob(batch_action)
+            return (b_state, cuda.to_cpu(batch_action.data),
+                    cuda.to_cpu(batch_v.data),
+                    cuda.to_cpu(batch_log_prob.data))
 
     def _train(self):
-        if len(self.memory) + len(self.last_episode) >= self.update_interval:
-            self._flush_last_episode()
-            self.update()
-            self.memory = []
-
-    def _flush_last_episode(self):
-        if self.last_episode:
-            self._compute_teacher()
-            self.memory.extend(self.last_episode)
-            self.last_episode = []
-
-    def _compute_teacher(self):
-        """Estimate state values and advantages of self.last_episode
-
-        TD(lambda) estimation
+        rollout = self.rollout
+        if rollout.n_complete_rows * rollout.n_envs >= self.update_interval:
+            self.update(self._make_dataset())
+            rollout.discard_complete_rows()
+
+    def _make_dataset(self):
+        """Make a dataset of arrays from the complete rows of the rollout.
+
+        State values and advantages are estimated by TD(lambda) for all the
+        envs at once. Episodes not finished yet are truncated at the end of
+        the rollout.
+
+        Returns:
+            dict: Arrays of states, actions, log probabilities of the actions
+                under the policy that chose them, predicted values,
+                advantages and target values. The first axis of each array
+                corresponds to transitions. Arrays are views of the rollout
+                when possible, so they are valid until the rollout is
+                modified.
         """
-
-        adv = 0.0
-        for transition in reversed(self.last_episode):
-            td_err = (
-                transition['reward']
-                + (self.gamma * transition['nonterminal']
-                   * transition['next_v_pred'])
-                - transition['v_pred']
-            )
-            adv = td_err + self.gamma * self.lambd * adv
-            transition['adv'] = adv
-            transition['v_teacher'] = adv + transition['v_pred']
+        rollout = self.rollout
+        n_rows = rollout.n_complete_rows
+        c = dict((key, column[:n_rows])
+                 for key, column in rollout.columns.items())
+        advs = compute_gae(
+            rewards=c['reward'],
+            values=c['v_pred'],
+            next_values=c['next_v_pred'],
+            nonterminals=c['nonterminal'],
+            gamma=self.gamma,
+            lambd=self.lambd,
+            episode_ends=c['episode_end'])
+
+        size = n_rows * rollout.n_envs
+        # Values are of shape (T, 1) like outputs of the model
+        vs_pred = c['v_pred'].reshape(size, 1)
+        advs = advs.reshape(size, 1)
+        return {
+            # States are kept on the host and sent to the device by minibatch
+            'state': c['state'].reshape((size,) + c['state'].shape[2:]),
+            'action': c['action'].reshape((size,) + c['action'].shape[2:]),
+            'log_prob': c['log_prob'].reshape(size),
+            'v_pred': vs_pred,
+            'adv': advs,
+            'v_teacher': advs + vs_pred,
+        }
 
     def _lossfun(self,
                  distribs, vs_pred, log_probs,
@@ -188,100 +316,143 @@ class PPO(agent.AttributeSavingMixin, agent.Agent):
             + self.entropy_coef * loss_entropy
         )
 
-    def update(self):
+    def update(self, dataset):
+        """Update the model using a given dataset.
+
+        Args:
+            dataset (dict): Arrays returned by _make_dataset.
+        """
         xp = self.xp
 
+        advs = dataset['adv']
         if self.standardize_advantages:
-            all_advs = xp.array([b['adv'] for b in self.memory])
-            mean_advs = xp.mean(all_advs)
-            std_advs = xp.std(all_advs)
-
-        target_model = copy.deepcopy(self.model)
-        dataset_iter = chainer.iterators.SerialIterator(
-            self.memory, self.minibatch_size)
-
-        dataset_iter.reset()
-        while dataset_iter.epoch < self.epochs:
-            batch = dataset_iter.__next__()
-            states = self.batch_states(
-                [b['state'] for b in batch], xp, self.phi)
-            actions = xp.array([b['action'] for b in batch])
+            advs = (advs - advs.mean()) / advs.std()
+
+        # Arrays other than states are small, so they are sent to the device
+        # only once. States are sent by minibatch.
+        actions = xp.asarray(dataset['action'])
+        log_probs_old = xp.asarray(dataset['log_prob'])
+        vs_pred_old = xp.asarray(dataset['v_pred'])
+        advs = xp.asarray(advs)
+        vs_teacher = xp.asarray(dataset['v_teacher'])
+
+        for indices in _yield_minibatch_indices(
+                len(advs), self.minibatch_size, self.epochs):
+            states = xp.asarray(dataset['state'][indices])
+            indices = xp.asarray(indices)
             distribs, vs_pred = self.model(states)
-            with chainer.no_backprop_mode():
-                target_distribs, _ = target_model(states)
-
-            advs = xp.array([b['adv'] for b in batch], dtype=xp.float32)
-            if self.standardize_advantages:
-                advs = (advs - mean_advs) / std_advs
 
             self.optimizer.update(
                 self._lossfun,
-                distribs, vs_pred, distribs.log_prob(actions),
-                vs_pred_old=xp.array(
-                    [b['v_pred'] for b in batch], dtype=xp.float32),
-                target_log_probs=target_distribs.log_prob(actions),
-                advs=advs,
-                vs_teacher=xp.array(
-                    [b['v_teacher'] for b in batch], dtype=xp.float32),
+                distribs, vs_pred, distribs.log_prob(actions[indices]),
+                vs_pred_old=vs_pred_old[indices],
+                target_log_probs=log_probs_old[indices],
+                advs=advs[indices],
+                vs_teacher=vs_teacher[indices],
             )
 
     def act_and_train(self, obs, reward):
+        rollout = self._get_rollout(1)
+
         if hasattr(self.model, 'obs_filter'):
             xp = self.xp
             b_state = self.batch_states([obs], xp, self.phi)
             self.model.obs_filter.experience(b_state)
 
-        action, v = self._act(obs)
+        b_state, action, v, log_prob = self._batch_act([obs])
 
         # Update stats
         self.average_v += (
             (1 - self.average_v_decay) *
-            (v[0] - self.average_v))
-
-        if self.last_state is not None:
-            self.last_episode.append({
-                'state': self.last_state,
-                'action': self.last_action,
-                'reward': reward,
-                'v_pred': self.last_v,
-                'next_state': obs,
-                'next_v_pred': v,
-                'nonterminal': 1.0})
-        self.last_state = obs
-        self.last_action = action
-        self.last_v = v
+            (float(v.mean()) - self.average_v))
+
+        if rollout.pending[0]:
+            rollout.set_rewards([0], reward)
+            rollout.set_next_values(
+                [0], v.reshape(1), nonterminals=1.0, episode_ends=False)
+        rollout.add_actions(b_state, action, log_prob, v)
 
         self._train()
-        return action
+        return action[0]
 
     def act(self, obs):
-        action, v = self._act(obs)
+        _, action, v, _ = self._batch_act([obs])
 
         # Update stats
         self.average_v += (
             (1 - self.average_v_decay) *
-            (v[0] - self.average_v))
+            (float(v.mean()) - self.average_v))
+
+        return action[0]
+
+    def batch_act(self, batch_obs):
+        _, batch_action, batch_v, _ = self._batch_act(batch_obs)
+
+        # Update stats
+        self.average_v += (
+            (1 - self.average_v_decay) *
+            (float(batch_v.mean()) - self.average_v))
+
+        return list(batch_action)
+
+    def batch_act_and_train(self, batch_obs):
+        n_envs = len(batch_obs)
+        rollout = self._get_rollout(n_envs)
+
+        if hasattr(self.model, 'obs_filter'):
+            xp = self.xp
+            b_state = self.batch_states(batch_obs, xp, self.phi)
+            self.model.obs_filter.experience(b_state)
+
+        b_state, batch_action, batch_v, batch_log_prob = \
+            self._batch_act(batch_obs)
+
+        # Update stats
+        self.average_v += (
+            (1 - self.average_v_decay) *
+            (float(batch_v.mean()) - self.average_v))
+
+        # Transitions of envs whose episodes continue are completed here
+        pending = np.flatnonzero(rollout.pending)
+        if pending.size > 0:
+            rollout.set_next_values(
+                pending, batch_v.reshape(n_envs)[pending],
+                nonterminals=1.0, episode_ends=False)
+        rollout.add_actions(b_state, batch_action, batch_log_prob, batch_v)
+
+        self._train()
+        return list(batch_action)
+
+    def batch_observe(self, batch_obs, batch_reward, batch_done, batch_reset):
+        pass
 
-        return action
+    def batch_observe_and_train(self, batch_obs, batch_reward, batch_done,
+                                batch_reset):
+        rollout = self.rollout
+        assert rollout.pending.all()
+        rollout.set_rewards(slice(None), batch_reward)
+        batch_done = np.asarray(batch_done, dtype=bool)
+        ended = np.flatnonzero(
+            np.logical_or(batch_done, np.asarray(batch_reset, dtype=bool)))
+        if ended.size == 0:
+            return
+
+        # Values of the last observations of episodes are computed here
+        # since they are not given to batch_act_and_train
+        _, _, batch_v, _ = self._batch_act([batch_obs[i] for i in ended])
+        rollout.set_next_values(
+            ended, batch_v.reshape(len(ended)),
+            nonterminals=np.logical_not(batch_done[ended]),
+            episode_ends=True)
 
     def stop_episode_and_train(self, state, reward, done=False):
-        _, v = self._act(state)
-
-        assert self.last_state is not None
-        self.last_episode.append({
-            'state': self.last_state,
-            'action': self.last_action,
-            'reward': reward,
-            'v_pred': self.last_v,
-            'next_state': state,
-            'next_v_pred': v,
-            'nonterminal': 0.0 if done else 1.0})
-
-        self.last_state = None
-        del self.last_action
-        del self.last_v
-
-        self._flush_last_episode()
+        rollout = self.rollout
+        assert rollout is not None and rollout.pending[0]
+        _, _, v, _ = self._batch_act([state])
+        rollout.set_rewards([0], reward)
+        rollout.set_next_values(
+            [0], v.reshape(1), nonterminals=0.0 if done else 1.0,
+            episode_ends=True)
         self.stop_episode()
 
     def stop_episode(self):
@@ -14,7 +14,9 @@ import numpy as np
 
 import chainerrl
 from chainerrl import agent
+from chainerrl.recurrent import mask_recurrent_state_at
 from chainerrl.recurrent import Recurrent
+from chainerrl.recurrent import state_set
 
 
 class REINFORCE(agent.AttributeSavingMixin, agent.Agent):
@@ -38,6 +40,10 @@ class REINFORCE(agent.AttributeSavingMixin, agent.Agent):
         batch_states (callable): Method which makes a batch of observations.
             default is `chainerrl.misc.batch_states`
         logger (logging.Logger): Logger to be used.
+
+    batch_act_and_train does not support recurrent models since
+    computational graphs of episodes of different environments are
+    connected by their batched recurrent states.
     """
 
     saved_attributes = ['model', 'optimizer']
@@ -73,6 +79,12 @@ class REINFORCE(agent.AttributeSavingMixin, agent.Agent):
         self.entropy_sequences = [[]]
         self.n_backward = 0
 
+        # Per-env sequences of the batch_* methods
+        self.batch_reward_sequences = []
+        self.batch_log_prob_sequences = []
+        self.batch_entropy_sequences = []
+        self.test_recurrent_states = None
+
     def act_and_train(self, obs, reward):
 
         batch_obs = self.batch_states([obs], self.xp, self.phi)
@@ -121,22 +133,100 @@ class REINFORCE(agent.AttributeSavingMixin, agent.Agent):
             self.entropy_sequences[-1] = []
         else:
             self.reward_sequences[-1].append(reward)
-            if self.backward_separately:
-                self.accumulate_grad()
-                if self.n_backward == self.batchsize:
-                    self.update_with_accumulated_grad()
-            else:
-                if len(self.reward_sequences) == self.batchsize:
-                    self.batch_update()
-                else:
-                    # Prepare for the next episode
-                    self.reward_sequences.append([])
-                    self.log_prob_sequences.append([])
-                    self.entropy_sequences.append([])
+            self._finish_episode()
 
         if isinstance(self.model, Recurrent):
             self.model.reset_state()
 
+    def _finish_episode(self):
+        """Update the model or prepare for the next episode."""
+        if self.backward_separately:
+            self.accumulate_grad()
+            if self.n_backward == self.batchsize:
+                self.update_with_accumulated_grad()
+        else:
+            if len(self.reward_sequences) == self.batchsize:
+                self.batch_update()
+            else:
+                # Prepare for the next episode
+                self.reward_sequences.append([])
+                self.log_prob_sequences.append([])
+                self.entropy_sequences.append([])
+
+    def batch_act(self, batch_obs):
+        with chainer.no_backprop_mode():
+            b_state = self.batch_states(batch_obs, self.xp, self.phi)
+            with state_set(self.model, self.test_recurrent_states):
+                action_distrib = self.model(b_state)
+                if isinstance(self.model, Recurrent):
+                    self.test_recurrent_states = self.model.get_state()
+            if self.act_deterministically:
+                batch_action = action_distrib.most_probable
+            else:
+                batch_action = action_distrib.sample()
+            return list(chainer.cuda.to_cpu(batch_action.data))
+
+    def batch_act_and_train(self, batch_obs):
+        assert not isinstance(self.model, Recurrent), \
+            'batch_act_and_train does not support recurrent models'
+        n_envs = len(batch_obs)
+        if len(self.batch_reward_sequences) != n_envs:
+            self.batch_reward_sequences = [[] for _ in range(n_envs)]
+            self.batch_log_prob_sequences = [[] for _ in range(n_envs)]
+            self.batch_entropy_sequences = [[] for _ in range(n_envs)]
+
+        b_state = self.batch_states(batch_obs, self.xp, self.phi)
+        action_distrib = self.model(b_state)
+        batch_action = action_distrib.sample().data  # Do not backprop
+        batch_log_prob = action_distrib.log_prob(batch_action)
+        batch_entropy = action_distrib.entropy
+
+        # Save values used to compute losses
+        for i in range(n_envs):
+            self.batch_log_prob_sequences[i].append(batch_log_prob[i:i + 1])
+            self.batch_entropy_sequences[i].append(batch_entropy[i:i + 1])
+
+        self.t += n_envs
+
+        # Update stats
+        self.average_entropy += (
+            (1 - self.average_entropy_decay) *
+            (float(batch_entropy.data.mean()) - self.average_entropy))
+
+        return list(chainer.cuda.to_cpu(batch_action))
+
+    def batch_observe(self, batch_obs, batch_reward, batch_done, batch_reset):
+        indices_that_ended = [
+            i for i in range(len(batch_obs))
+            if batch_done[i] or batch_reset[i]]
+        if isinstance(self.model, Recurrent) and indices_that_ended:
+            self.test_recurrent_states = mask_recurrent_state_at(
+                self.test_recurrent_states, indices_that_ended)
+
+    def batch_observe_and_train(self, batch_obs, batch_reward, batch_done,
+                                batch_reset):
+        for i in range(len(batch_obs)):
+            if batch_done[i]:
+                # Finish the episode as stop_episode_and_train does, whose
+                # reward sequence has an unused reward at the beginning
+                assert not self.reward_sequences[-1]
+                self.reward_sequences[-1] = (
+                    [0] + self.batch_reward_sequences[i] + [batch_reward[i]])
+                self.log_prob_sequences[-1] = self.batch_log_prob_sequences[i]
+                self.entropy_sequences[-1] = self.batch_entropy_sequences[i]
+                self._finish_episode()
+            elif batch_reset[i]:
+                warnings.warn(
+                    'Since REINFORCE supports episodic environments only, '
+                    'resetting an environment before it reaches a terminal '
+                    'state will throw away its last episode.')
+            else:
+                self.batch_reward_sequences[i].append(batch_reward[i])
+            if batch_done[i] or batch_reset[i]:
+                self.batch_reward_sequences[i] = []
+                self.batch_log_prob_sequences[i] = []
+                self.batch_entropy_sequences[i] = []
+
     def accumulate_grad(self):
         if self.n_backward == 0:
             self.model.zerograds()
@@ -28,5 +28,7 @@ class SARSA(dqn.DQN):
 
         batch_rewards = exp_batch['reward']
         batch_terminal = exp_batch['is_state_terminal']
+        batch_discount = exp_batch.get('discount', self.gamma)
 
-        return batch_rewards + self.gamma * (1.0 - batch_terminal) * next_q
+        return (batch_rewards +
+                batch_discount * (1.0 - batch_terminal) * next_q)
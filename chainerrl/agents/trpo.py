@@ -17,6 +17,7 @@ import numpy as np
 
 import chainerrl
 from chainerrl import agent
+from chainerrl.misc.advantage import compute_gae
 from chainerrl.misc.batch_states import batch_states
 
 
@@ -239,10 +240,16 @@ You're using Chainer v{}. TRPO requires Chainer v3.0.0 or newer.""".format(chain
         # Contains transitions of the last episode not moved to self.memory yet
         self.last_episode = []
 
+        # Per-env states of the batch_* methods
+        self.batch_last_state = []
+        self.batch_last_action = []
+        self.batch_last_episode = []
+
     def _update_if_dataset_is_ready(self):
         dataset_size = (
             sum(len(episode) for episode in self.memory)
-            + len(self.last_episode))
+            + len(self.last_episode)
+            + sum(len(episode) for episode in self.batch_last_episode))
         if dataset_size >= self.update_interval:
             self._flush_last_episode()
             dataset = self._make_dataset()
@@ -250,49 +257,64 @@ You're using Chainer v{}. TRPO requires Chainer v3.0.0 or newer.""".format(chain
             self.memory = []
 
     def _make_dataset(self):
-        dataset = list(itertools.chain.from_iterable(self.memory))
+        """Make a dataset of arrays from the episodes in memory.
+
+        Returns:
+            dict: Arrays of states, actions, advantages and target values.
+                The first axis of each array corresponds to transitions.
+                States are kept on the host without being normalized.
+        """
+        transitions = list(itertools.chain.from_iterable(self.memory))
+        episode_ends = np.zeros(len(transitions), dtype=bool)
+        episode_ends[np.cumsum([len(ep) for ep in self.memory]) - 1] = True
         xp = self.vf.xp
 
         # Compute v_pred and next_v_pred
-        states = batch_states([b['state'] for b in dataset], xp, self.phi)
+        states = batch_states([b['state'] for b in transitions], np, self.phi)
         next_states = batch_states([b['next_state']
-                                    for b in dataset], xp, self.phi)
-        if self.obs_normalizer:
-            states = self.obs_normalizer(states, update=False)
-            next_states = self.obs_normalizer(next_states, update=False)
+                                    for b in transitions], np, self.phi)
         with chainer.using_config('train', False), chainer.no_backprop_mode():
-            vs_pred = chainer.cuda.to_cpu(self.vf(states).data.ravel())
+            vs_pred = chainer.cuda.to_cpu(
+                self.vf(self._normalize_obs(xp.asarray(states))).data.ravel())
             next_vs_pred = chainer.cuda.to_cpu(
-                self.vf(next_states).data.ravel())
-        for transition, v_pred, next_v_pred in zip(dataset,
-                                                   vs_pred,
-                                                   next_vs_pred):
-            transition['v_pred'] = v_pred
-            transition['next_v_pred'] = next_v_pred
+                self.vf(self._normalize_obs(
+                    xp.asarray(next_states))).data.ravel())
 
         # Update stats
         self.value_record.extend(vs_pred)
 
-        # Compute adv and v_teacher
-        for episode in self.memory:
-            adv = 0.0
-            for transition in reversed(episode):
-                td_err = (
-                    transition['reward']
-                    + (self.gamma * transition['nonterminal']
-                       * transition['next_v_pred'])
-                    - transition['v_pred']
-                )
-                adv = td_err + self.gamma * self.lambd * adv
-                transition['adv'] = adv
-                transition['v_teacher'] = adv + transition['v_pred']
-
-        return dataset
+        # Compute adv and v_teacher for all the episodes at once
+        advs = compute_gae(
+            rewards=np.asarray([b['reward'] for b in transitions],
+                               dtype=np.float32),
+            values=vs_pred,
+            next_values=next_vs_pred,
+            nonterminals=np.asarray([b['nonterminal'] for b in transitions],
+                                    dtype=np.float32),
+            gamma=self.gamma,
+            lambd=self.lambd,
+            episode_ends=episode_ends)
+
+        return {
+            'state': states,
+            'action': np.asarray([b['action'] for b in transitions]),
+            'adv': advs,
+            'v_teacher': advs + vs_pred,
+        }
+
+    def _normalize_obs(self, states):
+        if self.obs_normalizer:
+            return self.obs_normalizer(states, update=False)
+        return states
 
     def _flush_last_episode(self):
         if self.last_episode:
             self.memory.append(self.last_episode)
             self.last_episode = []
+        for i, episode in enumerate(self.batch_last_episode):
+            if episode:
+                self.memory.append(episode)
+                self.batch_last_episode[i] = []
 
     def _update(self, dataset):
         """Update both the policy and the value function."""
@@ -304,8 +326,7 @@ You're using Chainer v{}. TRPO requires Chainer v3.0.0 or newer.""".format(chain
 
     def _update_obs_normalizer(self, dataset):
         assert self.obs_normalizer
-        states = batch_states(
-            [b['state'] for b in dataset], self.obs_normalizer.xp, self.phi)
+        states = self.obs_normalizer.xp.asarray(dataset['state'])
         self.obs_normalizer.experience(states)
 
     def _update_vf(self, dataset):
@@ -316,19 +337,18 @@ You're using Chainer v{}. TRPO requires Chainer v3.0.0 or newer.""".format(chain
 
         xp = self.vf.xp
 
-        assert 'state' in dataset[0]
-        assert 'v_teacher' in dataset[0]
+        assert 'state' in dataset
+        assert 'v_teacher' in dataset
 
+        # Minibatches are sampled as indices of the dataset
         dataset_iter = chainer.iterators.SerialIterator(
-            dataset, self.vf_batch_size)
+            np.arange(len(dataset['v_teacher'])), self.vf_batch_size)
 
         while dataset_iter.epoch < self.vf_epochs:
-            batch = dataset_iter.__next__()
-            states = batch_states([b['state'] for b in batch], xp, self.phi)
-            if self.obs_normalizer:
-                states = self.obs_normalizer(states, update=False)
-            vs_teacher = xp.array(
-                [b['v_teacher'] for b in batch], dtype=xp.float32)
+            indices = np.asarray(dataset_iter.__next__())
+            states = self._normalize_obs(
+                xp.asarray(dataset['state'][indices]))
+            vs_teacher = xp.asarray(dataset['v_teacher'][indices])
             vs_pred = self.vf(states)
             vf_loss = F.mean_squared_error(vs_pred, vs_teacher[..., None])
             self.vf_optimizer.update(lambda: vf_loss)
@@ -347,17 +367,15 @@ You're using Chainer v{}. TRPO requires Chainer v3.0.0 or newer.""".format(chain
         The policy is updated via CG and line search.
         """
 
-        assert 'state' in dataset[0]
-        assert 'action' in dataset[0]
-        assert 'adv' in dataset[0]
+        assert 'state' in dataset
+        assert 'action' in dataset
+        assert 'adv' in dataset
 
         # Use full-batch
         xp = self.policy.xp
-        states = batch_states([b['state'] for b in dataset], xp, self.phi)
-        if self.obs_normalizer:
-            states = self.obs_normalizer(states, update=False)
-        actions = xp.array([b['action'] for b in dataset])
-        advs = xp.array([b['adv'] for b in dataset], dtype=np.float32)
+        states = self._normalize_obs(xp.asarray(dataset['state']))
+        actions = xp.asarray(dataset['action'])
+        advs = xp.asarray(dataset['adv'])
         if self.standardize_advantages:
             mean_advs = xp.mean(advs)
             std_advs = xp.std(advs)
@@ -542,6 +560,63 @@ Line search coundn't find a good step size. The policy was not updated.")
                 action = chainer.cuda.to_cpu(action_distrib.sample().data)[0]
         return action
 
+    def _batch_act(self, batch_obs, deterministic):
+        xp = self.xp
+        b_state = batch_states(batch_obs, xp, self.phi)
+        if self.obs_normalizer:
+            b_state = self.obs_normalizer(b_state, update=False)
+        with chainer.using_config('train', False), chainer.no_backprop_mode():
+            action_distrib = self.policy(b_state)
+            if deterministic:
+                batch_action = action_distrib.most_probable
+            else:
+                batch_action = action_distrib.sample()
+        return action_distrib, list(chainer.cuda.to_cpu(batch_action.data))
+
+    def batch_act(self, batch_obs):
+        _, batch_action = self._batch_act(
+            batch_obs, deterministic=self.act_deterministically)
+        return batch_action
+
+    def batch_act_and_train(self, batch_obs):
+        n_envs = len(batch_obs)
+        if len(self.batch_last_state) != n_envs:
+            self.batch_last_state = [None] * n_envs
+            self.batch_last_action = [None] * n_envs
+            self.batch_last_episode = [[] for _ in range(n_envs)]
+
+        # action_distrib will be recomputed when computing gradients
+        action_distrib, batch_action = self._batch_act(
+            batch_obs, deterministic=False)
+        self.entropy_record.extend(
+            chainer.cuda.to_cpu(action_distrib.entropy.data))
+
+        self.batch_last_state = list(batch_obs)
+        self.batch_last_action = batch_action
+        return batch_action
+
+    def batch_observe(self, batch_obs, batch_reward, batch_done, batch_reset):
+        pass
+
+    def batch_observe_and_train(self, batch_obs, batch_reward, batch_done,
+                                batch_reset):
+        for i in range(len(batch_obs)):
+            assert self.batch_last_state[i] is not None
+            self.batch_last_episode[i].append({
+                'state': self.batch_last_state[i],
+                'action': self.batch_last_action[i],
+                'reward': batch_reward[i],
+                'next_state': batch_obs[i],
+                'nonterminal': 0.0 if batch_done[i] else 1.0,
+            })
+            if batch_done[i] or batch_reset[i]:
+                self.memory.append(self.batch_last_episode[i])
+                self.batch_last_episode[i] = []
+                self.batch_last_state[i] = None
+                self.batch_last_action[i] = None
+
+        self._update_if_dataset_is_ready()
+
     def stop_episode_and_train(self, state, reward, done=False):
 
         assert self.last_state is not None
@@ -27,3 +27,67 @@ class Env(with_metaclass(ABCMeta, object)):
     @abstractmethod
     def close(self):
         raise NotImplementedError()
+
+
+class VectorEnv(with_metaclass(ABCMeta, object)):
+    """Parallel RL learning environments.
+
+    A vector env runs multiple environments and steps them all at once.
+    Observations, rewards, done flags and infos are returned as sequences
+    whose i-th elements correspond to the i-th environment.
+    """
+
+    @abstractmethod
+    def step(self, action):
+        """Step all the environments.
+
+        Args:
+            action (Sequence): Actions, one for each environment.
+        Returns:
+            tuple of four sequences: observations, rewards, done flags and
+                infos.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def reset(self, mask=None):
+        """Reset the environments.
+
+        Args:
+            mask (Sequence of bool or None): Environments whose mask is True
+                are not reset, and their last observations are returned
+                instead. If set to None, all the environments are reset.
+        Returns:
+            Sequence of observations, one for each environment.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def seed(self, seeds=None):
+        """Set random seeds to the environments.
+
+        Args:
+            seeds (Sequence of int or None): Random seeds, one for each
+                environment.
+        Returns:
+            list: Values returned by each environment's seed method.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def close(self):
+        raise NotImplementedError()
+
+    @property
+    def num_envs(self):
+        """Number of environments."""
+        raise NotImplementedError()
+
+    @property
+    def unwrapped(self):
+        """Completely unwrap this env.
+
+        Returns:
+            VectorEnv: The base non-wrapped VectorEnv instance
+        """
+        return self
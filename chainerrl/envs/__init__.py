@@ -0,0 +1,2 @@
+from chainerrl.envs.multiprocess_vector_env import MultiprocessVectorEnv  # NOQA
+from chainerrl.envs.serial_vector_env import SerialVectorEnv  # NOQA
@@ -0,0 +1,195 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+from multiprocessing import Pipe
+from multiprocessing import Process
+from multiprocessing import RawArray
+import signal
+
+import numpy as np
+
+from chainerrl import env
+from chainerrl.misc import random_seed
+
+
+def _shared_ndarray(raw_array, dtype, shape):
+    return np.frombuffer(raw_array, dtype=dtype).reshape(shape)
+
+
+def worker(remote, env_fn, auto_reset, shared_obs=None, index=None):
+    # Ignore CTRL+C in the worker process so that the parent can close it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    env = env_fn()
+    initial_obs = None
+    if shared_obs is not None:
+        obs_buf = _shared_ndarray(*shared_obs)[index]
+
+    def transport(ob):
+        if shared_obs is None:
+            return ob
+        # Only step metadata is sent through the pipe
+        obs_buf[...] = ob
+        return None
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                ob, reward, done, info = env.step(data)
+                remote.send((transport(ob), reward, done, info))
+                if auto_reset and done:
+                    # Reset while the parent is busy with the step results.
+                    # The initial observation must not be written to shared
+                    # memory until it is requested, otherwise it would
+                    # overwrite the terminal observation.
+                    initial_obs = env.reset()
+            elif cmd == 'reset':
+                if initial_obs is None:
+                    ob = env.reset()
+                else:
+                    ob = initial_obs
+                    initial_obs = None
+                remote.send(transport(ob))
+            elif cmd == 'seed':
+                if data is not None:
+                    # Random sources of this process are not shared with
+                    # the other environments, so it is safe to seed them
+                    random_seed.set_random_seed(data)
+                if hasattr(env, 'seed'):
+                    remote.send(env.seed(data))
+                else:
+                    remote.send(None)
+            elif cmd == 'get_spaces':
+                remote.send((env.action_space, env.observation_space))
+            elif cmd == 'close':
+                remote.close()
+                break
+            else:
+                raise NotImplementedError('Unknown command: {}'.format(cmd))
+    finally:
+        env.close()
+
+
+class MultiprocessVectorEnv(env.VectorEnv):
+    """VectorEnv where each env is run in its own subprocess.
+
+    Each environment lives in a worker process and communicates with this
+    object through a pipe, so that stepping environments runs in parallel.
+
+    Args:
+        env_fns (list of callable): Functions that create environments, one
+            for each worker process. They are called in the worker
+            processes.
+        auto_reset (bool): If set to True, an environment that returns
+            done=True is reset by its worker right after the step, so that
+            resetting overlaps with computation in the main process. The
+            initial observation is kept by the worker and returned by the
+            next call of `reset`, hence `reset` must still be called for
+            such environments before stepping them again.
+        shared_memory (bool): If set to True, workers write observations
+            into preallocated shared memory instead of sending them through
+            pipes, which is much faster for large observations such as
+            images. Observations must then be convertible to ndarrays of
+            a fixed shape and dtype, which are determined by resetting an
+            environment created by `env_fns[0]` in this process. `step` and
+            `reset` return observations as a single ndarray whose i-th row
+            is the observation of the i-th environment.
+    """
+
+    def __init__(self, env_fns, auto_reset=False, shared_memory=False):
+        nenvs = len(env_fns)
+        if shared_memory:
+            shared_obs = self._allocate_shared_obs(env_fns[0], nenvs)
+            self.shared_obs = _shared_ndarray(*shared_obs)
+        else:
+            shared_obs = None
+            self.shared_obs = None
+        self.remotes, self.work_remotes = zip(
+            *[Pipe() for _ in range(nenvs)])
+        self.ps = [Process(target=worker,
+                           args=(work_remote, env_fn, auto_reset,
+                                 shared_obs, i))
+                   for i, (work_remote, env_fn) in enumerate(
+                       zip(self.work_remotes, env_fns))]
+        for p in self.ps:
+            p.daemon = True
+            p.start()
+        for work_remote in self.work_remotes:
+            work_remote.close()
+        self.last_obs = [None] * nenvs
+        self.remotes[0].send(('get_spaces', None))
+        self.action_space, self.observation_space = self.remotes[0].recv()
+        self.closed = False
+
+    @staticmethod
+    def _allocate_shared_obs(env_fn, nenvs):
+        probe_env = env_fn()
+        ob = np.asarray(probe_env.reset())
+        probe_env.close()
+        shape = (nenvs,) + ob.shape
+        raw_array = RawArray('b', nenvs * ob.nbytes)
+        return raw_array, ob.dtype.str, shape
+
+    def _receive_obs(self, obs):
+        if self.shared_obs is None:
+            return obs
+        # Copy observations once so that they are not overwritten by the
+        # next step while agents keep them
+        return self.shared_obs.copy()
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
+
+    def _assert_not_closed(self):
+        assert not self.closed, 'This env is already closed'
+
+    def step(self, actions):
+        self._assert_not_closed()
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        results = [remote.recv() for remote in self.remotes]
+        obs, rews, dones, infos = zip(*results)
+        self.last_obs = self._receive_obs(obs)
+        return self.last_obs, rews, dones, infos
+
+    def reset(self, mask=None):
+        self._assert_not_closed()
+        if mask is None:
+            mask = [False] * self.num_envs
+        elif all(mask):
+            # Nothing to reset
+            return self.last_obs
+        for m, remote in zip(mask, self.remotes):
+            if not m:
+                remote.send(('reset', None))
+        obs = [remote.recv() if not m else o for m, remote,
+               o in zip(mask, self.remotes, self.last_obs)]
+        self.last_obs = self._receive_obs(obs)
+        return self.last_obs
+
+    def seed(self, seeds=None):
+        self._assert_not_closed()
+        if seeds is None:
+            seeds = [None] * self.num_envs
+        assert len(seeds) == self.num_envs
+        for remote, seed in zip(self.remotes, seeds):
+            remote.send(('seed', seed))
+        return [remote.recv() for remote in self.remotes]
+
+    def close(self):
+        self._assert_not_closed()
+        self.closed = True
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for p in self.ps:
+            p.join()
+
+    @property
+    def num_envs(self):
+        return len(self.remotes)
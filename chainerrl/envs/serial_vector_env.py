@@ -0,0 +1,75 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+from chainerrl import env
+
+
+class SerialVectorEnv(env.VectorEnv):
+    """VectorEnv where each env is run sequentially in the current process.
+
+    This class has the same interface as `MultiprocessVectorEnv`, which makes
+    it a fallback for environments that cannot be run in subprocesses as
+    well as an aid to debugging.
+
+    Unlike `MultiprocessVectorEnv`, all the environments share the random
+    sources of the current process, so `seed` only calls the environments'
+    own seed methods.
+
+    Args:
+        envs (list of env): Environments to run.
+        auto_reset (bool): If set to True, an environment that returns
+            done=True is reset right after the step. The initial observation
+            is returned by the next call of `reset`.
+    """
+
+    def __init__(self, envs, auto_reset=False):
+        self.envs = envs
+        self.auto_reset = auto_reset
+        self.last_obs = [None] * len(envs)
+        self.initial_obs = [None] * len(envs)
+        self.action_space = envs[0].action_space
+        self.observation_space = envs[0].observation_space
+
+    def step(self, actions):
+        results = [env.step(a) for env, a in zip(self.envs, actions)]
+        self.last_obs, rews, dones, infos = zip(*results)
+        if self.auto_reset:
+            for i, done in enumerate(dones):
+                if done:
+                    self.initial_obs[i] = self.envs[i].reset()
+        return self.last_obs, rews, dones, infos
+
+    def reset(self, mask=None):
+        if mask is None:
+            mask = [False] * self.num_envs
+        obs = []
+        for i, (m, e, o) in enumerate(zip(mask, self.envs, self.last_obs)):
+            if m:
+                obs.append(o)
+            elif self.initial_obs[i] is not None:
+                obs.append(self.initial_obs[i])
+                self.initial_obs[i] = None
+            else:
+                obs.append(e.reset())
+        self.last_obs = obs
+        return obs
+
+    def seed(self, seeds=None):
+        if seeds is None:
+            seeds = [None] * self.num_envs
+        assert len(seeds) == self.num_envs
+        return [e.seed(s) if hasattr(e, 'seed') else None
+                for e, s in zip(self.envs, seeds)]
+
+    def close(self):
+        for e in self.envs:
+            e.close()
+
+    @property
+    def num_envs(self):
+        return len(self.envs)
@@ -1,6 +1,7 @@
 from chainerrl.experiments.evaluator import eval_performance  # NOQA
 
 from chainerrl.experiments.hooks import LinearInterpolationHook  # NOQA
+from chainerrl.experiments.hooks import ReplayBufferCheckpointHook  # NOQA
 from chainerrl.experiments.hooks import StepHook  # NOQA
 
 from chainerrl.experiments.prepare_output_dir import is_under_git_control  # NOQA
@@ -9,3 +10,5 @@ from chainerrl.experiments.prepare_output_dir import prepare_output_dir  # NOQA
 from chainerrl.experiments.train_agent import train_agent  # NOQA
 from chainerrl.experiments.train_agent import train_agent_with_evaluation  # NOQA
 from chainerrl.experiments.train_agent_async import train_agent_async  # NOQA
+from chainerrl.experiments.train_agent_batch import train_agent_batch  # NOQA
+from chainerrl.experiments.train_agent_batch import train_agent_batch_with_evaluation  # NOQA
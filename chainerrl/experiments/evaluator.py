@@ -14,6 +14,7 @@ import time
 
 import numpy as np
 
+from chainerrl.env import VectorEnv
 
 """Columns that describe information about an experiment.
 
@@ -73,12 +74,79 @@ def run_evaluation_episodes(env, agent, n_runs, max_episode_len=None,
     return scores
 
 
+def batch_run_evaluation_episodes(env, agent, n_runs, max_episode_len=None,
+                                  explorer=None, logger=None):
+    """Run multiple evaluation episodes in parallel and return returns.
+
+    Episodes are assigned to environments in advance so that evaluation is
+    not biased toward episodes that end early. Environments that have run
+    all the assigned episodes keep being stepped, but their results are
+    ignored.
+
+    Args:
+        env (VectorEnv): Environments used for evaluation
+        agent (Agent): Agent to evaluate. Its batch_act and batch_observe
+            methods are used.
+        n_runs (int): Number of evaluation runs.
+        max_episode_len (int or None): If specified, episodes longer than this
+            value will be truncated.
+        explorer (Explorer): If specified, the given Explorer will be used for
+            selecting actions.
+        logger (Logger or None): If specified, the given Logger object will be
+            used for logging results. If not specified, the default logger of
+            this module will be used.
+    Returns:
+        List of returns of evaluation runs.
+    """
+    logger = logger or logging.getLogger(__name__)
+    num_envs = env.num_envs
+    n_remaining = np.asarray([n_runs // num_envs + (i < n_runs % num_envs)
+                              for i in range(num_envs)])
+    episode_r = np.zeros(num_envs, dtype=np.float64)
+    episode_len = np.zeros(num_envs, dtype='i')
+    scores = []
+    obss = env.reset()
+    while n_remaining.any():
+        actions = agent.batch_act(obss)
+        if explorer is not None:
+            actions = [explorer.select_action(t, lambda a=a: a)
+                       for t, a in zip(episode_len, actions)]
+        obss, rs, dones, infos = env.step(actions)
+        episode_r += rs
+        episode_len += 1
+        if max_episode_len is None:
+            resets = np.zeros(num_envs, dtype=bool)
+        else:
+            resets = episode_len == max_episode_len
+        agent.batch_observe(obss, rs, dones, resets)
+        end = np.logical_or(resets, dones)
+        for i in np.flatnonzero(end):
+            if n_remaining[i] > 0:
+                n_remaining[i] -= 1
+                # As mixing float and numpy float causes errors in statistics
+                # functions, here every score is cast to float.
+                scores.append(float(episode_r[i]))
+                logger.info('test episode: %s R: %s',
+                            len(scores) - 1, episode_r[i])
+        episode_r[end] = 0
+        episode_len[end] = 0
+        if n_remaining.any():
+            obss = env.reset(np.logical_not(end))
+    # Let the agent forget the unfinished episodes
+    agent.batch_observe(obss, np.zeros(num_envs), np.zeros(num_envs, bool),
+                        np.ones(num_envs, bool))
+    return scores
+
+
 def eval_performance(env, agent, n_runs, max_episode_len=None,
                      explorer=None, logger=None):
     """Run multiple evaluation episodes and return statistics.
 
+    If `env` is a VectorEnv, evaluation episodes are run in parallel by
+    `batch_run_evaluation_episodes`.
+
     Args:
-        env (Environment): Environment used for evaluation
+        env (Environment or VectorEnv): Environment used for evaluation
         agent (Agent): Agent to evaluate.
         n_runs (int): Number of evaluation runs.
         max_episode_len (int or None): If specified, episodes longer than this
@@ -91,7 +159,11 @@ def eval_performance(env, agent, n_runs, max_episode_len=None,
     Returns:
         Dict of statistics.
     """
-    scores = run_evaluation_episodes(
+    if isinstance(env, VectorEnv):
+        run_episodes = batch_run_evaluation_episodes
+    else:
+        run_episodes = run_evaluation_episodes
+    scores = run_episodes(
         env, agent, n_runs,
         max_episode_len=max_episode_len,
         explorer=explorer,
@@ -121,7 +193,8 @@ class Evaluator(object):
 
     Args:
         agent (Agent): Agent to evaluate.
-        env (Env): Env to evaluate the agent on.
+        env (Env or VectorEnv): Env to evaluate the agent on. If a VectorEnv
+            is given, evaluation episodes are run in parallel.
         n_runs (int): Number of episodes used in each evaluation.
         eval_interval (int): Interval of evaluations in steps.
         outdir (str): Path to a directory to save things.
@@ -216,6 +289,9 @@ class AsyncEvaluator(object):
         save_best_so_far_agent (bool): If set to True, after each evaluation,
             if the score (= mean return of evaluation episodes) exceeds
             the best-so-far score, the current agent is saved.
+        ctx (multiprocessing context): Context by which the values shared
+            among processes are made. It must be the one by which the
+            processes are started. If set to None, multiprocessing is used.
     """
 
     def __init__(self,
@@ -227,6 +303,7 @@ class AsyncEvaluator(object):
                  step_offset=0,
                  save_best_so_far_agent=True,
                  logger=None,
+                 ctx=None,
                  ):
 
         self.start_time = time.time()
@@ -240,15 +317,27 @@ class AsyncEvaluator(object):
         self.logger = logger or logging.getLogger(__name__)
 
         # Values below are shared among processes
-        self.prev_eval_t = mp.Value(
+        ctx = ctx or mp
+        self.prev_eval_t = ctx.Value(
             'l', self.step_offset - self.step_offset % self.eval_interval)
-        self._max_score = mp.Value('f', np.finfo(np.float32).min)
-        self.wrote_header = mp.Value('b', False)
+        self._max_score = ctx.Value('f', np.finfo(np.float32).min)
+        self.wrote_header = ctx.Value('b', False)
 
         # Create scores.txt
         with open(os.path.join(self.outdir, 'scores.txt'), 'a'):
             pass
 
+    def __getstate__(self):
+        # Loggers cannot be pickled before Python 3.7, so the logger is
+        # restored by its name
+        state = self.__dict__.copy()
+        state['logger'] = self.logger.name
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger(state['logger'])
+
     @property
     def max_score(self):
         with self._max_score.get_lock():
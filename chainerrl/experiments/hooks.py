@@ -65,3 +65,27 @@ class LinearInterpolationHook(StepHook):
                           [1, self.total_steps],
                           [self.start_value, self.stop_value])
         self.setter(env, agent, value)
+
+
+class ReplayBufferCheckpointHook(StepHook):
+    """Hook that regularly saves the replay buffer of an agent.
+
+    The replay buffer is always saved to the same path so that replay buffers
+    that support incremental saving, e.g.
+    `chainerrl.replay_buffer.ArrayReplayBuffer`, only write transitions
+    added since the last checkpoint. Training can be resumed by calling
+    `agent.replay_buffer.load(dirname)`.
+
+    Args:
+        interval (int): Interval of checkpoints in steps.
+        dirname (str): Path to save the replay buffer to.
+    """
+
+    def __init__(self, interval, dirname):
+        assert interval > 0
+        self.interval = interval
+        self.dirname = dirname
+
+    def __call__(self, env, agent, step):
+        if step % self.interval == 0:
+            agent.replay_buffer.save(self.dirname)
@@ -15,10 +15,16 @@ from chainerrl.misc.makedirs import makedirs
 
 
 def save_agent_replay_buffer(agent, t, outdir, suffix='', logger=None):
+    """Save the replay buffer of an agent to a fixed path in outdir.
+
+    Like ReplayBufferCheckpointHook, the same path is used every time so that
+    array-backed replay buffers only write transitions added since the last
+    save, which is a directory rather than a file for such buffers.
+    """
     logger = logger or logging.getLogger(__name__)
-    filename = os.path.join(outdir, '{}{}.replay.pkl'.format(t, suffix))
+    filename = os.path.join(outdir, 'replay_buffer{}'.format(suffix))
     agent.replay_buffer.save(filename)
-    logger.info('Saved the current replay buffer to %s', filename)
+    logger.info('Saved the replay buffer at step %s to %s', t, filename)
 
 
 def ask_and_save_agent_replay_buffer(agent, t, outdir, suffix=''):
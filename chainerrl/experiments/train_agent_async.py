@@ -6,26 +6,56 @@ from builtins import *  # NOQA
 from future import standard_library
 standard_library.install_aliases()
 
+import functools
 import logging
 import multiprocessing as mp
 import os
+import time
+
+import chainer
 
 from chainerrl.experiments.evaluator import AsyncEvaluator
 from chainerrl.misc import async
+from chainerrl.misc.batch_states import batch_states
+from chainerrl.misc.gradient_slots import GradientSlots
+from chainerrl.misc.inference_server import InferenceServer
+from chainerrl.misc.parameter_server import ParameterServer
+from chainerrl.misc.parameter_server import RemoteParameterServer
+from chainerrl.misc.parameter_server import SharedMemoryParameterServer
 from chainerrl.misc import random_seed
+from chainerrl.misc.stats_board import StatsBoard
+from chainerrl.misc.stats_board import ThroughputMeter
+
+
+def _get_n_updates(agent):
+    optimizer = getattr(agent, 'optimizer', None)
+    return getattr(optimizer, 't', None)
+
 
+def _get_shared_model(agent):
+    """Return the globally shared model by which the agent acts."""
+    if hasattr(agent, 'shared_q_function'):
+        return agent.shared_q_function
+    return agent.shared_model
 
-def train_loop(process_idx, env, agent, steps, outdir, counter,
-               episodes_counter, training_done,
+
+def train_loop(process_idx, env, agent, steps, outdir, stats_board,
+               training_done, training_done_lock,
                max_episode_len=None, evaluator=None, eval_env=None,
                successful_score=None, logger=None,
-               global_step_hooks=[]):
+               global_step_hooks=[], throughput_log_interval=None):
 
     logger = logger or logging.getLogger(__name__)
 
     if eval_env is None:
         eval_env = env
 
+    if process_idx == 0 and throughput_log_interval is not None:
+        throughput_meter = ThroughputMeter(stats_board, time.time())
+        next_log_time = throughput_meter.prev_t + throughput_log_interval
+    else:
+        throughput_meter = None
+
     try:
 
         total_r = 0
@@ -45,10 +75,12 @@ def train_loop(process_idx, env, agent, steps, outdir, counter,
             episode_r += r
 
             if done or episode_len == max_episode_len:
-                with episodes_counter.get_lock():
-                    episodes_counter.value += 1
-                    global_episodes = episodes_counter.value
                 agent.stop_episode_and_train(obs, r, done)
+                stats_board.add_episode(process_idx, episode_r)
+                stats_board.set_statistics(
+                    process_idx, agent.get_statistics(),
+                    n_updates=_get_n_updates(agent))
+                global_episodes = stats_board.episodes
                 if process_idx == 0:
                     logger.info(
                         'outdir:%s global_step:%s local_step:%s R:%s',
@@ -61,7 +93,7 @@ def train_loop(process_idx, env, agent, steps, outdir, counter,
                     if (eval_score is not None and
                             successful_score is not None and
                             eval_score >= successful_score):
-                        with training_done.get_lock():
+                        with training_done_lock:
                             if not training_done.value:
                                 training_done.value = True
                                 successful = True
@@ -77,13 +109,28 @@ def train_loop(process_idx, env, agent, steps, outdir, counter,
                 a = agent.act_and_train(obs, r)
                 obs, r, done, info = env.step(a)
 
-                # Get and increment the global counter
-                with counter.get_lock():
-                    counter.value += 1
-                    global_t = counter.value
+                # Count the step in the slot of this process, which needs no
+                # lock, and sum the slots of all the processes
+                stats_board.add_step(process_idx)
+                global_t = stats_board.value
                 local_t += 1
                 episode_len += 1
 
+                if (throughput_meter is not None and
+                        time.time() >= next_log_time):
+                    now = time.time()
+                    steps_per_sec, worker_steps_per_sec, updates_per_sec = \
+                        throughput_meter.measure(now)
+                    next_log_time = now + throughput_log_interval
+                    logger.info(
+                        'global_step:%s steps/sec:%.1f updates/sec:%.1f'
+                        ' steps/sec of actors:%s',
+                        global_t, steps_per_sec, updates_per_sec,
+                        ' '.join('{:.1f}'.format(x)
+                                 for x in worker_steps_per_sec))
+                    logger.info('statistics of actors:%s',
+                                stats_board.get_statistics())
+
                 for hook in global_step_hooks:
                     hook(env, agent, global_t)
 
@@ -98,7 +145,16 @@ def train_loop(process_idx, env, agent, steps, outdir, counter,
             logger.warning('Saved the current model to %s', dirname)
         raise
 
-    if global_t == steps + 1:
+    if global_t > steps:
+        # Since processes can see the same global_t, the first one to mark
+        # the end of training saves the final model
+        with training_done_lock:
+            is_first = not training_done.value
+            training_done.value = True
+    else:
+        is_first = False
+
+    if is_first:
         # Save the final model
         dirname = os.path.join(outdir, '{}_finish'.format(steps))
         agent.save(dirname)
@@ -111,6 +167,102 @@ def train_loop(process_idx, env, agent, steps, outdir, counter,
         logger.info('Saved the successful agent to %s', dirname)
 
 
+def eval_loop(env, agent, steps, outdir, stats_board,
+              training_done, training_done_lock, evaluator, shared_objects,
+              successful_score=None, poll_interval=1.0, logger=None):
+    """Evaluate snapshots of shared params until training finishes.
+
+    This is run by a dedicated evaluator process so that no actor is blocked
+    by evaluations.
+    """
+
+    logger = logger or logging.getLogger(__name__)
+
+    try:
+        while not training_done.value and stats_board.value <= steps:
+            global_t = stats_board.value
+            with evaluator.prev_eval_t.get_lock():
+                necessary = (global_t >=
+                             evaluator.prev_eval_t.value +
+                             evaluator.eval_interval)
+            if not necessary:
+                time.sleep(poll_interval)
+                continue
+            # Actors keep updating the shared params during evaluation
+            snapshot_shared_params(agent, shared_objects)
+            eval_score = evaluator.evaluate_if_necessary(
+                t=global_t, episodes=stats_board.episodes,
+                env=env, agent=agent)
+            if (eval_score is not None and
+                    successful_score is not None and
+                    eval_score >= successful_score):
+                with training_done_lock:
+                    training_done.value = True
+                # Save the successful model
+                dirname = os.path.join(outdir, 'successful')
+                agent.save(dirname)
+                logger.info('Saved the successful agent to %s', dirname)
+                break
+    finally:
+        env.close()
+
+
+def apply_loop(optimizer, gradient_slots, steps, stats_board, training_done,
+               poll_interval=1e-3, parameter_server=None):
+    """Apply gradients pushed by actors until training finishes.
+
+    This is run by a dedicated process so that actors never update the shared
+    params and optimizer states by themselves.
+
+    If parameter_server is given, gradients are pushed to it instead of being
+    applied by optimizer, and the params of `optimizer.target` are pulled from
+    it after each push.
+    """
+
+    if parameter_server is None:
+        parameter_server = SharedMemoryParameterServer(optimizer)
+    while not training_done.value and stats_board.value <= steps:
+        if gradient_slots.flush(parameter_server) == 0:
+            time.sleep(poll_interval)
+        else:
+            parameter_server.pull(optimizer.target)
+    # Gradients pushed just before the end of training
+    if gradient_slots.flush(parameter_server) > 0:
+        parameter_server.pull(optimizer.target)
+
+
+def snapshot_shared_params(agent, shared_objects):
+    """Copy shared params to an agent so that they are not updated.
+
+    Process-local models of the agent are synchronized to the copies, too.
+    Since the agent no longer refers to shared memory afterwards, it must not
+    be trained.
+    """
+
+    def snapshot(obj, shared):
+        if isinstance(obj, tuple):
+            for o, s in zip(obj, shared):
+                snapshot(o, s)
+        elif isinstance(obj, chainer.Link):
+            async.set_shared_params(obj, shared)
+            async.make_params_not_shared(obj)
+
+    for attr, shared in shared_objects.items():
+        snapshot(getattr(agent, attr), shared)
+    if hasattr(agent, 'sync_parameters'):
+        agent.sync_parameters()
+
+
+def _remake_values(shared, ctx):
+    """Remake synchronized values, e.g. step counters of agents, by ctx."""
+    if isinstance(shared, tuple):
+        return tuple(_remake_values(s, ctx) for s in shared)
+    elif isinstance(shared, mp.sharedctypes.Synchronized):
+        return ctx.Value(type(shared.get_obj()), shared.value)
+    else:
+        return shared
+
+
 def extract_shared_objects_from_agent(agent):
     return dict((attr, async.as_shared_objects(getattr(agent, attr)))
                 for attr in agent.shared_attributes)
@@ -123,6 +275,101 @@ def set_shared_objects(agent, shared_objects):
         setattr(agent, attr, new_value)
 
 
+def _run_process(process_idx, ready, processes, make_env, agent, make_agent,
+                 shared_objects, steps, outdir, stats_board, training_done,
+                 training_done_lock, evaluator, dedicated_evaluator,
+                 inference_clients, gradient_slots, remote_param_server,
+                 max_episode_len, successful_score, global_step_hooks,
+                 throughput_log_interval, profile, logger_name):
+    """Set up and run a process of train_agent_async.
+
+    This is a module-level function so that it can be pickled for start
+    methods other than 'fork'. `ready` is called once the env and the agent
+    of the process are made.
+    """
+
+    # Loggers cannot be pickled before Python 3.7
+    logger = logging.getLogger(logger_name)
+
+    random_seed.set_random_seed(process_idx)
+
+    if make_agent is not None:
+        local_agent = make_agent(process_idx)
+    else:
+        local_agent = agent
+    # Unless the process is forked, the params of the agent have been copied
+    # by pickling, so they are bound to the shared memory again
+    set_shared_objects(local_agent, shared_objects)
+
+    # The process after actors and the dedicated evaluator if any is the
+    # gradient applier
+    if (gradient_slots is not None and
+            process_idx == processes + int(dedicated_evaluator)):
+        ready()
+        apply_loop(
+            optimizer=local_agent.optimizer,
+            gradient_slots=gradient_slots,
+            steps=steps,
+            stats_board=stats_board,
+            training_done=training_done,
+            parameter_server=remote_param_server)
+        return
+
+    # The last process is the dedicated evaluator if any
+    is_evaluator = process_idx == processes
+    env = make_env(process_idx, test=is_evaluator)
+    if evaluator is None or dedicated_evaluator:
+        eval_env = env
+    else:
+        eval_env = make_env(process_idx, test=True)
+    local_agent.process_idx = process_idx
+    if inference_clients is not None:
+        local_agent.inference_client = inference_clients[process_idx]
+    if gradient_slots is not None and not is_evaluator:
+        local_agent.gradient_slots = gradient_slots
+    ready()
+
+    if is_evaluator:
+        eval_loop(
+            env=env,
+            agent=local_agent,
+            steps=steps,
+            outdir=outdir,
+            stats_board=stats_board,
+            training_done=training_done,
+            training_done_lock=training_done_lock,
+            evaluator=evaluator,
+            shared_objects=shared_objects,
+            successful_score=successful_score,
+            logger=logger)
+        return
+
+    def f():
+        train_loop(
+            process_idx=process_idx,
+            stats_board=stats_board,
+            agent=local_agent,
+            env=env,
+            steps=steps,
+            outdir=outdir,
+            max_episode_len=max_episode_len,
+            evaluator=None if dedicated_evaluator else evaluator,
+            successful_score=successful_score,
+            training_done=training_done,
+            training_done_lock=training_done_lock,
+            eval_env=eval_env,
+            global_step_hooks=global_step_hooks,
+            throughput_log_interval=throughput_log_interval,
+            logger=logger)
+
+    if profile:
+        import cProfile
+        cProfile.runctx('f()', globals(), locals(),
+                        'profile-{}.out'.format(os.getpid()))
+    else:
+        f()
+
+
 def train_agent_async(outdir, processes, make_env,
                       profile=False,
                       steps=8 * 10 ** 7,
@@ -136,6 +383,18 @@ def train_agent_async(outdir, processes, make_env,
                       make_agent=None,
                       global_step_hooks=[],
                       save_best_so_far_agent=True,
+                      dedicated_evaluator=False,
+                      inference_server=False,
+                      inference_max_batch_size=None,
+                      inference_timeout=1e-3,
+                      gradient_applier=False,
+                      parameter_server_address=None,
+                      serve_parameters=False,
+                      parameter_compression=False,
+                      throughput_log_interval=60,
+                      start_method=None,
+                      sync_start=False,
+                      max_restarts=0,
                       logger=None,
                       ):
     """Train agent asynchronously using multiprocessing.
@@ -164,6 +423,59 @@ def train_agent_async(outdir, processes, make_env,
         save_best_so_far_agent (bool): If set to True, after each evaluation,
             if the score (= mean return of evaluation episodes) exceeds
             the best-so-far score, the current agent is saved.
+        dedicated_evaluator (bool): If set to True, evaluations are done by
+            an additional process on snapshots of the shared params, so that
+            actors keep training during evaluations. Otherwise, the actor
+            that finishes an episode when an evaluation is due runs it.
+        inference_server (bool): If set to True, actions of actors and the
+            dedicated evaluator if any are computed by an additional process
+            that batches requests of all of them using the globally shared
+            model of the agent, i.e. its `shared_model` or
+            `shared_q_function` attribute. Since the outputs of the server are
+            not differentiable, actors compute the forward passes of their
+            process-local models over the stored states at each update. The
+            agent must have an `inference_client` attribute, e.g. A3C, ACER,
+            PCL or NSQ, and its model must not be recurrent. The dedicated
+            evaluator acts with the latest shared params instead of their
+            snapshot.
+        inference_max_batch_size (int): Maximum number of requests computed
+            at once by the inference server. If set to None, the number of
+            processes it serves is used.
+        inference_timeout (float): Seconds for which the inference server
+            waits for more requests after receiving one.
+        gradient_applier (bool): If set to True, actors push their gradients
+            to per-actor slots in shared memory without taking any lock, and
+            an additional process applies them to the shared params one by
+            one. The agent must have a `gradient_slots` attribute, e.g. A3C.
+            Since the optimizer is run by the additional process, changing
+            its hyperparameters in actors, e.g. by hooks, has no effect.
+        parameter_server_address (tuple): (host, port) of a parameter server
+            shared by multiple machines. If set, gradient_applier is enabled
+            and the gradient applier of this machine pushes gradients to the
+            server instead of applying them, and pulls the params of the
+            server to the shared model of this machine. Each machine runs
+            this function with the same address.
+        serve_parameters (bool): If set to True, this machine runs the
+            parameter server at parameter_server_address with the optimizer
+            of the agent. Exactly one machine must serve, and it should be
+            the last one to finish since the server stops with its training.
+        parameter_compression (bool): If set to True, gradients and params
+            are sent to and from the parameter server as float16.
+        throughput_log_interval (float): Interval in seconds at which process
+            0 logs global and per-actor steps/sec, updates/sec and
+            statistics averaged over actors. If set to None, they are not
+            logged.
+        start_method (str): Start method of processes, e.g. 'fork', 'spawn'
+            or 'forkserver', which preloads chainer and chainerrl. See
+            chainerrl.misc.async.run_async. Unless it is 'fork', make_env,
+            make_agent or agent and global_step_hooks must be picklable, and
+            the inference server, if any, is still started by the default
+            start method.
+        sync_start (bool): If set to True, processes start training after
+            all of them have made their envs and agents.
+        max_restarts (int): Maximum number of times each process is
+            restarted when it crashes. A restarted actor starts a new
+            episode.
         logger (logging.Logger): Logger used in this function.
 
     Returns:
@@ -175,15 +487,24 @@ def train_agent_async(outdir, processes, make_env,
     # Prevent numpy from using multiple threads
     os.environ['OMP_NUM_THREADS'] = '1'
 
-    counter = mp.Value('l', 0)
-    episodes_counter = mp.Value('l', 0)
-    training_done = mp.Value('b', False)  # bool
+    # Locks must be made by the context that starts the processes since
+    # those of others cannot be passed to them
+    ctx = mp if start_method is None else mp.get_context(start_method)
+
+    # Read by every actor at every step without any lock. The lock is taken
+    # only to set it so that the first setter can be identified.
+    training_done = ctx.RawValue('b', False)  # bool
+    training_done_lock = ctx.Lock()
 
     if agent is None:
         assert make_agent is not None
         agent = make_agent(0)
 
     shared_objects = extract_shared_objects_from_agent(agent)
+    if ctx is not mp:
+        shared_objects = dict(
+            (attr, _remake_values(shared, ctx))
+            for attr, shared in shared_objects.items())
     set_shared_objects(agent, shared_objects)
 
     if eval_interval is None:
@@ -197,47 +518,105 @@ def train_agent_async(outdir, processes, make_env,
             explorer=eval_explorer,
             save_best_so_far_agent=save_best_so_far_agent,
             logger=logger,
+            ctx=ctx,
         )
 
-    def run_func(process_idx):
-        random_seed.set_random_seed(process_idx)
-
-        env = make_env(process_idx, test=False)
-        if evaluator is None:
-            eval_env = env
-        else:
-            eval_env = make_env(process_idx, test=True)
-        if make_agent is not None:
-            local_agent = make_agent(process_idx)
-            set_shared_objects(local_agent, shared_objects)
-        else:
-            local_agent = agent
-        local_agent.process_idx = process_idx
-
-        def f():
-            train_loop(
-                process_idx=process_idx,
-                counter=counter,
-                episodes_counter=episodes_counter,
-                agent=local_agent,
-                env=env,
-                steps=steps,
-                outdir=outdir,
-                max_episode_len=max_episode_len,
-                evaluator=evaluator,
-                successful_score=successful_score,
-                training_done=training_done,
-                eval_env=eval_env,
-                global_step_hooks=global_step_hooks,
-                logger=logger)
-
-        if profile:
-            import cProfile
-            cProfile.runctx('f()', globals(), locals(),
-                            'profile-{}.out'.format(os.getpid()))
-        else:
-            f()
+    dedicated_evaluator = dedicated_evaluator and evaluator is not None
+
+    if inference_server:
+        if not hasattr(agent, 'inference_client'):
+            raise ValueError(
+                '{} does not support inference_server'.format(
+                    type(agent).__name__))
+        server = InferenceServer(
+            model=_get_shared_model(agent),
+            n_clients=processes + int(dedicated_evaluator),
+            max_batch_size=inference_max_batch_size,
+            timeout=inference_timeout,
+            phi=agent.phi,
+            batch_states=getattr(agent, 'batch_states', batch_states),
+            ctx=ctx,
+        )
+    else:
+        server = None
+
+    if serve_parameters:
+        if parameter_server_address is None:
+            raise ValueError(
+                'parameter_server_address is required to serve parameters')
+        param_server = ParameterServer(
+            agent.optimizer, address=parameter_server_address)
+    else:
+        param_server = None
 
-    async.run_async(processes, run_func)
+    if parameter_server_address is not None:
+        gradient_applier = True
+        remote_param_server = RemoteParameterServer(
+            parameter_server_address, agent.optimizer.target,
+            compress=parameter_compression)
+    else:
+        remote_param_server = None
+
+    if gradient_applier:
+        if not hasattr(agent, 'gradient_slots'):
+            raise ValueError(
+                '{} does not support gradient_applier'.format(
+                    type(agent).__name__))
+        gradient_slots = GradientSlots(agent.optimizer.target, processes)
+    else:
+        gradient_slots = None
+
+    stat_names = [name for name, _ in agent.get_statistics()]
+    if gradient_slots is not None:
+        stat_names += [name for name, _ in gradient_slots.get_statistics()]
+    stats_board = StatsBoard(processes, stat_names)
+
+    if param_server is not None:
+        param_server.start()
+    if remote_param_server is not None:
+        # Start from the params of the server. The connection is closed so
+        # that it is not shared by forked processes.
+        remote_param_server.pull(agent.optimizer.target)
+        remote_param_server.close()
+    if server is not None:
+        inference_clients = [server.make_client(i)
+                             for i in range(server.n_clients)]
+        server.start()
+    else:
+        inference_clients = None
+    run_func = functools.partial(
+        _run_process,
+        processes=processes,
+        make_env=make_env,
+        # The agent is not sent to processes that make their own agents
+        agent=agent if make_agent is None else None,
+        make_agent=make_agent,
+        shared_objects=shared_objects,
+        steps=steps,
+        outdir=outdir,
+        stats_board=stats_board,
+        training_done=training_done,
+        training_done_lock=training_done_lock,
+        evaluator=evaluator,
+        dedicated_evaluator=dedicated_evaluator,
+        inference_clients=inference_clients,
+        gradient_slots=gradient_slots,
+        remote_param_server=remote_param_server,
+        max_episode_len=max_episode_len,
+        successful_score=successful_score,
+        global_step_hooks=global_step_hooks,
+        throughput_log_interval=throughput_log_interval,
+        profile=profile,
+        logger_name=logger.name)
+    try:
+        async.run_async(
+            processes + int(dedicated_evaluator) + int(gradient_applier),
+            run_func, start_method=start_method, sync_start=sync_start,
+            notify_ready=True, max_restarts=max_restarts, logger=logger)
+    finally:
+        if server is not None:
+            server.stop()
+        if param_server is not None:
+            param_server.stop()
 
     return agent
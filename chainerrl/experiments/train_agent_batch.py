@@ -0,0 +1,202 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+from collections import deque
+import logging
+
+import numpy as np
+
+from chainerrl.experiments.evaluator import Evaluator
+from chainerrl.experiments.evaluator import save_agent
+from chainerrl.misc.makedirs import makedirs
+
+
+def train_agent_batch(agent, env, steps, outdir, log_interval=None,
+                      max_episode_len=None, step_offset=0, evaluator=None,
+                      successful_score=None, step_hooks=[],
+                      return_window_size=100, logger=None):
+    """Train an agent in a batch environment.
+
+    Args:
+        agent: Agent to train.
+        env: VectorEnv to train the agent against.
+        steps (int): Number of total time steps for training. Each step of
+            env counts as many time steps as its number of environments.
+        outdir (str): Path to the directory to output things.
+        log_interval (int): Interval of logging in time steps. If set to
+            None, statistics are logged whenever an episode ends.
+        max_episode_len (int): Maximum episode length of each environment.
+        step_offset (int): Time step from which training starts.
+        evaluator (Evaluator or None): Evaluator used to evaluate the agent.
+        successful_score (float): Finish training if the mean score is greater
+            or equal to this value if not None
+        step_hooks (list): List of callable objects that accepts
+            (env, agent, step) as arguments. They are called every time step.
+            See chainerrl.experiments.hooks.
+        return_window_size (int): Number of training episodes used to compute
+            the average returns in logs.
+        logger (logging.Logger): Logger used in this function.
+    """
+
+    logger = logger or logging.getLogger(__name__)
+    recent_returns = deque(maxlen=return_window_size)
+
+    num_envs = env.num_envs
+    episode_r = np.zeros(num_envs, dtype=np.float64)
+    episode_idx = np.zeros(num_envs, dtype='i')
+    episode_len = np.zeros(num_envs, dtype='i')
+
+    # o_0
+    obss = env.reset()
+
+    t = step_offset
+    if hasattr(agent, 't'):
+        agent.t = step_offset
+
+    try:
+        while True:
+            # a_t
+            actions = agent.batch_act_and_train(obss)
+            # o_{t+1}, r_{t+1}
+            obss, rs, dones, infos = env.step(actions)
+            episode_r += rs
+            episode_len += 1
+
+            # Episodes that reach max_episode_len are reset without being
+            # regarded as terminal
+            if max_episode_len is None:
+                resets = np.zeros(num_envs, dtype=bool)
+            else:
+                resets = episode_len == max_episode_len
+            agent.batch_observe_and_train(obss, rs, dones, resets)
+
+            # Start new episodes in the environments whose episodes end
+            end = np.logical_or(resets, dones)
+            episode_idx += end
+            recent_returns.extend(episode_r[end])
+            episode_r[end] = 0
+            episode_len[end] = 0
+            obss = env.reset(np.logical_not(end))
+
+            prev_t = t
+            for _ in range(num_envs):
+                t += 1
+                for hook in step_hooks:
+                    hook(env, agent, t)
+
+            if log_interval is None:
+                log_now = end.any()
+            else:
+                log_now = t // log_interval > prev_t // log_interval
+            if log_now and recent_returns:
+                logger.info('outdir:%s step:%s episode:%s last_R:%s'
+                            ' average_R:%s',
+                            outdir, t, np.sum(episode_idx),
+                            recent_returns[-1], np.mean(recent_returns))
+                logger.info('statistics:%s', agent.get_statistics())
+
+            if evaluator is not None:
+                evaluator.evaluate_if_necessary(
+                    t=t, episodes=np.sum(episode_idx))
+                if (successful_score is not None and
+                        evaluator.max_score >= successful_score):
+                    break
+
+            if t >= steps:
+                break
+
+    except (Exception, KeyboardInterrupt):
+        # Save the current model before being killed
+        save_agent(agent, t, outdir, logger, suffix='_except')
+        raise
+
+    # Save the final model
+    save_agent(agent, t, outdir, logger, suffix='_finish')
+
+
+def train_agent_batch_with_evaluation(agent,
+                                      env,
+                                      steps,
+                                      eval_n_runs,
+                                      eval_interval,
+                                      outdir,
+                                      log_interval=None,
+                                      max_episode_len=None,
+                                      step_offset=0,
+                                      eval_explorer=None,
+                                      eval_max_episode_len=None,
+                                      eval_env=None,
+                                      successful_score=None,
+                                      step_hooks=[],
+                                      save_best_so_far_agent=True,
+                                      return_window_size=100,
+                                      logger=None,
+                                      ):
+    """Train an agent in a batch environment while regularly evaluating it.
+
+    Args:
+        agent: Agent to train.
+        env: VectorEnv to train the agent against.
+        steps (int): Number of total time steps for training.
+        eval_n_runs (int): Number of runs for each time of evaluation.
+        eval_interval (int): Interval of evaluation.
+        outdir (str): Path to the directory to output things.
+        log_interval (int): Interval of logging in time steps. If set to
+            None, statistics are logged whenever an episode ends.
+        max_episode_len (int): Maximum episode length.
+        step_offset (int): Time step from which training starts.
+        eval_explorer: Explorer used for evaluation.
+        eval_max_episode_len (int or None): Maximum episode length of
+            evaluation runs. If set to None, max_episode_len is used instead.
+        eval_env (Env or VectorEnv): Environment used for evaluation. It must
+            be separate from `env` so that evaluation does not interrupt
+            training episodes. If a VectorEnv is given, evaluation episodes
+            are run in parallel.
+        successful_score (float): Finish training if the mean score is greater
+            or equal to this value if not None
+        step_hooks (list): List of callable objects that accepts
+            (env, agent, step) as arguments. They are called every time step.
+            See chainerrl.experiments.hooks.
+        save_best_so_far_agent (bool): If set to True, after each evaluation,
+            if the score (= mean return of evaluation episodes) exceeds
+            the best-so-far score, the current agent is saved.
+        return_window_size (int): Number of training episodes used to compute
+            the average returns in logs.
+        logger (logging.Logger): Logger used in this function.
+    """
+
+    logger = logger or logging.getLogger(__name__)
+
+    makedirs(outdir, exist_ok=True)
+
+    assert eval_env is not None, 'eval_env must be given'
+
+    if eval_max_episode_len is None:
+        eval_max_episode_len = max_episode_len
+
+    evaluator = Evaluator(agent=agent,
+                          n_runs=eval_n_runs,
+                          eval_interval=eval_interval, outdir=outdir,
+                          max_episode_len=eval_max_episode_len,
+                          explorer=eval_explorer,
+                          env=eval_env,
+                          step_offset=step_offset,
+                          save_best_so_far_agent=save_best_so_far_agent,
+                          logger=logger,
+                          )
+
+    train_agent_batch(
+        agent, env, steps, outdir,
+        log_interval=log_interval,
+        max_episode_len=max_episode_len,
+        step_offset=step_offset,
+        evaluator=evaluator,
+        successful_score=successful_score,
+        step_hooks=step_hooks,
+        return_window_size=return_window_size,
+        logger=logger)
@@ -0,0 +1,57 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import numpy as np
+
+
+def compute_gae(rewards, values, next_values, nonterminals, gamma, lambd,
+                episode_ends=None):
+    """Compute generalized advantage estimates, i.e. TD(lambda) advantages.
+
+    Arrays are of shape (T, ...), e.g. (T, N) for N parallel environments,
+    and advantages are computed by a single reverse scan along the first axis
+    vectorized over the other axes:
+
+    adv[t] = td_err[t] + gamma * lambd * (1 - episode_ends[t]) * adv[t + 1]
+
+    so multiple episodes along the first axis, including those that end in
+    the middle of a sequence of parallel environments, are computed at once.
+    adv[T] is regarded as zero.
+
+    See https://arxiv.org/abs/1506.02438
+
+    Args:
+        rewards (ndarray): Rewards.
+        values (ndarray): Values of states.
+        next_values (ndarray): Values of next states.
+        nonterminals (ndarray): 0 if next states are terminal, otherwise 1.
+        gamma (float): Discount factor [0, 1].
+        lambd (float): Lambda-return factor [0, 1].
+        episode_ends (ndarray or None): Boolean array that is True at the last
+            transition of each episode, of either the same shape as rewards or
+            shape (T,) to be broadcast over the other axes. Advantages are not
+            propagated across episodes. If set to None, transitions to
+            terminal states are regarded as the ends of episodes, so episodes
+            truncated without reaching terminal states must be specified.
+    Returns:
+        ndarray: Advantages. Targets of values are obtained by adding values
+            to them.
+    """
+    td_errs = rewards + gamma * nonterminals * next_values - values
+    if episode_ends is None:
+        episode_ends = np.asarray(nonterminals) == 0
+    episode_ends = np.asarray(episode_ends, dtype=bool)
+    continues = np.logical_not(episode_ends).reshape(
+        episode_ends.shape + (1,) * (td_errs.ndim - episode_ends.ndim))
+    discount = gamma * lambd
+    advs = np.empty_like(td_errs)
+    adv = np.zeros_like(td_errs[0])
+    for t in reversed(range(len(td_errs))):
+        adv = td_errs[t] + discount * continues[t] * adv
+        advs[t] = adv
+    return advs
@@ -6,13 +6,20 @@ from builtins import *  # NOQA
 from future import standard_library
 standard_library.install_aliases()
 
+import functools
+import logging
 import multiprocessing as mp
+import threading
+import time
 import warnings
 
 import chainer
 import numpy as np
 
 from chainerrl.misc import random_seed
+from chainerrl.misc.shared_arena import Arena
+from chainerrl.misc.shared_arena import bind_params
+from chainerrl.misc.shared_arena import make_params_contiguous  # NOQA
 
 
 def ensure_initialized_update_rule(param):
@@ -32,9 +39,14 @@ def set_shared_params(a, b):
 
     Args:
       a (chainer.Link): link whose params are to be replaced
-      b (dict): dict that consists of (param_name, multiprocessing.Array)
+      b (dict or Arena): dict that consists of
+          (param_name, multiprocessing.Array), or Arena whose keys are
+          param names
     """
     assert isinstance(a, chainer.Link)
+    if isinstance(b, Arena):
+        bind_params(a, b)
+        return
     for param_name, param in a.namedparams():
         if param_name in b:
             shared_param = b[param_name]
@@ -69,6 +81,11 @@ def set_shared_states(a, b):
     for param_name, param in a.target.namedparams():
         ensure_initialized_update_rule(param)
         state = param.update_rule.state
+        if isinstance(b, Arena):
+            for state_name in list(state.keys()):
+                if (param_name, state_name) in b:
+                    state[state_name] = b[(param_name, state_name)]
+            continue
         for state_name, state_val in b[param_name].items():
             s = state[state_name]
             state[state_name] = np.frombuffer(
@@ -76,11 +93,21 @@ def set_shared_states(a, b):
                 dtype=s.dtype).reshape(s.shape)
 
 
+def _as_shared_array(a):
+    """Copy an ndarray to a RawArray of bytes, keeping its dtype readable.
+
+    np.frombuffer with the dtype of the ndarray restores its values.
+    """
+    shared = mp.RawArray('b', a.nbytes)
+    np.frombuffer(shared, dtype=a.dtype)[:] = a.ravel()
+    return shared
+
+
 def extract_params_as_shared_arrays(link):
     assert isinstance(link, chainer.Link)
     shared_arrays = {}
     for param_name, param in link.namedparams():
-        shared_arrays[param_name] = mp.RawArray('f', param.data.ravel())
+        shared_arrays[param_name] = _as_shared_array(param.data)
     return shared_arrays
 
 
@@ -100,7 +127,7 @@ def extract_states_as_shared_arrays(optimizer):
         state = param.update_rule.state
         for state_name, state_val in state.items():
             shared_arrays[param_name][
-                state_name] = mp.RawArray('f', state_val.ravel())
+                state_name] = _as_shared_array(state_val)
     return shared_arrays
 
 
@@ -110,46 +137,168 @@ def share_states_as_shared_arrays(optimizer):
     return shared_arrays
 
 
-def run_async(n_process, run_func):
+def extract_params_as_shared_arena(link):
+    """Copy params of a link to an Arena in shared memory.
+
+    Unlike extract_params_as_shared_arrays, all the params are laid out in a
+    single buffer, so that they can be copied at once.
+    """
+    assert isinstance(link, chainer.Link)
+    return Arena((param_name, param.data)
+                 for param_name, param in link.namedparams())
+
+
+def share_params_as_shared_arena(link):
+    arena = extract_params_as_shared_arena(link)
+    set_shared_params(link, arena)
+    return arena
+
+
+def extract_states_as_shared_arena(optimizer):
+    """Copy states of an optimizer to an Arena in shared memory.
+
+    Keys of the arena are (param_name, state_name) tuples.
+    """
+    assert isinstance(optimizer, chainer.Optimizer)
+    assert hasattr(optimizer, 'target'), 'Optimizer.setup must be called first'
+    arrays = []
+    for param_name, param in optimizer.target.namedparams():
+        ensure_initialized_update_rule(param)
+        for state_name, state_val in param.update_rule.state.items():
+            arrays.append(((param_name, state_name), state_val))
+    return Arena(arrays)
+
+
+def share_states_as_shared_arena(optimizer):
+    arena = extract_states_as_shared_arena(optimizer)
+    set_shared_states(optimizer, arena)
+    return arena
+
+
+def _mark_ready(process_idx, ready_at, barrier):
+    ready_at[process_idx] = time.time()
+    if barrier is not None:
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            # Another worker exited before starting, so start without it
+            pass
+
+
+def _set_seed_and_run(process_idx, run_func, ready_at, barrier,
+                      notify_ready):
+    ready = functools.partial(_mark_ready, process_idx, ready_at, barrier)
+    if notify_ready:
+        random_seed.set_random_seed(np.random.randint(0, 2 ** 32))
+        run_func(process_idx, ready)
+    else:
+        ready()
+        random_seed.set_random_seed(np.random.randint(0, 2 ** 32))
+        run_func(process_idx)
+
+
+def run_async(n_process, run_func, start_method=None, sync_start=False,
+              notify_ready=False, max_restarts=0, poll_interval=0.1,
+              logger=None):
     """Run experiments asynchronously.
 
+    The startup latency of each worker, i.e. the time from starting its
+    process to becoming ready, is logged once all the workers are ready.
+
     Args:
       n_process (int): number of processes
       run_func: function that will be run in parallel
+      start_method (str): Start method of processes, e.g. 'fork', 'spawn'
+          or 'forkserver'. If set to None, the default of multiprocessing is
+          used. Unless it is 'fork', run_func must be picklable. With
+          'forkserver', chainer and chainerrl are imported once by the fork
+          server so that workers start without importing them again.
+          Requires Python 3.4 or later if not None.
+      sync_start (bool): If set to True, workers wait for each other to
+          become ready, so that no worker runs ahead while others are still
+          starting. Requires Python 3.3 or later.
+      notify_ready (bool): If set to True, run_func is called as
+          run_func(process_idx, ready), and each worker becomes ready when it
+          calls ready(), e.g. after making its env and model, so that
+          startup latencies and sync_start cover such setup. Otherwise, each
+          worker becomes ready right before run_func is called.
+      max_restarts (int): Maximum number of times each worker is restarted
+          when it exits with nonzero status. Restarted workers call run_func
+          with the same process_idx without waiting for the other workers.
+      poll_interval (float): Interval in seconds of checking processes.
+      logger (logging.Logger): Logger used to report startup latencies and
+          restarts.
     """
 
-    processes = []
+    logger = logger or logging.getLogger(__name__)
 
-    def set_seed_and_run(process_idx, run_func):
-        random_seed.set_random_seed(np.random.randint(0, 2 ** 32))
-        run_func(process_idx)
+    if start_method is None:
+        ctx = mp
+    else:
+        ctx = mp.get_context(start_method)
+        if start_method == 'forkserver':
+            ctx.set_forkserver_preload(['chainer', 'chainerrl'])
+
+    barrier = ctx.Barrier(n_process) if sync_start else None
+    ready_at = ctx.RawArray('d', n_process)
+    started_at = [None] * n_process
+    processes = [None] * n_process
+    n_restarts = [0] * n_process
+
+    def start(process_idx, barrier):
+        ready_at[process_idx] = 0
+        processes[process_idx] = ctx.Process(
+            target=_set_seed_and_run,
+            args=(process_idx, run_func, ready_at, barrier, notify_ready))
+        started_at[process_idx] = time.time()
+        processes[process_idx].start()
 
     for process_idx in range(n_process):
-        processes.append(mp.Process(target=set_seed_and_run, args=(
-            process_idx, run_func)))
-
-    for p in processes:
-        p.start()
-
-    for process_idx, p in enumerate(processes):
-        p.join()
-        if p.exitcode > 0:
-            warnings.warn(
-                "Process #{} (pid={}) exited with nonzero status {}".format(
-                    process_idx, p.pid, p.exitcode))
-        elif p.exitcode < 0:
-            warnings.warn(
-                "Process #{} (pid={}) was terminated by signal {}".format(
-                    process_idx, p.pid, -p.exitcode))
+        start(process_idx, barrier)
+
+    all_started = False
+    running = list(range(n_process))
+    while running:
+        time.sleep(poll_interval)
+        if not all_started and all(ready_at):
+            all_started = True
+            latencies = [ready_at[i] - started_at[i]
+                         for i in range(n_process)]
+            logger.info('Startup latencies of workers in seconds: %s',
+                        ' '.join('{:.3f}'.format(x) for x in latencies))
+        for process_idx in list(running):
+            p = processes[process_idx]
+            if p.is_alive():
+                continue
+            p.join()
+            if not all_started and barrier is not None:
+                # Other workers would otherwise wait for this one forever
+                barrier.abort()
+            if p.exitcode > 0:
+                warnings.warn(
+                    "Process #{} (pid={}) exited with nonzero status {}"
+                    .format(process_idx, p.pid, p.exitcode))
+            elif p.exitcode < 0:
+                warnings.warn(
+                    "Process #{} (pid={}) was terminated by signal {}"
+                    .format(process_idx, p.pid, -p.exitcode))
+            if p.exitcode != 0 and n_restarts[process_idx] < max_restarts:
+                n_restarts[process_idx] += 1
+                logger.warning('Restarting process #%s (%s/%s)',
+                               process_idx, n_restarts[process_idx],
+                               max_restarts)
+                start(process_idx, None)
+            else:
+                running.remove(process_idx)
 
 
 def as_shared_objects(obj):
     if isinstance(obj, tuple):
         return tuple(as_shared_objects(x) for x in obj)
     elif isinstance(obj, chainer.Link):
-        return share_params_as_shared_arrays(obj)
+        return share_params_as_shared_arena(obj)
     elif isinstance(obj, chainer.Optimizer):
-        return share_states_as_shared_arrays(obj)
+        return share_states_as_shared_arena(obj)
     elif isinstance(obj, mp.sharedctypes.Synchronized):
         return obj
     else:
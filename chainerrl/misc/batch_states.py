@@ -1,8 +1,16 @@
+import numpy as np
+
+
 def batch_states(states, xp, phi):
     """The default method for making batch of observations.
 
+    If `states` is already a batch in the form of an ndarray, e.g.
+    observations from `chainerrl.envs.MultiprocessVectorEnv` with shared
+    memory, and `phi` returns observations as they are, the batch is used
+    without copying it.
+
     Args:
-        states (list): list of observations from an environment.
+        states (list or ndarray): list of observations from an environment.
         xp (module): numpy or cupy
         phi (callable): Feature extractor applied to observations
 
@@ -10,5 +18,12 @@ def batch_states(states, xp, phi):
         the object which will be given as input to the model.
     """
 
-    states = [phi(s) for s in states]
-    return xp.asarray(states)
+    features = []
+    unchanged = isinstance(states, np.ndarray)
+    for s in states:
+        f = phi(s)
+        unchanged = unchanged and f is s
+        features.append(f)
+    if unchanged:
+        return xp.asarray(states)
+    return xp.asarray(features)
@@ -8,9 +8,21 @@ standard_library.install_aliases()
 
 from chainer import links as L
 
+from chainerrl.misc import shared_arena
+
 
 def copy_param(target_link, source_link):
     """Copy parameters of a link to another link."""
+    flat_pair = shared_arena.get_flat_pair(target_link, source_link)
+    if flat_pair is not None:
+        # Copy all the params by a single memcpy
+        (target_arena, target_bns), (source_arena, source_bns) = flat_pair
+        target_arena.copy_from(source_arena)
+        for target_bn, bn in zip(target_bns, source_bns):
+            target_bn.avg_mean[:] = bn.avg_mean
+            target_bn.avg_var[:] = bn.avg_var
+        return
+
     target_params = dict(target_link.namedparams())
     for param_name, param in source_link.namedparams():
         if target_params[param_name].data is None:
@@ -32,6 +44,17 @@ def copy_param(target_link, source_link):
 
 def soft_copy_param(target_link, source_link, tau):
     """Soft-copy parameters of a link to another link."""
+    flat_pair = shared_arena.get_flat_pair(target_link, source_link)
+    if flat_pair is not None:
+        (target_arena, target_bns), (source_arena, source_bns) = flat_pair
+        target_arena.soft_update_from(source_arena, tau)
+        for target_bn, bn in zip(target_bns, source_bns):
+            target_bn.avg_mean[:] *= (1 - tau)
+            target_bn.avg_mean[:] += tau * bn.avg_mean
+            target_bn.avg_var[:] *= (1 - tau)
+            target_bn.avg_var[:] += tau * bn.avg_var
+        return
+
     target_params = dict(target_link.namedparams())
     for param_name, param in source_link.namedparams():
         if target_params[param_name].data is None:
@@ -0,0 +1,130 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import multiprocessing as mp
+
+import numpy as np
+
+from chainerrl.misc.parameter_server import SharedMemoryParameterServer
+from chainerrl.misc.shared_arena import Arena
+
+
+class GradientSlots(object):
+    """Per-worker slots in shared memory to push gradients to an applier.
+
+    Each worker writes its gradients into its own slot without taking any
+    lock, and a single applier applies the gradients of full slots to the
+    globally shared params one by one, so that workers do not contend for
+    the shared params and optimizer states.
+
+    Each slot has a flag that is written by the worker only when the slot is
+    empty and by the applier only when it is full. A worker that finds its
+    slot still full counts a conflict and should keep its gradients to push
+    them later.
+
+    The staleness of a push is the number of updates that the applier made
+    between the synchronization of the worker's params and the application
+    of the push.
+
+    Args:
+        link (chainer.Link): Link whose params are updated, i.e. the
+            globally shared model.
+        n_slots (int): Number of slots, usually the number of workers.
+    """
+
+    def __init__(self, link, n_slots):
+        self.arenas = [
+            Arena((param_name, np.zeros_like(param.data))
+                  for param_name, param in link.namedparams())
+            for _ in range(n_slots)]
+        self.full = mp.RawArray('b', n_slots)
+        self.versions = mp.RawArray('l', n_slots)
+        self.update_count = mp.RawValue('l', 0)
+        self.conflicts = mp.RawArray('l', n_slots)
+        self.applied = mp.RawArray('l', n_slots)
+        self.total_staleness = mp.RawArray('l', n_slots)
+
+    @property
+    def n_slots(self):
+        return len(self.arenas)
+
+    def push(self, index, link, version):
+        """Write gradients of a link to a slot if it is empty.
+
+        Args:
+            index (int): Index of the slot.
+            link (chainer.Link): Link that has the gradients. Its params must
+                have the same names and shapes as the globally shared ones.
+            version (int): Value of `update_count` when the params that the
+                gradients are computed with were synchronized.
+        Returns:
+            bool: True if the gradients are pushed, False if the slot is
+                still full.
+        """
+        if self.full[index]:
+            self.conflicts[index] += 1
+            return False
+        arena = self.arenas[index]
+        for param_name, param in link.namedparams():
+            arena[param_name][...] = param.grad
+        self.versions[index] = version
+        self.full[index] = 1
+        return True
+
+    def apply(self, optimizer):
+        """Apply the gradients of all the full slots one by one.
+
+        Args:
+            optimizer (chainer.Optimizer): Optimizer set up with the
+                globally shared model.
+        Returns:
+            int: Number of applied slots.
+        """
+        return self.flush(SharedMemoryParameterServer(optimizer))
+
+    def flush(self, parameter_server):
+        """Push the gradients of all the full slots to a parameter server.
+
+        Args:
+            parameter_server (SharedMemoryParameterServer or
+                RemoteParameterServer): Parameter server that applies the
+                gradients.
+        Returns:
+            int: Number of pushed slots.
+        """
+        n_applied = 0
+        for index, arena in enumerate(self.arenas):
+            if not self.full[index]:
+                continue
+            parameter_server.push(arena)
+            self.total_staleness[index] += (
+                self.update_count.value - self.versions[index])
+            self.applied[index] += 1
+            self.update_count.value += 1
+            self.full[index] = 0
+            n_applied += 1
+        return n_applied
+
+    def get_statistics(self):
+        """Return statistics aggregated over all the slots.
+
+        Returns:
+            list: (name, value) pairs of the average staleness of applied
+                pushes, the number of applied pushes and the number of
+                conflicts.
+        """
+        applied = sum(self.applied)
+        if applied:
+            average_staleness = sum(self.total_staleness) / applied
+        else:
+            average_staleness = 0
+        return [
+            ('average_staleness', average_staleness),
+            ('applied_pushes', applied),
+            ('push_conflicts', sum(self.conflicts)),
+        ]
@@ -0,0 +1,272 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import multiprocessing as mp
+import queue
+import signal
+import time
+
+import chainer
+from chainer import cuda
+import numpy as np
+
+from chainerrl.action_value import ActionValue
+from chainerrl.action_value import DiscreteActionValue
+from chainerrl.misc.batch_states import batch_states
+from chainerrl.recurrent import Recurrent
+from chainerrl.recurrent import RecurrentChainMixin
+
+
+def _is_stateful(link):
+    """Return True if a link keeps states between forward passes.
+
+    Chains with RecurrentChainMixin are stateful only if any of their
+    children is.
+    """
+    if isinstance(link, chainer.links.LSTM):
+        return True
+    if isinstance(link, RecurrentChainMixin):
+        return any(_is_stateful(child) for child in link.children())
+    return isinstance(link, Recurrent)
+
+
+def _to_picklable(policy_output):
+    """Convert a policy output so that it can be sent to a client.
+
+    ActionValues keep the array module and formatters, which cannot be
+    pickled, so only their Q-values are sent.
+    """
+    if isinstance(policy_output, DiscreteActionValue):
+        return cuda.to_cpu(policy_output.q_values.data)
+    return policy_output
+
+
+def _from_picklable(policy_output):
+    """Restore a policy output converted by `_to_picklable`."""
+    if isinstance(policy_output, np.ndarray):
+        return DiscreteActionValue(chainer.Variable(policy_output))
+    return policy_output
+
+
+class InferenceServer(object):
+    """Server that runs batched forward passes for multiple processes.
+
+    Clients send observations to the server through a queue. The server
+    gathers pending requests until `max_batch_size` requests arrive or
+    `timeout` seconds pass after the first one, computes them in a single
+    forward pass of the model and sends back actions, log probabilities of
+    the actions, state values and the policy outputs that the actions are
+    chosen from.
+
+    If the params of the model are shared arrays, e.g. the globally shared
+    model of an asynchronous agent, the server always acts with the latest
+    params without synchronizing any process-local copy.
+
+    The model must either return an action distribution as its first output
+    and state values as its last output, as `A3CModel` and ACER models do,
+    or return a DiscreteActionValue, as Q-functions do. Q-functions act
+    greedily.
+    Recurrent models are not supported since requests of different
+    processes are batched together.
+
+    Args:
+        model (chainer.Link): Model that computes action distributions and
+            state values from batched observations.
+        n_clients (int): Number of clients.
+        max_batch_size (int): Maximum number of requests computed at once. If
+            set to None, n_clients is used.
+        timeout (float): Seconds to wait for more requests after the first
+            request of a batch arrives.
+        client_timeout (float): Seconds between which clients waiting for
+            responses check that the server is still running.
+        phi (callable): Feature extractor function.
+        batch_states (callable): Method which makes a batch of observations.
+        ctx (multiprocessing context): Context by which the queue and pipes
+            to the clients are made. It must be the one by which the
+            processes of the clients are started. If set to None,
+            multiprocessing is used. The server process itself is always
+            started by multiprocessing so that it shares the params of the
+            model with the process that makes the server.
+    """
+
+    def __init__(self, model, n_clients, max_batch_size=None, timeout=1e-3,
+                 client_timeout=1, phi=lambda x: x,
+                 batch_states=batch_states, ctx=None):
+        if _is_stateful(model):
+            raise ValueError('Recurrent models are not supported')
+        self.model = model
+        self.n_clients = n_clients
+        self.max_batch_size = max_batch_size or n_clients
+        self.timeout = timeout
+        self.client_timeout = client_timeout
+        self.phi = phi
+        self.batch_states = batch_states
+        ctx = ctx or mp
+        self.request_queue = ctx.Queue()
+        self.remotes, self.client_remotes = zip(
+            *[ctx.Pipe() for _ in range(n_clients)])
+        # Set while the server process is running so that clients can stop
+        # waiting for responses when it dies
+        self.running = ctx.RawValue('b', 0)
+        self.process = None
+
+    def make_client(self, index):
+        """Make a client that sends requests to this server.
+
+        Args:
+            index (int): Index of the client in [0, n_clients).
+        Returns:
+            InferenceClient
+        """
+        return InferenceClient(index, self.request_queue,
+                               self.client_remotes[index], self.running,
+                               timeout=self.client_timeout)
+
+    def start(self):
+        """Start serving in a new process."""
+        assert self.process is None, 'The server is already started'
+        self.running.value = 1
+        self.process = mp.Process(target=self.serve)
+        self.process.daemon = True
+        self.process.start()
+
+    def stop(self):
+        """Stop the process started by `start`."""
+        assert self.process is not None, 'The server is not started'
+        self.request_queue.put(None)
+        self.process.join()
+        self.process = None
+        self.running.value = 0
+
+    def serve(self):
+        """Respond to requests until `stop` is called."""
+        # Ignore CTRL+C so that the server keeps responding to the clients
+        # until it is stopped
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            stopping = False
+            while not stopping:
+                requests, stopping = self._receive_requests()
+                if not requests:
+                    continue
+                indices, batch_obs, batch_deterministic = zip(*requests)
+                batch_action, batch_log_prob, batch_value, policy_outputs = \
+                    self.compute(batch_obs, batch_deterministic)
+                for i, index in enumerate(indices):
+                    self.remotes[index].send(
+                        (batch_action[i], batch_log_prob[i], batch_value[i],
+                         _to_picklable(policy_outputs[i])))
+        finally:
+            self.running.value = 0
+
+    def _receive_requests(self):
+        requests = []
+        request = self.request_queue.get()
+        deadline = time.time() + self.timeout
+        while request is not None:
+            requests.append(request)
+            if len(requests) == self.max_batch_size:
+                return requests, False
+            try:
+                request = self.request_queue.get(
+                    timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                return requests, False
+        # None is sent by stop
+        return requests, True
+
+    def compute(self, batch_obs, deterministic=False):
+        """Compute actions, their log probabilities and state values.
+
+        Args:
+            batch_obs (list): Observations.
+            deterministic (bool or list of bools): If set true, choose most
+                probable actions instead of sampling them. It can be given
+                for each observation.
+        Returns:
+            tuple: Actions, their log probabilities and state values as
+                ndarrays of the same length as batch_obs, and a list of the
+                policy outputs for each observation, i.e. action
+                distributions or ActionValues of batch size 1.
+        """
+        xp = self.model.xp
+        n = len(batch_obs)
+        deterministic = np.broadcast_to(deterministic, (n,))
+        with chainer.using_config('train', False), \
+                chainer.no_backprop_mode():
+            b_state = self.batch_states(batch_obs, xp, self.phi)
+            outputs = self.model(b_state)
+            if isinstance(outputs, ActionValue):
+                if not isinstance(outputs, DiscreteActionValue):
+                    raise ValueError(
+                        'Only DiscreteActionValue is supported among'
+                        ' ActionValues')
+                # Greedy actions are chosen with probability one
+                policy_output = outputs
+                batch_action = outputs.greedy_actions.data
+                batch_log_prob = xp.zeros(n, dtype=np.float32)
+                values = outputs.max.data
+            else:
+                policy_output, values = outputs[0], outputs[-1].data
+                batch_action = policy_output.sample().data
+                if deterministic.any():
+                    indices = xp.asarray(np.flatnonzero(deterministic))
+                    batch_action[indices] = \
+                        policy_output.most_probable.data[indices]
+                batch_log_prob = policy_output.log_prob(batch_action).data
+            policy_outputs = [policy_output[i:i + 1] for i in range(n)]
+        return (cuda.to_cpu(batch_action),
+                cuda.to_cpu(batch_log_prob),
+                cuda.to_cpu(values).reshape(n),
+                policy_outputs)
+
+
+class InferenceClient(object):
+    """Client of InferenceServer.
+
+    Clients are made by `InferenceServer.make_client` and can be used by
+    processes forked after it is called.
+    """
+
+    def __init__(self, index, request_queue, remote, running, timeout=1):
+        self.index = index
+        self.request_queue = request_queue
+        self.remote = remote
+        self.running = running
+        self.timeout = timeout
+
+    def compute(self, obs, deterministic=False):
+        """Compute an action, its log probability and the state value.
+
+        Args:
+            obs (object): Observation.
+            deterministic (bool): If set true, choose the most probable
+                action instead of sampling it.
+        Returns:
+            tuple: Action, its log probability, the state value and the
+                policy output that the action is chosen from, i.e. an action
+                distribution or an ActionValue of batch size 1.
+        """
+        self.request_queue.put((self.index, obs, deterministic))
+        while not self.remote.poll(self.timeout):
+            if not self.running.value:
+                raise RuntimeError('The inference server is not running')
+        action, log_prob, value, policy_output = self.remote.recv()
+        return action, log_prob, value, _from_picklable(policy_output)
+
+    def act(self, obs, deterministic=False):
+        """Select an action.
+
+        Args:
+            obs (object): Observation.
+            deterministic (bool): If set true, choose the most probable
+                action instead of sampling it.
+        Returns:
+            object: Action.
+        """
+        return self.compute(obs, deterministic)[0]
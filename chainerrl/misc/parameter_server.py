@@ -0,0 +1,302 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import multiprocessing as mp
+import signal
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from chainerrl.misc import copy_param
+from chainerrl.misc.shared_arena import Arena
+from chainerrl.misc.shared_arena import get_param_arena
+
+# Header of a message: operation, flags and the number of payload bytes
+_HEADER = struct.Struct('!BBQ')
+
+_PUSH = 1
+_PULL = 2
+_PARAMS = 3
+_STOP = 4
+
+# Flag that floating-point arrays in the payload are cast to float16
+_FLOAT16 = 1
+
+
+def _wire_dtype(dtype, flags):
+    if flags & _FLOAT16 and dtype.kind == 'f':
+        return np.dtype(np.float16)
+    return dtype
+
+
+def _payload_size(arena, flags):
+    return sum(v.size * _wire_dtype(v.dtype, flags).itemsize
+               for v in arena.flat_views())
+
+
+def _send_message(sock, op, flags=0, arena=None):
+    if arena is None:
+        sock.sendall(_HEADER.pack(op, flags, 0))
+        return
+    chunks = [v.astype(_wire_dtype(v.dtype, flags), copy=False)
+              for v in arena.flat_views()]
+    sock.sendall(_HEADER.pack(op, flags, sum(c.nbytes for c in chunks)))
+    for chunk in chunks:
+        sock.sendall(memoryview(chunk))
+
+
+def _recv_exactly(sock, nbytes):
+    buf = bytearray(nbytes)
+    view = memoryview(buf)
+    received = 0
+    while received < nbytes:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise EOFError('Connection closed')
+        received += n
+    return buf
+
+
+def _recv_header(sock):
+    return _HEADER.unpack(bytes(_recv_exactly(sock, _HEADER.size)))
+
+
+def _recv_payload(sock, nbytes, flags, arena):
+    """Receive a payload into an arena of the expected layout."""
+    if nbytes != _payload_size(arena, flags):
+        raise ValueError(
+            'Payload of {} bytes does not match the layout of params'.format(
+                nbytes))
+    payload = _recv_exactly(sock, nbytes)
+    offset = 0
+    for v in arena.flat_views():
+        dtype = _wire_dtype(v.dtype, flags)
+        v[...] = np.frombuffer(payload, dtype=dtype, count=v.size,
+                               offset=offset)
+        offset += v.size * dtype.itemsize
+
+
+def _make_param_arena(link):
+    return Arena(((name, param.data) for name, param in link.namedparams()),
+                 shared=False)
+
+
+class SharedMemoryParameterServer(object):
+    """Parameter server whose params are shared by processes on a machine.
+
+    This is the backend that asynchronous training uses by default: params
+    and optimizer states are shared by `async.as_shared_objects`, so pushed
+    gradients are applied in place and there is nothing to pull.
+
+    Args:
+        optimizer (chainer.Optimizer): Optimizer set up with the globally
+            shared model.
+    """
+
+    def __init__(self, optimizer):
+        self.optimizer = optimizer
+        self.params = list(optimizer.target.namedparams())
+
+    def push(self, grads):
+        """Apply gradients to the params.
+
+        Args:
+            grads (dict or Arena): Gradients of params by their names. They
+                are used in place, so they are not copied.
+        """
+        for param_name, param in self.params:
+            param.grad = grads[param_name]
+        self.optimizer.update()
+
+    def pull(self, link):
+        """Copy the params to a link unless it is the shared model itself."""
+        if link is not self.optimizer.target:
+            copy_param.copy_param(target_link=link,
+                                  source_link=self.optimizer.target)
+
+
+class ParameterServer(object):
+    """Parameter server that serves params to other machines over TCP.
+
+    Clients, i.e. `RemoteParameterServer`, push gradients, which are applied
+    one by one by the optimizer, and pull the latest params. Each message is
+    a fixed-size header followed by the raw bytes of all the arrays laid out
+    in an arena, so clients and the server must have models whose params
+    have the same names, shapes and dtypes.
+
+    The socket is bound when the server is made, so `address` is available
+    before it starts.
+
+    Args:
+        optimizer (chainer.Optimizer): Optimizer set up with the model whose
+            params are served.
+        address (tuple): (host, port) to listen to. If port is 0, a free port
+            is chosen.
+        poll_interval (float): Interval in seconds of checking whether the
+            server is stopped.
+    """
+
+    def __init__(self, optimizer, address=('localhost', 0),
+                 poll_interval=0.1):
+        self.local = SharedMemoryParameterServer(optimizer)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(16)
+        self.address = self.listener.getsockname()
+        self.poll_interval = poll_interval
+        self.process = None
+
+    def start(self):
+        """Start serving in a new process."""
+        assert self.process is None, 'The server is already started'
+        self.process = mp.Process(target=self.serve)
+        self.process.daemon = True
+        self.process.start()
+
+    def stop(self):
+        """Stop the process started by `start`."""
+        assert self.process is not None, 'The server is not started'
+        sock = socket.create_connection(self.address)
+        try:
+            _send_message(sock, _STOP)
+        finally:
+            sock.close()
+        self.process.join()
+        self.process = None
+
+    def serve(self):
+        """Respond to clients until `stop` is called."""
+        # Ignore CTRL+C so that the server keeps responding to the clients
+        # until it is stopped
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        lock = threading.Lock()
+        stopped = threading.Event()
+        self.listener.settimeout(self.poll_interval)
+        while not stopped.is_set():
+            try:
+                conn, _ = self.listener.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            thread = threading.Thread(
+                target=self._handle, args=(conn, lock, stopped))
+            thread.daemon = True
+            thread.start()
+        self.listener.close()
+
+    def _handle(self, conn, lock, stopped):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        grads = _make_param_arena(self.local.optimizer.target)
+        params = _make_param_arena(self.local.optimizer.target)
+        try:
+            while True:
+                op, flags, nbytes = _recv_header(conn)
+                if op == _PUSH:
+                    _recv_payload(conn, nbytes, flags, grads)
+                    with lock:
+                        self.local.push(grads)
+                elif op == _PULL:
+                    with lock:
+                        for param_name, param in self.local.params:
+                            params[param_name][...] = param.data
+                    _send_message(conn, _PARAMS, flags, params)
+                elif op == _STOP:
+                    stopped.set()
+                    return
+                else:
+                    raise ValueError('Unknown operation: {}'.format(op))
+        except EOFError:
+            pass
+        finally:
+            conn.close()
+
+
+class RemoteParameterServer(object):
+    """Client of ParameterServer.
+
+    It has the same interface as SharedMemoryParameterServer. A connection is
+    made at the first push or pull, so a client can be made before processes
+    are forked as long as it is not used until then.
+
+    Args:
+        address (tuple): (host, port) of the server.
+        link (chainer.Link): Link whose params have the same names, shapes
+            and dtypes as those of the server.
+        compress (bool): If set to True, floating-point gradients and params
+            are sent as float16, which halves the traffic of float32 models
+            at the cost of precision.
+        connect_timeout (float): Seconds for which connecting is retried
+            while the server is not listening yet, e.g. it is still starting
+            on another machine.
+    """
+
+    def __init__(self, address, link, compress=False, connect_timeout=60):
+        self.address = tuple(address)
+        self.flags = _FLOAT16 if compress else 0
+        self.connect_timeout = connect_timeout
+        self.grads = _make_param_arena(link)
+        self.params = _make_param_arena(link)
+        self.sock = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['sock'] = None
+        return state
+
+    def _connect(self):
+        if self.sock is None:
+            deadline = time.time() + self.connect_timeout
+            while True:
+                try:
+                    self.sock = socket.create_connection(self.address)
+                    break
+                except socket.error:
+                    if time.time() >= deadline:
+                        raise
+                    time.sleep(0.5)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self.sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def push(self, grads):
+        """Send gradients to the server without waiting for their updates.
+
+        Args:
+            grads (dict or Arena): Gradients of params by their names.
+        """
+        if not (isinstance(grads, Arena) and
+                grads.layout == self.grads.layout):
+            for param_name in self.grads.keys():
+                self.grads[param_name][...] = grads[param_name]
+            grads = self.grads
+        _send_message(self._connect(), _PUSH, self.flags, grads)
+
+    def pull(self, link):
+        """Copy the latest params of the server to a link.
+
+        Gradients pushed before are applied before the params are sent.
+        """
+        sock = self._connect()
+        _send_message(sock, _PULL, self.flags)
+        op, flags, nbytes = _recv_header(sock)
+        assert op == _PARAMS
+        arena = get_param_arena(link)
+        if arena is not None and arena.layout == self.params.layout:
+            _recv_payload(sock, nbytes, flags, arena)
+            return
+        _recv_payload(sock, nbytes, flags, self.params)
+        for param_name, param in link.namedparams():
+            param.data[...] = self.params[param_name]
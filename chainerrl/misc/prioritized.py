@@ -12,11 +12,27 @@ from chainerrl.misc.random import sample_n_k
 
 
 class PrioritizedBuffer (object):
+    """List-like buffer that supports prioritized sampling.
+
+    Args:
+        capacity (int or None): Maximum number of data stored.
+        wait_priority_after_sampling (bool): If set to True, sampled data
+            must be given new priorities by set_last_priority before next
+            sampling.
+        sum_tree_type (str): 'pointer' to use SumTree or 'array' to use
+            ArraySumTree, which processes batch sampling and batch priority
+            updates as vectorized numpy operations.
+    """
 
-    def __init__(self, capacity=None, wait_priority_after_sampling=True):
+    def __init__(self, capacity=None, wait_priority_after_sampling=True,
+                 sum_tree_type='pointer'):
+        assert sum_tree_type in ('pointer', 'array')
         self.capacity = capacity
         self.data = []
-        self.priority_tree = SumTree()
+        if sum_tree_type == 'array':
+            self.priority_tree = ArraySumTree(capacity or 1)
+        else:
+            self.priority_tree = SumTree()
         self.data_inf = []
         self.wait_priority_after_sampling = wait_priority_after_sampling
         self.flag_wait_priority = False
@@ -124,11 +140,26 @@ class PrioritizedBuffer (object):
                 self.flag_wait_priority)
         assert all([p > 0.0 for p in priority])
         assert len(self.sampled_indices) == len(priority)
-        for i, p in zip(self.sampled_indices, priority):
-            self.priority_tree[i] = p
+        self.priority_tree.set_items(self.sampled_indices, priority)
         self.flag_wait_priority = False
         self.sampled_indices = []
 
+    def min_probability(self):
+        """Return the minimum probability of prioritized data.
+
+        It is available in O(1) only with ArraySumTree.
+
+        Returns:
+            float or None: Minimum of the probabilities that data with
+                priorities are sampled, or None if it is not available.
+        """
+        if not isinstance(self.priority_tree, ArraySumTree):
+            return None
+        total = self.priority_tree.s
+        if total <= 0:
+            return None
+        return self.priority_tree.min() / total
+
     def _uniform_sample_indices_and_probabilities(self, n):
         indices = list(sample_n_k(
             len(self.data),
@@ -210,6 +241,10 @@ class SumTree (object):
         self._allocindex(ix)
         self._write(ix, val)
 
+    def set_items(self, ixs, vals):
+        for ix, val in zip(ixs, vals):
+            self[ix] = val
+
     def _write(self, ix, val):
         if self._isleaf():
             self.s = val
@@ -265,3 +300,141 @@ class SumTree (object):
                 return self.l._pick(cum)
             else:
                 return self.r._pick(cum - self.l.s)
+
+
+class ArraySumTree (object):
+    """Fast weighted sampling with vectorized batch operations.
+
+    A segment tree laid out in flat arrays that keeps both sums and minimums
+    of nonnegative values. It can be used in place of SumTree as long as
+    indices are nonnegative. Zero values are regarded as missing and ignored
+    by `min`.
+
+    batch sampling and batch update are O(log n) numpy operations
+    min over all values is O(1)
+    """
+
+    def __init__(self, size=1):
+        self._size = 1
+        while self._size < size:
+            self._size *= 2
+        self._sum = np.zeros(2 * self._size, dtype=np.float64)
+        self._min = np.full(2 * self._size, np.inf, dtype=np.float64)
+
+    def __str__(self):
+        return 'ArraySumTree({})'.format(self._dict())
+
+    def _dict(self):
+        leaves = self._sum[self._size:]
+        return dict((ix, leaves[ix]) for ix in np.flatnonzero(leaves))
+
+    def _grow(self, ix):
+        size = self._size
+        while ix >= size:
+            size *= 2
+        old_size = self._size
+        sum_leaves = self._sum[old_size:]
+        min_leaves = self._min[old_size:]
+        self.__init__(size)
+        self._sum[size:size + old_size] = sum_leaves
+        self._min[size:size + old_size] = min_leaves
+        # Rebuild internal nodes level by level
+        lo, hi = size // 2, size
+        while lo >= 1:
+            nodes = np.arange(lo, hi)
+            self._sum[nodes] = self._sum[2 * nodes] + self._sum[2 * nodes + 1]
+            self._min[nodes] = np.minimum(
+                self._min[2 * nodes], self._min[2 * nodes + 1])
+            lo, hi = lo // 2, lo
+
+    @property
+    def s(self):
+        """Sum over all values."""
+        return self._sum[1]
+
+    def min(self):
+        """Return the minimum of nonzero values, or inf if there is none."""
+        return self._min[1]
+
+    def set_items(self, ixs, vals):
+        """Write values at given indices at once.
+
+        Args:
+            ixs (array-like of int): Unique indices.
+            vals (array-like of float): Values to write.
+        """
+        ixs = np.asarray(ixs, dtype=np.int64)
+        vals = np.asarray(vals, dtype=np.float64)
+        if ixs.size == 0:
+            return
+        assert ixs.min() >= 0
+        if ixs.max() >= self._size:
+            self._grow(ixs.max())
+        nodes = ixs + self._size
+        self._sum[nodes] = vals
+        self._min[nodes] = np.where(vals > 0, vals, np.inf)
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self._sum[nodes] = self._sum[2 * nodes] + self._sum[2 * nodes + 1]
+            self._min[nodes] = np.minimum(
+                self._min[2 * nodes], self._min[2 * nodes + 1])
+
+    def get_items(self, ixs):
+        """Read values at given indices at once."""
+        ixs = np.asarray(ixs, dtype=np.int64)
+        assert ixs.size == 0 or (ixs.min() >= 0 and ixs.max() < self._size)
+        return self._sum[ixs + self._size]
+
+    def __setitem__(self, ix, val):
+        self.set_items([ix], [val])
+
+    def __delitem__(self, ix):
+        self.__setitem__(ix, 0.0)
+
+    def __getitem__(self, ix):
+        return float(self.get_items([ix])[0])
+
+    def _pick(self, cums):
+        """Descend the tree for all the query points in parallel."""
+        nodes = np.ones(len(cums), dtype=np.int64)
+        cums = cums.copy()
+        while nodes[0] < self._size:
+            left = 2 * nodes
+            left_sum = self._sum[left]
+            # Going to an empty subtree can happen only by rounding errors
+            go_right = (cums >= left_sum) & (self._sum[left + 1] > 0)
+            cums -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self._size
+
+    def prioritized_sample(self, n, remove=False):
+        """Sample n unique indices with probabilities proportional to values.
+
+        Query points for remaining samples are processed in parallel, and
+        duplicates are resampled after removing already sampled indices.
+
+        Returns:
+            sampled indices (list)
+            probabilities (list)
+        """
+        assert n >= 0
+        total_val = self.s  # save this before it changes by removing
+        ixs = np.empty(0, dtype=np.int64)
+        vals = np.empty(0, dtype=np.float64)
+        while len(ixs) < n:
+            assert self.s > 0
+            cums = np.random.uniform(0.0, self.s, size=n - len(ixs))
+            picked = self._pick(cums)
+            # Remove duplicates while keeping the order
+            _, first_indices = np.unique(picked, return_index=True)
+            picked = picked[np.sort(first_indices)]
+            ixs = np.concatenate((ixs, picked))
+            vals = np.concatenate((vals, self.get_items(picked)))
+            self.set_items(picked, np.zeros(len(picked)))
+        if not remove:
+            self.set_items(ixs, vals)
+        return ixs.tolist(), (vals / total_val).tolist()
+
+    def prioritized_choice(self):
+        ix = int(self._pick(np.random.uniform(0.0, self.s, size=1))[0])
+        return ix, self[ix] / self.s
@@ -0,0 +1,215 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import multiprocessing as mp
+import weakref
+
+from chainer import links as L
+import numpy as np
+
+# Alignment in bytes of the first array of each dtype
+_ALIGNMENT = 64
+
+# Links whose params are views of arenas. Entries are weak so that they do
+# not keep links alive and are not copied by copy.deepcopy.
+_bindings = weakref.WeakKeyDictionary()
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class Arena(object):
+    """Arrays laid out contiguously in a single buffer.
+
+    Arrays of the same dtype are adjacent, so all of them can be operated on
+    at once through a flat view, e.g. copying all the params of a model by a
+    single memcpy. Arrays keep their own dtypes.
+
+    An arena behaves like a read-only dict whose values are views of the
+    buffer. Views are made lazily in each process, so an arena in shared
+    memory can also be passed to processes that are not forked.
+
+    Args:
+        arrays (iterable): (key, ndarray) pairs. Values are copied to the
+            arena.
+        shared (bool): If set to True, the buffer is allocated in shared
+            memory.
+    """
+
+    def __init__(self, arrays, shared=True):
+        arrays = list(arrays)
+        layout = []
+        groups = []
+        offset = 0
+        for dtype in sorted(set(a.dtype.str for _, a in arrays)):
+            offset = _align(offset)
+            start = offset
+            for key, a in arrays:
+                if a.dtype.str == dtype:
+                    layout.append((key, dtype, a.shape, offset))
+                    offset += a.nbytes
+            groups.append((dtype, start, offset))
+        self.layout = tuple(layout)
+        self.groups = tuple(groups)
+        self.nbytes = offset
+        if shared:
+            self.buffer = mp.RawArray('b', max(offset, 1))
+        else:
+            self.buffer = np.empty(max(offset, 1), dtype=np.int8)
+        self._views = None
+        self._flat_views = None
+        for key, a in arrays:
+            self[key][...] = a
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_views'] = None
+        state['_flat_views'] = None
+        return state
+
+    def _bytes(self):
+        return np.frombuffer(self.buffer, dtype=np.int8)[:self.nbytes]
+
+    def _make_views(self):
+        b = self._bytes()
+        self._views = dict(
+            (key, b[offset:offset + np.dtype(dtype).itemsize *
+                    int(np.prod(shape))].view(dtype).reshape(shape))
+            for key, dtype, shape, offset in self.layout)
+        self._flat_views = [b[start:stop].view(dtype)
+                            for dtype, start, stop in self.groups]
+
+    def __getitem__(self, key):
+        if self._views is None:
+            self._make_views()
+        return self._views[key]
+
+    def __contains__(self, key):
+        if self._views is None:
+            self._make_views()
+        return key in self._views
+
+    def __len__(self):
+        return len(self.layout)
+
+    def keys(self):
+        return [key for key, _, _, _ in self.layout]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def flat_views(self):
+        """Return a flat view for each dtype.
+
+        Returns:
+            list of ndarray: 1-D views, each of which spans all the arrays of
+                a dtype.
+        """
+        if self._flat_views is None:
+            self._make_views()
+        return self._flat_views
+
+    def copy_from(self, other):
+        """Copy all the arrays of another arena of the same layout."""
+        assert self.layout == other.layout
+        self._bytes()[...] = other._bytes()
+
+    def soft_update_from(self, other, tau):
+        """Update arrays by self = (1 - tau) * self + tau * other."""
+        assert self.layout == other.layout
+        for dst, src in zip(self.flat_views(), other.flat_views()):
+            dst *= (1 - tau)
+            dst += tau * src
+
+
+def bind_params(link, arena):
+    """Replace params of a link with views of an arena.
+
+    Params whose names are not in the arena are left as they are.
+
+    Args:
+        link (chainer.Link): Link whose params are replaced.
+        arena (Arena): Arena whose keys are names of params.
+    """
+    bound = []
+    params = list(link.namedparams())
+    for param_name, param in params:
+        if param_name in arena:
+            param.data = arena[param_name]
+            bound.append((param, param.data))
+    if len(bound) == len(params) == len(arena):
+        batch_norms = [child for _, child in link.namedlinks()
+                       if isinstance(child, L.BatchNormalization)]
+        _bindings[link] = (arena, bound, batch_norms)
+    else:
+        _bindings.pop(link, None)
+
+
+def _get_binding(link):
+    binding = _bindings.get(link)
+    if binding is None:
+        return None
+    # Params may have been replaced after they are bound
+    for param, view in binding[1]:
+        if param.data is not view:
+            del _bindings[link]
+            return None
+    return binding
+
+
+def get_param_arena(link):
+    """Return the arena that holds all the params of a link.
+
+    Args:
+        link (chainer.Link): Link.
+    Returns:
+        Arena or None: Arena bound by `bind_params` if all the params of the
+            link are still its views, otherwise None.
+    """
+    binding = _get_binding(link)
+    return binding[0] if binding is not None else None
+
+
+def get_flat_pair(target_link, source_link):
+    """Return bindings of two links if their arenas have the same layout.
+
+    Returns:
+        tuple or None: (arena, batch_norms) of target_link and those of
+            source_link, where batch_norms is the list of BatchNormalization
+            links of each link, or None.
+    """
+    target = _get_binding(target_link)
+    if target is None:
+        return None
+    source = _get_binding(source_link)
+    if source is None or target[0].layout != source[0].layout:
+        return None
+    return (target[0], target[2]), (source[0], source[2])
+
+
+def make_params_contiguous(link):
+    """Lay out the params of a link in a process-local arena.
+
+    Copies between two links whose params are laid out in arenas of the same
+    layout, e.g. a process-local model and its globally shared model, are
+    done at once over the flat buffers by `chainerrl.misc.copy_param`.
+
+    Args:
+        link (chainer.Link): Link whose params are replaced. Links with
+            uninitialized params are left as they are.
+    Returns:
+        Arena or None: Arena if the params are replaced, otherwise None.
+    """
+    params = list(link.namedparams())
+    if any(param.data is None for _, param in params):
+        return None
+    arena = Arena(((name, param.data) for name, param in params),
+                  shared=False)
+    bind_params(link, arena)
+    return arena
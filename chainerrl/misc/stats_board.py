@@ -0,0 +1,169 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import multiprocessing as mp
+
+import numpy as np
+
+# Number of 8-byte values per slot so that slots of different workers are on
+# different cache lines
+_SLOT_SIZE = 8
+
+
+class StatsBoard(object):
+    """Per-worker slots in shared memory for step counts and statistics.
+
+    Each worker writes only to its own slot, so no lock is needed, and
+    readers aggregate all the slots. Since a count is the sum of slots that
+    are updated concurrently, readers may miss increments that are being
+    made, but counts never decrease.
+
+    Args:
+        n_workers (int): Number of workers.
+        stat_names (list of str): Names of the values of
+            `Agent.get_statistics` that workers can write. Values of other
+            names are ignored.
+    """
+
+    def __init__(self, n_workers, stat_names=()):
+        self.n_workers = n_workers
+        self.stat_names = tuple(stat_names)
+        n_stat_slots = max(1, -(-len(self.stat_names) // _SLOT_SIZE))
+        self._stat_slot_size = n_stat_slots * _SLOT_SIZE
+        self._steps = mp.RawArray('l', n_workers * _SLOT_SIZE)
+        self._episodes = mp.RawArray('l', n_workers * _SLOT_SIZE)
+        self._updates = mp.RawArray('l', n_workers * _SLOT_SIZE)
+        self._last_returns = mp.RawArray('d', n_workers * _SLOT_SIZE)
+        self._stats = mp.RawArray(
+            'd', n_workers * self._stat_slot_size)
+        self._views = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_views'] = None
+        return state
+
+    def _get_views(self):
+        if self._views is None:
+            def view(raw_array, slot_size, dtype):
+                return np.frombuffer(raw_array, dtype=dtype).reshape(
+                    self.n_workers, slot_size)
+            self._views = {
+                'steps': view(self._steps, _SLOT_SIZE, np.dtype('l'))[:, 0],
+                'episodes': view(
+                    self._episodes, _SLOT_SIZE, np.dtype('l'))[:, 0],
+                'updates': view(
+                    self._updates, _SLOT_SIZE, np.dtype('l'))[:, 0],
+                'last_returns': view(
+                    self._last_returns, _SLOT_SIZE, np.float64)[:, 0],
+                'stats': view(self._stats, self._stat_slot_size,
+                              np.float64)[:, :len(self.stat_names)],
+            }
+        return self._views
+
+    # Methods for writers
+
+    def add_step(self, index):
+        """Count a step of a worker."""
+        self._steps[index * _SLOT_SIZE] += 1
+
+    def add_episode(self, index, episode_return):
+        """Count an episode of a worker and record its return."""
+        self._last_returns[index * _SLOT_SIZE] = episode_return
+        self._episodes[index * _SLOT_SIZE] += 1
+
+    def set_statistics(self, index, statistics, n_updates=None):
+        """Record statistics of a worker.
+
+        Args:
+            index (int): Index of the worker.
+            statistics (list): (name, value) pairs returned by
+                `Agent.get_statistics`.
+            n_updates (int): Number of updates made by the worker so far.
+        """
+        stats = self._get_views()['stats'][index]
+        for name, value in statistics:
+            if name in self.stat_names:
+                stats[self.stat_names.index(name)] = value
+        if n_updates is not None:
+            self._updates[index * _SLOT_SIZE] = n_updates
+
+    # Methods for readers
+
+    @property
+    def value(self):
+        """Total number of steps of all the workers.
+
+        This property makes a board usable in place of a
+        `multiprocessing.Value` counter.
+        """
+        return int(self._get_views()['steps'].sum())
+
+    @property
+    def episodes(self):
+        """Total number of episodes of all the workers."""
+        return int(self._get_views()['episodes'].sum())
+
+    def worker_steps(self):
+        return self._get_views()['steps'].copy()
+
+    def worker_updates(self):
+        return self._get_views()['updates'].copy()
+
+    def get_statistics(self):
+        """Return statistics averaged over the workers.
+
+        Returns:
+            list: (name, value) pairs of the mean of the last episode returns
+                and the statistics of workers that have finished at least one
+                episode.
+        """
+        views = self._get_views()
+        reported = views['episodes'] > 0
+        if not reported.any():
+            return []
+        stats = [('mean_last_return',
+                  float(views['last_returns'][reported].mean()))]
+        means = views['stats'][reported].mean(axis=0)
+        stats.extend(zip(self.stat_names, (float(v) for v in means)))
+        return stats
+
+
+class ThroughputMeter(object):
+    """Compute throughput from the differences of a StatsBoard's counts.
+
+    Args:
+        board (StatsBoard): Board to read.
+        t (float): Current time in seconds.
+    """
+
+    def __init__(self, board, t):
+        self.board = board
+        self.prev_t = t
+        self.prev_steps = board.worker_steps()
+        self.prev_updates = board.worker_updates()
+
+    def measure(self, t):
+        """Return throughput since the last measurement.
+
+        Args:
+            t (float): Current time in seconds.
+        Returns:
+            tuple: Global steps/sec, ndarray of steps/sec of each worker and
+                updates/sec of all the workers.
+        """
+        steps = self.board.worker_steps()
+        updates = self.board.worker_updates()
+        elapsed = max(t - self.prev_t, 1e-8)
+        worker_steps_per_sec = (steps - self.prev_steps) / elapsed
+        updates_per_sec = (updates - self.prev_updates).sum() / elapsed
+        self.prev_t = t
+        self.prev_steps = steps
+        self.prev_updates = updates
+        return (worker_steps_per_sec.sum(), worker_steps_per_sec,
+                updates_per_sec)
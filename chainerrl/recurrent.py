@@ -13,6 +13,7 @@ import collections
 import contextlib
 
 import chainer
+from chainer import cuda
 
 
 def unchain_backward(state):
@@ -234,3 +235,60 @@ def state_reset(link):
         link.pop_state()
     else:
         yield
+
+
+@contextlib.contextmanager
+def state_set(link, state):
+    """Sets a given state to a link while keeping its previous state.
+
+    This is a context manager that saves the current state of the link and
+    sets a given state to it before entering the context, and then restores
+    the saved state after escaping the context. If the given state is None,
+    the link is reset to the initial state instead.
+
+    This is useful to keep separate states of a link, e.g. a batch of states
+    for multiple environments. This will just ignore non-Recurrent links.
+
+       .. code-block:: python
+
+          with state_set(link, batch_state):
+              y = link(x)
+              batch_state = link.get_state()
+    """
+    if isinstance(link, Recurrent):
+        link.push_state()
+        if state is not None:
+            link.set_state(state)
+        yield
+        link.pop_state()
+    else:
+        yield
+
+
+def mask_recurrent_state_at(state, indices):
+    """Resets recurrent states at given indices of a batch to zeros.
+
+    The zero state is regarded as the initial state, which is the case for
+    chainer.links.LSTM. Computational graphs of Variables are kept.
+
+    Args:
+        state (object): State returned by get_state of a link that has
+            processed a batch, which is a nested tuple or list of Variables,
+            arrays or None.
+        indices (list of int): Indices of the batch to reset.
+    Returns:
+        object: New state.
+    """
+    if state is None:
+        return None
+    if isinstance(state, (tuple, list)):
+        return type(state)(mask_recurrent_state_at(s, indices)
+                           for s in state)
+    if isinstance(state, chainer.Variable):
+        data = state.data
+    else:
+        data = state
+    xp = cuda.get_array_module(data)
+    mask = xp.ones_like(data)
+    mask[indices] = 0
+    return state * mask
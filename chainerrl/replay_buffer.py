@@ -11,13 +11,24 @@ from abc import ABCMeta
 from abc import abstractmethod
 from abc import abstractproperty
 import collections
-
+import functools
+import json
+import multiprocessing as mp
+import os
+import tempfile
+import threading
+import uuid
+
+from chainer import cuda
 import numpy as np
 import six.moves.cPickle as pickle
+from six.moves import queue
 
 from chainerrl.misc.batch_states import batch_states
 from chainerrl.misc.collections import RandomAccessQueue
+from chainerrl.misc.makedirs import makedirs
 from chainerrl.misc.prioritized import PrioritizedBuffer
+from chainerrl.misc.random import sample_n_k
 
 
 class AbstractReplayBuffer(with_metaclass(ABCMeta, object)):
@@ -29,7 +40,7 @@ class AbstractReplayBuffer(with_metaclass(ABCMeta, object)):
 
     @abstractmethod
     def append(self, state, action, reward, next_state=None, next_action=None,
-               is_state_terminal=False):
+               is_state_terminal=False, env_id=0):
         """Append a transition to this replay buffer.
 
         Args:
@@ -39,6 +50,11 @@ class AbstractReplayBuffer(with_metaclass(ABCMeta, object)):
             next_state: s_{t+1} (can be None if terminal)
             next_action: a_{t+1} (can be None for off-policy algorithms)
             is_state_terminal (bool)
+            env_id (object): Hashable identifier of the environment the
+                transition comes from. Transitions of different environments
+                are regarded as those of different episodes, so that
+                transitions of multiple environments can be appended
+                alternately.
         """
         raise NotImplementedError
 
@@ -64,19 +80,21 @@ class AbstractReplayBuffer(with_metaclass(ABCMeta, object)):
 
     @abstractmethod
     def save(self, filename):
-        """Save the content of the buffer to a file.
+        """Save the content of the buffer.
 
         Args:
-            filename (str): Path to a file.
+            filename (str): Path to a file, or to a directory for array-backed
+                buffers (e.g. ArrayReplayBuffer), which save transitions
+                incrementally as .npy shards.
         """
         raise NotImplementedError
 
     @abstractmethod
     def load(self, filename):
-        """Load the content of the buffer from a file.
+        """Load the content of the buffer.
 
         Args:
-            filename (str): Path to a file.
+            filename (str): Path to a file or a directory given to `save`.
         """
         raise NotImplementedError
 
@@ -113,7 +131,7 @@ class AbstractEpisodicReplayBuffer(AbstractReplayBuffer):
         raise NotImplementedError
 
     @abstractmethod
-    def stop_current_episode(self):
+    def stop_current_episode(self, env_id=0):
         """Notify the buffer that the current episode is interrupted.
 
         You may want to interrupt the current episode and start a new one
@@ -124,21 +142,104 @@ class AbstractEpisodicReplayBuffer(AbstractReplayBuffer):
 
         This method should not be called after an episode whose termination is
         already notified by appending a transition with is_state_terminal=True.
+
+        Args:
+            env_id (object): Identifier of the environment whose episode is
+                interrupted.
         """
         raise NotImplementedError
 
 
+class NStepWindow(object):
+    """Window that folds consecutive transitions into n-step transitions.
+
+    An n-step transition has the state and the action of its first
+    transition, the discounted sum of rewards of up to n transitions as its
+    reward, the next state, the next action and the terminal flag of its
+    last transition, and `discount`, gamma to the power of the number of
+    folded transitions, by which the value of the next state is discounted.
+    Transitions closer than n steps to the end of an episode are folded with
+    fewer transitions.
+
+    Args:
+        n_step (int): Maximum number of transitions folded.
+        gamma (float): Discount factor.
+    """
+
+    def __init__(self, n_step, gamma):
+        assert n_step >= 1
+        self.n_step = n_step
+        self.gamma = gamma
+        self.pending = collections.deque()
+
+    def _fold(self):
+        first = self.pending[0]
+        last = self.pending[-1]
+        transition = dict(first)
+        reward = 0
+        for k, trans in enumerate(self.pending):
+            reward += self.gamma ** k * trans['reward']
+        transition['reward'] = reward
+        transition['next_state'] = last['next_state']
+        transition['next_action'] = last['next_action']
+        transition['is_state_terminal'] = last['is_state_terminal']
+        transition['discount'] = self.gamma ** len(self.pending)
+        return transition
+
+    def append(self, transition):
+        """Append a transition and return completed n-step transitions.
+
+        Args:
+            transition (dict): Transition.
+        Returns:
+            list of n-step transition dicts.
+        """
+        self.pending.append(transition)
+        if transition['is_state_terminal']:
+            return self.flush()
+        if len(self.pending) < self.n_step:
+            return []
+        folded = self._fold()
+        self.pending.popleft()
+        return [folded]
+
+    def flush(self):
+        """Return all the pending n-step transitions, e.g. at episode end.
+
+        Returns:
+            list of n-step transition dicts.
+        """
+        folded = []
+        while self.pending:
+            folded.append(self._fold())
+            self.pending.popleft()
+        return folded
+
+
 class ReplayBuffer(AbstractReplayBuffer):
+    """Replay buffer that stores transitions in a list.
 
-    def __init__(self, capacity=None):
+    Args:
+        capacity (int or None): Maximum number of transitions stored.
+        n_step (int): If greater than 1, transitions are folded into n-step
+            transitions when they are appended. See NStepWindow.
+        gamma (float or None): Discount factor used if n_step > 1.
+    """
+
+    def __init__(self, capacity=None, n_step=1, gamma=None):
         self.memory = RandomAccessQueue(maxlen=capacity)
+        self.n_step_windows = _make_n_step_windows(n_step, gamma)
 
     def append(self, state, action, reward, next_state=None, next_action=None,
-               is_state_terminal=False):
+               is_state_terminal=False, env_id=0):
         experience = dict(state=state, action=action, reward=reward,
                           next_state=next_state, next_action=next_action,
                           is_state_terminal=is_state_terminal)
-        self.memory.append(experience)
+        if self.n_step_windows is None:
+            self.memory.append(experience)
+        else:
+            for folded in self.n_step_windows[env_id].append(experience):
+                self.memory.append(folded)
 
     def sample(self, n):
         assert len(self.memory) >= n
@@ -159,10 +260,933 @@ class ReplayBuffer(AbstractReplayBuffer):
             self.memory = RandomAccessQueue(
                 self.memory, maxlen=self.memory.maxlen)
 
-    def stop_current_episode(self):
+    def stop_current_episode(self, env_id=0):
+        if self.n_step_windows is not None and env_id in self.n_step_windows:
+            for folded in self.n_step_windows.pop(env_id).flush():
+                self.memory.append(folded)
+
+
+def _make_n_step_windows(n_step, gamma):
+    """Return a dict that makes an NStepWindow for each env on demand."""
+    if n_step == 1:
+        return None
+    if gamma is None:
+        raise ValueError('gamma must be given if n_step > 1')
+    return collections.defaultdict(
+        functools.partial(NStepWindow, n_step, gamma))
+
+
+_SHARD_INDEX_FILENAME = 'index.json'
+
+
+def _shard_filename(dirname, ring, key, start, stop):
+    return os.path.join(
+        dirname, '{}.{}.{}-{}.npy'.format(ring, key, start, stop))
+
+
+def _read_shard_index(dirname):
+    path = os.path.join(dirname, _SHARD_INDEX_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _save_ring_shards(dirname, buffer_id, rings, attrs):
+    """Save ring buffers to a directory as .npy shards incrementally.
+
+    Each ring buffer is given as a pair of a dict of arrays of the same length
+    and the number of elements ever written, where the element written n-th
+    is stored at index n % length. Only elements written after the last save
+    to the same directory are saved as new shards, and shards whose elements
+    are all overwritten are removed. The index file is replaced atomically
+    after new shards are written, so an interrupted save leaves the previous
+    checkpoint intact.
+
+    Args:
+        dirname (str): Path to a directory.
+        buffer_id (str): Identifier of a buffer. Shards in the directory are
+            reused only if they are saved with the same identifier.
+        rings (dict): Pairs of arrays and counts keyed by names.
+        attrs (dict): JSON-serializable attributes saved in the index file.
+    """
+    makedirs(dirname, exist_ok=True)
+    old_index = _read_shard_index(dirname)
+    obsolete_files = []
+    if old_index is None:
+        old_rings = {}
+    elif old_index['buffer_id'] == buffer_id:
+        old_rings = old_index['rings']
+    else:
+        # Shards of another buffer are overwritten
+        old_rings = {}
+        for name, entry in old_index['rings'].items():
+            for start, stop in entry['shards']:
+                obsolete_files.extend(
+                    _shard_filename(dirname, name, key, start, stop)
+                    for key in entry['keys'])
+    index = {'buffer_id': buffer_id, 'attrs': attrs, 'rings': {}}
+
+    for name, (columns, n_total) in rings.items():
+        entry = old_rings.get(name)
+        if (entry is None or entry['n_saved'] > n_total or
+                set(entry['keys']) != set(columns.keys())):
+            if entry is not None:
+                for start, stop in entry['shards']:
+                    obsolete_files.extend(
+                        _shard_filename(dirname, name, key, start, stop)
+                        for key in entry['keys'])
+            entry = {'n_saved': 0, 'shards': [], 'keys': list(columns)}
+        if columns:
+            capacity = len(next(iter(columns.values())))
+            start = max(entry['n_saved'], n_total - capacity)
+            if start < n_total:
+                indices = np.arange(start, n_total) % capacity
+                for key, column in columns.items():
+                    np.save(
+                        _shard_filename(dirname, name, key, start, n_total),
+                        column[indices])
+                entry['shards'].append([start, n_total])
+            # Shards whose elements are all overwritten are not needed
+            shards = []
+            for start, stop in entry['shards']:
+                if stop <= n_total - capacity:
+                    obsolete_files.extend(
+                        _shard_filename(dirname, name, key, start, stop)
+                        for key in entry['keys'])
+                else:
+                    shards.append([start, stop])
+            entry['shards'] = shards
+        entry['n_saved'] = n_total
+        index['rings'][name] = entry
+
+    index_path = os.path.join(dirname, _SHARD_INDEX_FILENAME)
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.rename(tmp_path, index_path)
+    for filename in obsolete_files:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+def _load_ring_shards(dirname):
+    """Load ring buffers saved by _save_ring_shards.
+
+    Shards are memory-mapped, so they are read from the disk only when
+    accessed.
+
+    Returns:
+        buffer_id (str)
+        attrs (dict)
+        rings (dict): Pairs of the number of elements ever written and a list
+            of (start, stop, dict of memory-mapped arrays) keyed by names.
+    """
+    index = _read_shard_index(dirname)
+    if index is None:
+        raise IOError('No replay buffer is saved in {}'.format(dirname))
+    rings = {}
+    for name, entry in index['rings'].items():
+        shards = []
+        for start, stop in entry['shards']:
+            shards.append((start, stop, dict(
+                (key, np.load(
+                    _shard_filename(dirname, name, key, start, stop),
+                    mmap_mode='r'))
+                for key in entry['keys'])))
+        rings[name] = (entry['n_saved'], shards)
+    return index['buffer_id'], index['attrs'], rings
+
+
+def _allocate_ring_columns(shards, capacity):
+    """Allocate ring buffers that can hold the data of given shards."""
+    if not shards:
+        return None
+    columns = collections.OrderedDict()
+    for key, array in sorted(shards[0][2].items()):
+        columns[key] = np.zeros(
+            (capacity,) + array.shape[1:], dtype=array.dtype)
+    return columns
+
+
+def _copy_shards_to_ring(shards, n_total, columns):
+    """Copy the last elements of shards to ring buffers."""
+    for start, stop, arrays in shards:
+        for key, column in columns.items():
+            capacity = len(column)
+            lo = max(start, n_total - capacity)
+            if lo < stop:
+                column[np.arange(lo, stop) % capacity] = \
+                    arrays[key][lo - start:]
+
+
+class _LazyRingColumn(object):
+    """Ring buffer column that reads loaded elements from shards on demand.
+
+    Elements loaded by _load_ring_shards stay in the memory-mapped shards
+    until they are read or overwritten, so loading a buffer does not read all
+    of its data from the disk. Reads and writes are done on an in-memory
+    ndarray, to which the elements to read are copied from the shards first.
+    Once every loaded element is read or overwritten, the shards are released.
+
+    Args:
+        shards (list): List of (start, stop, dict of arrays) of a ring.
+        key (str): Key of the column in the shards.
+        n_total (int): Number of elements ever written to the ring.
+        capacity (int): Length of the ring buffer.
+    """
+
+    def __init__(self, shards, key, n_total, capacity):
+        first = shards[0][2][key]
+        self.array = np.zeros(
+            (capacity,) + first.shape[1:], dtype=first.dtype)
+        self.n_total = n_total
+        self.starts = np.asarray([start for start, _, _ in shards])
+        self.shard_arrays = [arrays[key] for _, _, arrays in shards]
+        # Elements of global indices [lo, n_total) are still in the shards
+        lo = max(n_total - capacity, shards[0][0])
+        self.pending = np.zeros(capacity, dtype=np.bool_)
+        self.pending[np.arange(lo, n_total) % capacity] = True
+        self.n_pending = max(0, n_total - lo)
+        if self.n_pending == 0:
+            self._release()
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def dtype(self):
+        return self.array.dtype
+
+    def __len__(self):
+        return len(self.array)
+
+    def _rows(self, index):
+        """Return ring indices referred to by an index as a flat array."""
+        if isinstance(index, (int, np.integer)):
+            return np.asarray([index % len(self.array)])
+        if isinstance(index, slice):
+            return np.arange(*index.indices(len(self.array)))
+        index = np.asarray(index)
+        if index.dtype == np.bool_:
+            return np.flatnonzero(index)
+        return index.ravel() % len(self.array)
+
+    def _release(self):
+        self.pending = None
+        self.starts = None
+        self.shard_arrays = None
+
+    def _fill(self, index):
+        rows = np.unique(self._rows(index))
+        rows = rows[self.pending[rows]]
+        if rows.size == 0:
+            return
+        capacity = len(self.array)
+        global_indices = (self.n_total - 1 -
+                          (self.n_total - 1 - rows) % capacity)
+        shard_ids = np.searchsorted(
+            self.starts, global_indices, side='right') - 1
+        for shard_id in np.unique(shard_ids):
+            selected = shard_ids == shard_id
+            self.array[rows[selected]] = self.shard_arrays[shard_id][
+                global_indices[selected] - self.starts[shard_id]]
+        self._mark_filled(rows)
+
+    def _mark_filled(self, rows):
+        rows = np.unique(rows)
+        self.n_pending -= int(np.count_nonzero(self.pending[rows]))
+        self.pending[rows] = False
+        if self.n_pending == 0:
+            self._release()
+
+    def __getitem__(self, index):
+        if self.pending is not None:
+            self._fill(index)
+        return self.array[index]
+
+    def __setitem__(self, index, value):
+        self.array[index] = value
+        if self.pending is not None:
+            self._mark_filled(self._rows(index))
+
+    def __array__(self, dtype=None):
+        if self.pending is not None:
+            self._fill(slice(None))
+        return np.asarray(self.array, dtype=dtype)
+
+
+def _map_shards_to_ring(shards, n_total, capacity):
+    """Make ring buffers that lazily read the last elements of shards.
+
+    Returns:
+        OrderedDict of _LazyRingColumn or None if there is no shard.
+    """
+    if not shards:
+        return None
+    return collections.OrderedDict(
+        (key, _LazyRingColumn(shards, key, n_total, capacity))
+        for key in sorted(shards[0][2].keys()))
+
+
+def _make_array_transition(state, action, reward, next_state, next_action,
+                           is_state_terminal, **kwargs):
+    # None is stored as zeros so that every column has a fixed shape
+    if next_state is None:
+        next_state = np.zeros_like(state)
+    if next_action is None:
+        next_action = np.zeros_like(action)
+    transition = dict(state=state, action=action, reward=reward,
+                      next_state=next_state, next_action=next_action,
+                      is_state_terminal=is_state_terminal)
+    transition.update(kwargs)
+    return transition
+
+
+def _allocate_columns(transition, length):
+    """Allocate arrays that can hold a given number of transitions."""
+    columns = collections.OrderedDict()
+    for key, value in transition.items():
+        if key == 'reward':
+            dtype = np.float32
+        elif key == 'is_state_terminal':
+            dtype = np.bool_
+        else:
+            dtype = np.asarray(value).dtype
+        columns[key] = np.zeros((length,) + np.shape(value), dtype=dtype)
+    return columns
+
+
+class ArrayReplayBuffer(AbstractReplayBuffer):
+    """Replay buffer that stores transitions in preallocated arrays.
+
+    Each field of transitions is stored in its own ring buffer of type
+    numpy.ndarray, which is allocated when the first transition is appended
+    based on its shapes and dtypes. Additional fields (e.g. `mu`) can be
+    given to `append` as keyword arguments.
+
+    Unlike ReplayBuffer, `sample` returns a dict of batched arrays instead of
+    a list of transition dicts. `batch_experiences` accepts both.
+
+    `save` and `load` take a path to a directory, where transitions are
+    stored as .npy shards. Saving to the same directory again only writes
+    transitions appended since the last save. `load` memory-maps the shards
+    and reads each transition from them only when it is first accessed.
+
+    Args:
+        capacity (int): Maximum number of transitions stored.
+        n_step (int): If greater than 1, transitions are folded into n-step
+            transitions when they are appended, which have an additional
+            field `discount`. See NStepWindow.
+        gamma (float or None): Discount factor used if n_step > 1.
+    """
+
+    def __init__(self, capacity, n_step=1, gamma=None):
+        assert capacity is not None and capacity > 0
+        self.capacity = capacity
+        self.columns = None
+        self.size = 0
+        # Number of transitions ever appended. The transition appended n-th
+        # is stored at index n % capacity.
+        self.n_appended = 0
+        self.buffer_id = uuid.uuid4().hex
+        self.n_step_windows = _make_n_step_windows(n_step, gamma)
+
+    def append(self, state, action, reward, next_state=None, next_action=None,
+               is_state_terminal=False, env_id=0, **kwargs):
+        transition = _make_array_transition(
+            state, action, reward, next_state, next_action,
+            is_state_terminal, **kwargs)
+        if self.n_step_windows is None:
+            self._append_transition(transition)
+        else:
+            for folded in self.n_step_windows[env_id].append(transition):
+                self._append_transition(folded)
+
+    def _append_transition(self, transition):
+        if self.columns is None:
+            self.columns = _allocate_columns(transition, self.capacity)
+        assert set(transition.keys()) == set(self.columns.keys())
+        i = self.n_appended % self.capacity
+        for key, value in transition.items():
+            self.columns[key][i] = value
+        self.n_appended += 1
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, n):
+        """Sample n unique transitions as a dict of batched arrays.
+
+        Args:
+            n (int): Number of transitions to sample.
+        Returns:
+            dict whose values are numpy.ndarray with n rows.
+        """
+        assert self.size >= n
+        indices = (self.n_appended - self.size +
+                   sample_n_k(self.size, n)) % self.capacity
+        return self.get_batch(indices)
+
+    def get_batch(self, indices):
+        """Gather transitions at given indices as a dict of batched arrays."""
+        return {key: column[indices]
+                for key, column in self.columns.items()}
+
+    def __len__(self):
+        return self.size
+
+    def save(self, dirname):
+        """Save transitions to a directory.
+
+        Args:
+            dirname (str): Path to a directory.
+        """
+        _save_ring_shards(
+            dirname, self.buffer_id,
+            rings={'transitions': (self.columns or {}, self.n_appended)},
+            attrs={'size': self.size})
+
+    def load(self, dirname):
+        """Load transitions from a directory.
+
+        Transitions are read lazily from the memory-mapped shards.
+
+        Args:
+            dirname (str): Path to a directory.
+        """
+        buffer_id, attrs, rings = _load_ring_shards(dirname)
+        n_appended, shards = rings['transitions']
+        self.columns = _map_shards_to_ring(shards, n_appended, self.capacity)
+        self.n_appended = n_appended
+        self.size = min(attrs['size'], self.capacity)
+        # Keep saving to the same directory incrementally
+        self.buffer_id = buffer_id
+
+    def stop_current_episode(self, env_id=0):
+        if self.n_step_windows is not None and env_id in self.n_step_windows:
+            for folded in self.n_step_windows.pop(env_id).flush():
+                self._append_transition(folded)
+
+
+class _GlobalIndexView(object):
+    """Ring-buffer-like view of a column of SpillingReplayBuffer.
+
+    Index i corresponds to the transition whose global index g satisfies
+    g % len(self) == i among the stored transitions, which allows the view to
+    be used with _save_ring_shards.
+    """
+
+    def __init__(self, rbuf, key):
+        self.rbuf = rbuf
+        self.key = key
+
+    def __len__(self):
+        return self.rbuf.size
+
+    def __getitem__(self, indices):
+        oldest = self.rbuf.n_appended - self.rbuf.size
+        global_indices = oldest + (np.asarray(indices) - oldest) % len(self)
+        return self.rbuf._gather(self.key, global_indices)
+
+
+class SpillingReplayBuffer(AbstractReplayBuffer):
+    """Replay buffer whose older transitions are spilled to the disk.
+
+    The most recent transitions are kept in preallocated arrays in memory as
+    ArrayReplayBuffer does. When a transition is discarded from memory, it is
+    written to memory-mapped segment files of a fixed number of transitions,
+    so the capacity can exceed the size of physical memory. `sample` gathers
+    transitions from both, reading those on the disk segment by segment in
+    the order of file offsets.
+
+    Like ArrayReplayBuffer, `sample` returns a dict of batched arrays. The
+    numbers of sampled transitions found in memory (hits) and on the disk
+    (misses) and the number of bytes read from the disk are counted and can be
+    obtained by `get_statistics`.
+
+    Args:
+        capacity (int): Maximum number of transitions stored.
+        memory_capacity (int): Maximum number of transitions kept in memory.
+        dirname (str or None): Directory to write segment files to. If None,
+            a temporary directory is created.
+        segment_size (int): Number of transitions per segment file.
+    """
+
+    def __init__(self, capacity, memory_capacity, dirname=None,
+                 segment_size=10 ** 4):
+        assert capacity is not None and capacity > 0
+        assert 0 < memory_capacity <= capacity
+        assert segment_size > 0
+        self.capacity = capacity
+        self.memory_capacity = memory_capacity
+        if dirname is None:
+            dirname = tempfile.mkdtemp(prefix='chainerrl_replay_')
+        else:
+            makedirs(dirname, exist_ok=True)
+        self.dirname = dirname
+        self.segment_size = segment_size
+        # Columns in memory, where the transition of global index g is
+        # stored at index g % memory_capacity
+        self.columns = None
+        # Memory-mapped columns keyed by segment ids, where the transition of
+        # global index g is stored at index g % segment_size of segment
+        # g // segment_size
+        self.segments = {}
+        # Segments of smaller ids have all been removed
+        self.oldest_segment_id = 0
+        self.size = 0
+        self.n_appended = 0
+        self.buffer_id = uuid.uuid4().hex
+        self.n_hits = 0
+        self.n_misses = 0
+        self.bytes_read = 0
+
+    @property
+    def memory_size(self):
+        """Number of transitions kept in memory."""
+        return min(self.size, self.memory_capacity)
+
+    def _segment_filename(self, segment_id, key):
+        return os.path.join(
+            self.dirname, 'segment{}.{}.npy'.format(segment_id, key))
+
+    def _get_segment(self, segment_id):
+        if segment_id not in self.segments:
+            self.segments[segment_id] = collections.OrderedDict(
+                (key, np.lib.format.open_memmap(
+                    self._segment_filename(segment_id, key), mode='w+',
+                    dtype=column.dtype,
+                    shape=(self.segment_size,) + column.shape[1:]))
+                for key, column in self.columns.items())
+        return self.segments[segment_id]
+
+    def _remove_segment(self, segment_id):
+        if segment_id in self.segments:
+            del self.segments[segment_id]
+            for key in self.columns.keys():
+                os.remove(self._segment_filename(segment_id, key))
+
+    def _remove_old_segments(self):
+        # Segments are removed in order, so only a segment boundary crossed
+        # by the oldest transition needs to be checked
+        oldest = self.n_appended - self.size
+        while (self.oldest_segment_id + 1) * self.segment_size <= oldest:
+            self._remove_segment(self.oldest_segment_id)
+            self.oldest_segment_id += 1
+
+    def _spill(self, global_index):
+        """Write a transition in memory to the disk."""
+        segment = self._get_segment(global_index // self.segment_size)
+        i = global_index % self.memory_capacity
+        j = global_index % self.segment_size
+        for key, column in self.columns.items():
+            segment[key][j] = column[i]
+
+    def append(self, state, action, reward, next_state=None, next_action=None,
+               is_state_terminal=False, env_id=0, **kwargs):
+        transition = _make_array_transition(
+            state, action, reward, next_state, next_action,
+            is_state_terminal, **kwargs)
+        if self.columns is None:
+            self.columns = _allocate_columns(
+                transition, self.memory_capacity)
+        assert set(transition.keys()) == set(self.columns.keys())
+        # The transition to be overwritten in memory is spilled if it is
+        # still within the capacity
+        discarded = self.n_appended - self.memory_capacity
+        if discarded >= 0 and discarded >= self.n_appended + 1 - self.capacity:
+            self._spill(discarded)
+        i = self.n_appended % self.memory_capacity
+        for key, value in transition.items():
+            self.columns[key][i] = value
+        self.n_appended += 1
+        self.size = min(self.size + 1, self.capacity)
+        self._remove_old_segments()
+
+    def _gather(self, key, global_indices):
+        """Gather values of a field of transitions at given global indices."""
+        global_indices = np.asarray(global_indices, dtype=np.int64)
+        column = self.columns[key]
+        values = np.empty((len(global_indices),) + column.shape[1:],
+                          dtype=column.dtype)
+        in_memory = (global_indices >=
+                     self.n_appended - self.memory_size)
+        values[in_memory] = column[
+            global_indices[in_memory] % self.memory_capacity]
+        # Read the rest from the disk in the order of file offsets
+        on_disk = np.flatnonzero(~in_memory)
+        on_disk = on_disk[np.argsort(global_indices[on_disk])]
+        segment_ids = global_indices[on_disk] // self.segment_size
+        for segment_id in np.unique(segment_ids):
+            idx = on_disk[segment_ids == segment_id]
+            values[idx] = self.segments[segment_id][key][
+                global_indices[idx] % self.segment_size]
+            self.bytes_read += values[idx].nbytes
+        return values
+
+    def _scatter(self, key, global_indices, values):
+        """Write values of a field of transitions at given global indices."""
+        global_indices = np.asarray(global_indices, dtype=np.int64)
+        in_memory = (global_indices >=
+                     self.n_appended - self.memory_size)
+        self.columns[key][global_indices[in_memory] % self.memory_capacity] = \
+            values[in_memory]
+        on_disk = np.flatnonzero(~in_memory)
+        segment_ids = global_indices[on_disk] // self.segment_size
+        for segment_id in np.unique(segment_ids):
+            idx = on_disk[segment_ids == segment_id]
+            self._get_segment(segment_id)[key][
+                global_indices[idx] % self.segment_size] = values[idx]
+
+    def sample(self, n):
+        """Sample n unique transitions as a dict of batched arrays.
+
+        Args:
+            n (int): Number of transitions to sample.
+        Returns:
+            dict whose values are numpy.ndarray with n rows.
+        """
+        assert self.size >= n
+        global_indices = (self.n_appended - self.size +
+                          sample_n_k(self.size, n))
+        n_hits = int(np.count_nonzero(
+            global_indices >= self.n_appended - self.memory_size))
+        self.n_hits += n_hits
+        self.n_misses += n - n_hits
+        return self.get_batch(global_indices)
+
+    def get_batch(self, global_indices):
+        """Gather transitions at given global indices."""
+        return {key: self._gather(key, global_indices)
+                for key in self.columns.keys()}
+
+    def __len__(self):
+        return self.size
+
+    def get_statistics(self):
+        return [
+            ('n_hits', self.n_hits),
+            ('n_misses', self.n_misses),
+            ('bytes_read', self.bytes_read),
+        ]
+
+    def save(self, dirname):
+        """Save transitions to a directory.
+
+        The format is the same as that of ArrayReplayBuffer.
+
+        Args:
+            dirname (str): Path to a directory.
+        """
+        if self.columns is None:
+            columns = {}
+        else:
+            columns = dict((key, _GlobalIndexView(self, key))
+                           for key in self.columns.keys())
+        _save_ring_shards(
+            dirname, self.buffer_id,
+            rings={'transitions': (columns, self.n_appended)},
+            attrs={'size': self.size})
+
+    def load(self, dirname):
+        """Load transitions from a directory.
+
+        Unlike ArrayReplayBuffer, transitions are copied eagerly, since those
+        that do not fit in memory must be written to segment files anyway.
+
+        Args:
+            dirname (str): Path to a directory.
+        """
+        buffer_id, attrs, rings = _load_ring_shards(dirname)
+        n_appended, shards = rings['transitions']
+        if self.columns is not None:
+            for segment_id in list(self.segments.keys()):
+                self._remove_segment(segment_id)
+        self.columns = _allocate_ring_columns(shards, self.memory_capacity)
+        self.n_appended = n_appended
+        self.size = min(attrs['size'], self.capacity)
+        oldest = self.n_appended - self.size
+        self.oldest_segment_id = oldest // self.segment_size
+        for start, stop, arrays in shards:
+            start = max(start, oldest)
+            if start < stop:
+                for key in self.columns.keys():
+                    self._scatter(key, np.arange(start, stop),
+                                  arrays[key][start - stop:])
+        self.buffer_id = buffer_id
+
+    def stop_current_episode(self, env_id=0):
         pass
 
 
+def _same_frames(a, b):
+    return all(x is y or np.array_equal(x, y) for x, y in zip(a, b))
+
+
+class FrameStackReplayBuffer(AbstractReplayBuffer):
+    """Replay buffer that stores each frame of stacked observations once.
+
+    Observations are assumed to be sequences of `n_frames` frames of the same
+    shape and dtype where the next observation is made by dropping the oldest
+    frame and adding a new one, e.g. `chainerrl.envs.ale.ALE.state`. Instead of
+    keeping every stacked observation, frames are written once to a circular
+    frame store and stacked observations are rebuilt from frame indices when
+    transitions are sampled. Leading all-zero frames of the initial
+    observation of an episode are not stored but restored as zero padding.
+
+    Transitions that do not follow this pattern (e.g. the next state of a
+    terminal transition that is identical to the state) are still stored
+    exactly, at the cost of storing some frames more than once. Frames are
+    shared only between consecutive transitions of the same environment, so
+    transitions of multiple environments appended alternately do not share
+    frames.
+
+    Like ArrayReplayBuffer, `sample` returns a dict of batched arrays, where
+    `state` and `next_state` have shape (n, n_frames) + frame shape.
+
+    Args:
+        capacity (int): Maximum number of transitions stored.
+        n_frames (int): Number of frames of each observation.
+        frame_capacity (int or None): Maximum number of frames stored. Oldest
+            transitions are discarded when their frames are overwritten. If
+            None, capacity + capacity // 10 (but at least 2 * n_frames) is
+            used, which leaves room for frames of initial observations of
+            episodes.
+    """
+
+    def __init__(self, capacity, n_frames=4, frame_capacity=None):
+        assert capacity is not None and capacity > 0
+        assert n_frames >= 1
+        if frame_capacity is None:
+            frame_capacity = max(capacity + capacity // 10, 2 * n_frames)
+        # Frames of two consecutive observations must fit in the store
+        assert frame_capacity >= 2 * n_frames
+        self.capacity = capacity
+        self.n_frames = n_frames
+        self.frame_capacity = frame_capacity
+        self.frames = None
+        self.n_written_frames = 0
+        # Per-transition columns. Stacked observations are represented by
+        # the global index of their newest frame and the global index of the
+        # first frame of the chain they belong to, before which frames are
+        # regarded as zero padding.
+        self.columns = None
+        self.first = 0
+        self.size = 0
+        self.n_appended = 0
+        self.buffer_id = uuid.uuid4().hex
+        # Index and chain start of the last next_state, and the observation
+        # itself to check if it is continued by the next transition
+        self.last_next_state = None
+        self.last_next_index = None
+        self.last_next_chain_start = None
+        self.last_env_id = None
+
+    def _allocate(self, frame, action, next_action):
+        self.frames = np.zeros(
+            (self.frame_capacity,) + np.shape(frame),
+            dtype=np.asarray(frame).dtype)
+        self.columns = {
+            'state_index': np.zeros(self.capacity, dtype=np.int64),
+            'state_chain_start': np.zeros(self.capacity, dtype=np.int64),
+            'next_state_index': np.zeros(self.capacity, dtype=np.int64),
+            'next_state_chain_start': np.zeros(self.capacity, dtype=np.int64),
+            'action': np.zeros((self.capacity,) + np.shape(action),
+                               dtype=np.asarray(action).dtype),
+            'reward': np.zeros(self.capacity, dtype=np.float32),
+            'next_action': np.zeros((self.capacity,) + np.shape(next_action),
+                                    dtype=np.asarray(next_action).dtype),
+            'is_state_terminal': np.zeros(self.capacity, dtype=np.bool_),
+        }
+
+    def _oldest_frame_index(self, i):
+        """Return the global index of the oldest frame a transition uses."""
+        return max(self.columns['state_index'][i] - self.n_frames + 1,
+                   self.columns['state_chain_start'][i])
+
+    def _popleft(self):
+        self.first = (self.first + 1) % self.capacity
+        self.size -= 1
+
+    def _write_frames(self, frames):
+        """Write frames to the store.
+
+        Transitions that use frames overwritten by them are discarded.
+        """
+        limit = self.n_written_frames + len(frames) - self.frame_capacity
+        while self.size > 0 and self._oldest_frame_index(self.first) < limit:
+            self._popleft()
+        for frame in frames:
+            self.frames[self.n_written_frames % self.frame_capacity] = frame
+            self.n_written_frames += 1
+
+    def _write_new_chain(self, obs):
+        """Write all the frames of an observation as a new chain."""
+        assert len(obs) == self.n_frames
+        # Leading zero frames are restored as padding, except the last one
+        n_pad = 0
+        while n_pad < self.n_frames - 1 and not np.any(obs[n_pad]):
+            n_pad += 1
+        chain_start = self.n_written_frames
+        self._write_frames(obs[n_pad:])
+        return self.n_written_frames - 1, chain_start
+
+    def append(self, state, action, reward, next_state=None, next_action=None,
+               is_state_terminal=False, env_id=0):
+        if next_state is None:
+            next_state = state
+        if next_action is None:
+            next_action = np.zeros_like(action)
+        if self.frames is None:
+            self._allocate(state[0], action, next_action)
+
+        # State
+        if (self.last_next_state is not None and
+                self.last_env_id == env_id and
+                _same_frames(self.last_next_state, state)):
+            state_index = self.last_next_index
+            state_chain_start = self.last_next_chain_start
+        else:
+            state_index, state_chain_start = self._write_new_chain(state)
+
+        # Next state
+        if (state_index == self.n_written_frames - 1 and
+                _same_frames(state[1:], next_state[:-1])):
+            # Shifted by one frame, which is the most common case
+            self._write_frames(next_state[-1:])
+            next_state_index = self.n_written_frames - 1
+            next_state_chain_start = state_chain_start
+        elif _same_frames(state, next_state):
+            next_state_index = state_index
+            next_state_chain_start = state_chain_start
+        else:
+            next_state_index, next_state_chain_start = \
+                self._write_new_chain(next_state)
+
+        # Frames used by this transition must not have been overwritten
+        assert (max(state_index - self.n_frames + 1, state_chain_start) >=
+                self.n_written_frames - self.frame_capacity)
+
+        if self.size == self.capacity:
+            self._popleft()
+        i = (self.first + self.size) % self.capacity
+        self.columns['state_index'][i] = state_index
+        self.columns['state_chain_start'][i] = state_chain_start
+        self.columns['next_state_index'][i] = next_state_index
+        self.columns['next_state_chain_start'][i] = next_state_chain_start
+        self.columns['action'][i] = action
+        self.columns['reward'][i] = reward
+        self.columns['next_action'][i] = next_action
+        self.columns['is_state_terminal'][i] = is_state_terminal
+        self.size += 1
+        self.n_appended += 1
+
+        # Only the next transition of the same env can continue this one
+        if is_state_terminal:
+            self.stop_current_episode(env_id=self.last_env_id)
+        else:
+            self.last_next_state = next_state
+            self.last_next_index = next_state_index
+            self.last_next_chain_start = next_state_chain_start
+            self.last_env_id = env_id
+
+    def _stack_frames(self, index, chain_start):
+        # (batch_size, n_frames)
+        frame_indices = (index[:, None] -
+                         np.arange(self.n_frames - 1, -1, -1)[None])
+        stacked = self.frames[frame_indices % self.frame_capacity]
+        stacked[frame_indices < chain_start[:, None]] = 0
+        return stacked
+
+    def sample(self, n):
+        """Sample n unique transitions as a dict of batched arrays.
+
+        Args:
+            n (int): Number of transitions to sample.
+        Returns:
+            dict whose values are numpy.ndarray with n rows.
+        """
+        assert self.size >= n
+        indices = (self.first + sample_n_k(self.size, n)) % self.capacity
+        return self.get_batch(indices)
+
+    def get_batch(self, indices):
+        """Gather transitions at given indices as a dict of batched arrays."""
+        c = self.columns
+        return {
+            'state': self._stack_frames(
+                c['state_index'][indices], c['state_chain_start'][indices]),
+            'action': c['action'][indices],
+            'reward': c['reward'][indices],
+            'next_state': self._stack_frames(
+                c['next_state_index'][indices],
+                c['next_state_chain_start'][indices]),
+            'next_action': c['next_action'][indices],
+            'is_state_terminal': c['is_state_terminal'][indices],
+        }
+
+    def __len__(self):
+        return self.size
+
+    def save(self, dirname):
+        """Save transitions and frames to a directory.
+
+        Like ArrayReplayBuffer, saving to the same directory again only writes
+        transitions and frames added since the last save.
+
+        Args:
+            dirname (str): Path to a directory.
+        """
+        _save_ring_shards(
+            dirname, self.buffer_id,
+            rings={
+                'frames': ({'frame': self.frames}
+                           if self.frames is not None else {},
+                           self.n_written_frames),
+                'transitions': (self.columns or {}, self.n_appended),
+            },
+            attrs={'size': self.size,
+                   'capacity': self.capacity,
+                   'frame_capacity': self.frame_capacity,
+                   'n_frames': self.n_frames})
+
+    def load(self, dirname):
+        """Load transitions and frames from a directory.
+
+        Capacities and the number of frames saved with them are used.
+        Transitions and frames are read lazily from the memory-mapped shards.
+
+        Args:
+            dirname (str): Path to a directory.
+        """
+        buffer_id, attrs, rings = _load_ring_shards(dirname)
+        self.capacity = attrs['capacity']
+        self.frame_capacity = attrs['frame_capacity']
+        self.n_frames = attrs['n_frames']
+        self.n_written_frames, frame_shards = rings['frames']
+        self.n_appended, shards = rings['transitions']
+        self.frames = None
+        self.columns = None
+        if frame_shards:
+            self.frames = _map_shards_to_ring(
+                frame_shards, self.n_written_frames,
+                self.frame_capacity)['frame']
+        if shards:
+            self.columns = _map_shards_to_ring(
+                shards, self.n_appended, self.capacity)
+        self.size = attrs['size']
+        self.first = (self.n_appended - self.size) % self.capacity
+        self.buffer_id = buffer_id
+        self.stop_current_episode(env_id=self.last_env_id)
+
+    def stop_current_episode(self, env_id=0):
+        if env_id == self.last_env_id:
+            self.last_next_state = None
+            self.last_next_index = None
+            self.last_next_chain_start = None
+            self.last_env_id = None
+
+
 class PriorityWeightError(object):
     """For propotional prioritization
 
@@ -173,7 +1197,8 @@ class PriorityWeightError(object):
             importance sampling weights are used.
         eps (float): To revisit a step after its error becomes near zero
         normalize_by_max (bool): normalize weights by maximum priority
-            of a batch.
+            of a batch, or by the global maximum when the buffer can provide
+            the minimum probability (see weights_from_probabilities).
     """
 
     def __init__(self, alpha, beta0, betasteps, eps, normalize_by_max):
@@ -189,17 +1214,43 @@ class PriorityWeightError(object):
         self.normalize_by_max = normalize_by_max
 
     def priority_from_errors(self, errors):
-        return [d ** self.alpha + self.eps for d in errors]
+        """Compute priorities from errors.
+
+        Args:
+            errors (list or ndarray): Errors of sampled data.
+        Returns:
+            ndarray: Priorities.
+        """
+        return np.asarray(errors, dtype=np.float64) ** self.alpha + self.eps
+
+    def weights_from_probabilities(self, probabilities, min_probability=None):
+        """Compute importance sampling weights from probabilities.
 
-    def weights_from_probabilities(self, probabilities):
-        tmp = [p for p in probabilities if p is not None]
-        minp = min(tmp) if tmp else 1.0
-        probabilities = [minp if p is None else p for p in probabilities]
+        Args:
+            probabilities (list or ndarray): Probabilities of sampled data.
+                None or NaN means the data has not been prioritized yet, in
+                which case the minimum probability is used.
+            min_probability (float or None): Minimum probability over all the
+                stored data. If given, weights are normalized by the global
+                maximum weight as in the paper. Otherwise the minimum of the
+                given probabilities is used instead.
+        Returns:
+            ndarray: Weights.
+        """
+        # None is converted to NaN
+        probabilities = np.array(probabilities, dtype=np.float64)
+        not_prioritized = np.isnan(probabilities)
+        if min_probability is not None:
+            minp = min_probability
+        elif not_prioritized.all():
+            minp = 1.0
+        else:
+            minp = probabilities[~not_prioritized].min()
+        probabilities[not_prioritized] = minp
         if self.normalize_by_max:
-            weights = [(p / minp) ** -self.beta for p in probabilities]
+            weights = (probabilities / minp) ** -self.beta
         else:
-            weights = [(len(self.memory) * p) ** -self.beta
-                       for p in probabilities]
+            weights = (len(self.memory) * probabilities) ** -self.beta
         self.beta = min(1.0, self.beta + self.beta_add)
         return weights
 
@@ -214,19 +1265,27 @@ class PrioritizedReplayBuffer(ReplayBuffer, PriorityWeightError):
         capacity (int)
         alpha, beta0, betasteps, eps (float)
         normalize_by_max (bool)
+        sum_tree_type (str): 'pointer' or 'array'. See PrioritizedBuffer.
+        n_step (int): See ReplayBuffer.
+        gamma (float or None): See ReplayBuffer.
     """
 
     def __init__(self, capacity=None,
                  alpha=0.6, beta0=0.4, betasteps=2e5, eps=1e-8,
-                 normalize_by_max=True):
-        self.memory = PrioritizedBuffer(capacity=capacity)
+                 normalize_by_max=True, sum_tree_type='pointer',
+                 n_step=1, gamma=None):
+        self.memory = PrioritizedBuffer(
+            capacity=capacity, sum_tree_type=sum_tree_type)
+        self.n_step_windows = _make_n_step_windows(n_step, gamma)
         PriorityWeightError.__init__(
             self, alpha, beta0, betasteps, eps, normalize_by_max)
 
     def sample(self, n):
         assert len(self.memory) >= n
+        min_probability = self.memory.min_probability()
         sampled, probabilities = self.memory.sample(n)
-        weights = self.weights_from_probabilities(probabilities)
+        weights = self.weights_from_probabilities(
+            probabilities, min_probability=min_probability)
         for e, w in zip(sampled, weights):
             e['weight'] = w
         return sampled
@@ -246,20 +1305,21 @@ def random_subseq(seq, subseq_len):
 class EpisodicReplayBuffer(AbstractEpisodicReplayBuffer):
 
     def __init__(self, capacity=None):
-        self.current_episode = []
+        # Transitions of the current episode of each env
+        self.current_episodes = collections.defaultdict(list)
         self.episodic_memory = RandomAccessQueue()
         self.memory = RandomAccessQueue()
         self.capacity = capacity
 
     def append(self, state, action, reward, next_state=None, next_action=None,
-               is_state_terminal=False, **kwargs):
+               is_state_terminal=False, env_id=0, **kwargs):
         experience = dict(state=state, action=action, reward=reward,
                           next_state=next_state, next_action=next_action,
                           is_state_terminal=is_state_terminal,
                           **kwargs)
-        self.current_episode.append(experience)
+        self.current_episodes[env_id].append(experience)
         if is_state_terminal:
-            self.stop_current_episode()
+            self.stop_current_episode(env_id=env_id)
 
     def sample(self, n):
         assert len(self.memory) >= n
@@ -304,17 +1364,16 @@ class EpisodicReplayBuffer(AbstractEpisodicReplayBuffer):
                     self.episodic_memory.append(episode)
                     episode = []
 
-    def stop_current_episode(self):
-        if self.current_episode:
-            self.episodic_memory.append(self.current_episode)
-            self.memory.extend(self.current_episode)
-            self.current_episode = []
+    def stop_current_episode(self, env_id=0):
+        current_episode = self.current_episodes.pop(env_id, None)
+        if current_episode:
+            self.episodic_memory.append(current_episode)
+            self.memory.extend(current_episode)
             while self.capacity is not None and \
                     len(self.memory) > self.capacity:
                 discarded_episode = self.episodic_memory.popleft()
                 for _ in range(len(discarded_episode)):
                     self.memory.popleft()
-        assert not self.current_episode
 
 
 class PrioritizedEpisodicReplayBuffer (
@@ -326,11 +1385,13 @@ class PrioritizedEpisodicReplayBuffer (
                  default_priority_func=None,
                  uniform_ratio=0,
                  wait_priority_after_sampling=True,
-                 return_sample_weights=True):
-        self.current_episode = []
+                 return_sample_weights=True,
+                 sum_tree_type='pointer'):
+        self.current_episodes = collections.defaultdict(list)
         self.episodic_memory = PrioritizedBuffer(
             capacity=None,
-            wait_priority_after_sampling=wait_priority_after_sampling)
+            wait_priority_after_sampling=wait_priority_after_sampling,
+            sum_tree_type=sum_tree_type)
         self.memory = RandomAccessQueue(maxlen=capacity)
         self.capacity_left = capacity
         self.default_priority_func = default_priority_func
@@ -342,12 +1403,14 @@ class PrioritizedEpisodicReplayBuffer (
     def sample_episodes(self, n_episodes, max_len=None):
         """Sample n unique samples from this replay buffer"""
         assert len(self.episodic_memory) >= n_episodes
+        min_probability = self.episodic_memory.min_probability()
         episodes, probabilities = self.episodic_memory.sample(
             n_episodes, uniform_ratio=self.uniform_ratio)
         if max_len is not None:
             episodes = [random_subseq(ep, max_len) for ep in episodes]
         if self.return_sample_weights:
-            weights = self.weights_from_probabilities(probabilities)
+            weights = self.weights_from_probabilities(
+                probabilities, min_probability=min_probability)
             return episodes, weights
         else:
             return episodes
@@ -356,27 +1419,471 @@ class PrioritizedEpisodicReplayBuffer (
         self.episodic_memory.set_last_priority(
             self.priority_from_errors(errors))
 
-    def stop_current_episode(self):
-        if self.current_episode:
+    def stop_current_episode(self, env_id=0):
+        current_episode = self.current_episodes.pop(env_id, None)
+        if current_episode:
             if self.default_priority_func is not None:
-                priority = self.default_priority_func(self.current_episode)
+                priority = self.default_priority_func(current_episode)
             else:
                 priority = None
-            self.memory.extend(self.current_episode)
-            self.episodic_memory.append(self.current_episode,
+            self.memory.extend(current_episode)
+            self.episodic_memory.append(current_episode,
                                         priority=priority)
             if self.capacity_left is not None:
-                self.capacity_left -= len(self.current_episode)
-            self.current_episode = []
+                self.capacity_left -= len(current_episode)
             while self.capacity_left is not None and self.capacity_left < 0:
                 discarded_episode = self.episodic_memory.pop()
                 self.capacity_left += len(discarded_episode)
-        assert not self.current_episode
+
+
+def _gather_episodes(columns, starts, lengths, max_len):
+    """Gather (sub)episodes from ring buffers as a dict of padded arrays."""
+    if max_len is not None and lengths.max() > max_len:
+        sub_lengths = np.minimum(lengths, max_len)
+        # Uniformly choose offsets from [0, length - sub_length]
+        offsets = np.floor(np.random.uniform(
+            size=len(lengths)) * (lengths - sub_lengths + 1))
+        starts = starts + offsets.astype(np.int64)
+        lengths = sub_lengths
+    capacity = len(next(iter(columns.values())))
+    steps = np.arange(lengths.max())
+    indices = (starts[:, None] +
+               np.minimum(steps[None, :], lengths[:, None] - 1))
+    indices %= capacity
+    batch = {key: column[indices] for key, column in columns.items()}
+    batch['length'] = lengths
+    batch['mask'] = steps[None, :] < lengths[:, None]
+    return batch
+
+
+class ArrayEpisodicReplayBuffer(AbstractEpisodicReplayBuffer):
+    """Episodic replay buffer that stores transitions in preallocated arrays.
+
+    Transitions are stored in ring buffers of type numpy.ndarray like
+    ArrayReplayBuffer, and each episode is represented by the global index of
+    its first transition and its length. Transitions of the current episode
+    of each environment are kept aside and written contiguously when the
+    episode is stopped. When the first transition of the oldest episode is
+    about to be overwritten, the whole episode is discarded at once.
+
+    `sample` returns a dict of batched arrays like ArrayReplayBuffer.
+    `sample_episodes` returns a dict of arrays of shape (n_episodes, T, ...)
+    padded to the length T of the longest sampled (sub)episode, along with
+    `length` that has the length of each (sub)episode and `mask` of shape
+    (n_episodes, T) that is True for non-padded elements. Padded elements
+    repeat the last transition of each (sub)episode. `batch_episodes`
+    accepts both this format and a list of episodes.
+
+    Args:
+        capacity (int): Maximum number of transitions stored.
+    """
+
+    def __init__(self, capacity):
+        assert capacity is not None and capacity > 0
+        self.capacity = capacity
+        self.columns = None
+        self.size = 0
+        # The transition written n-th is stored at index n % capacity
+        self.n_appended = 0
+        # Transitions of the current episode of each env
+        self.current_episodes = collections.defaultdict(list)
+        # Each episode needs at least one transition, so at most capacity
+        # episodes can be stored. The episode stored n-th is indexed by
+        # n % capacity.
+        self.episodes = collections.OrderedDict([
+            ('start', np.zeros(capacity, dtype=np.int64)),
+            ('length', np.zeros(capacity, dtype=np.int64)),
+        ])
+        self.first_episode = 0
+        self.n_stored_episodes = 0
+        self.buffer_id = uuid.uuid4().hex
+
+    def _discard_oldest_episode(self):
+        i = self.first_episode % self.capacity
+        self.size -= int(self.episodes['length'][i])
+        self.first_episode += 1
+
+    def append(self, state, action, reward, next_state=None, next_action=None,
+               is_state_terminal=False, env_id=0, **kwargs):
+        self.current_episodes[env_id].append(_make_array_transition(
+            state, action, reward, next_state, next_action,
+            is_state_terminal, **kwargs))
+        if is_state_terminal:
+            self.stop_current_episode(env_id=env_id)
+
+    def stop_current_episode(self, env_id=0):
+        episode = self.current_episodes.pop(env_id, None)
+        # An episode longer than capacity cannot be stored
+        if episode and len(episode) <= self.capacity:
+            self._write_episode(episode)
+
+    def _write_episode(self, episode):
+        if self.columns is None:
+            self.columns = _allocate_columns(episode[0], self.capacity)
+        start = self.n_appended
+        length = len(episode)
+        # Discard episodes whose first transition is overwritten
+        overwritten = start + length - 1 - self.capacity
+        while (self.first_episode < self.n_stored_episodes and
+               self.episodes['start'][self.first_episode % self.capacity] <=
+               overwritten):
+            self._discard_oldest_episode()
+        indices = np.arange(start, start + length) % self.capacity
+        for key, column in self.columns.items():
+            column[indices] = [transition[key] for transition in episode]
+        i = self.n_stored_episodes % self.capacity
+        self.episodes['start'][i] = start
+        self.episodes['length'][i] = length
+        self.n_stored_episodes += 1
+        self.n_appended += length
+        self.size += length
+
+    def _oldest_transition_index(self):
+        return int(self.episodes['start'][self.first_episode % self.capacity])
+
+    def sample(self, n):
+        """Sample n unique transitions as a dict of batched arrays.
+
+        Args:
+            n (int): Number of transitions to sample.
+        Returns:
+            dict whose values are numpy.ndarray with n rows.
+        """
+        assert self.size >= n
+        # Stored episodes are contiguous in the ring buffers
+        indices = (self._oldest_transition_index() +
+                   sample_n_k(self.size, n)) % self.capacity
+        return {key: column[indices]
+                for key, column in self.columns.items()}
+
+    def sample_episodes(self, n_episodes, max_len=None):
+        """Sample n unique (sub)episodes as a dict of padded arrays.
+
+        Args:
+            n_episodes (int): Number of episodes to sample.
+            max_len (int or None): Maximum length of sampled episodes. If it is
+                smaller than the length of some episode, a random subsequence
+                of the episode is sampled instead.
+        Returns:
+            dict whose values are numpy.ndarray of shape
+            (n_episodes, T, ...), plus `length` and `mask`.
+        """
+        assert self.n_episodes >= n_episodes
+        episode_indices = (self.first_episode + sample_n_k(
+            self.n_episodes, n_episodes)) % self.capacity
+        return _gather_episodes(
+            self.columns,
+            self.episodes['start'][episode_indices],
+            self.episodes['length'][episode_indices],
+            max_len)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def n_episodes(self):
+        return self.n_stored_episodes - self.first_episode
+
+    def save(self, dirname):
+        """Save episodes to a directory.
+
+        Current episodes that are not stopped yet are not saved.
+
+        Args:
+            dirname (str): Path to a directory.
+        """
+        _save_ring_shards(
+            dirname, self.buffer_id,
+            rings={
+                'transitions': (self.columns or {}, self.n_appended),
+                'episodes': (self.episodes, self.n_stored_episodes),
+            },
+            attrs={'first_episode': self.first_episode})
+
+    def load(self, dirname):
+        """Load episodes from a directory.
+
+        Transitions are read lazily from the memory-mapped shards.
+
+        Args:
+            dirname (str): Path to a directory.
+        """
+        buffer_id, attrs, rings = _load_ring_shards(dirname)
+        n_appended, shards = rings['transitions']
+        n_stored_episodes, episode_shards = rings['episodes']
+        self.columns = _map_shards_to_ring(shards, n_appended, self.capacity)
+        # Episode offsets are small and needed to compute the size
+        _copy_shards_to_ring(
+            episode_shards, n_stored_episodes, self.episodes)
+        self.n_appended = n_appended
+        self.n_stored_episodes = n_stored_episodes
+        # Discard episodes that do not fit in the capacity
+        self.first_episode = max(attrs['first_episode'],
+                                 n_stored_episodes - self.capacity)
+        while (self.first_episode < n_stored_episodes and
+               self._oldest_transition_index() < n_appended - self.capacity):
+            self.first_episode += 1
+        episode_indices = np.arange(
+            self.first_episode, n_stored_episodes) % self.capacity
+        self.size = int(self.episodes['length'][episode_indices].sum())
+        self.buffer_id = buffer_id
+
+
+def _shared_array(shape, dtype):
+    """Allocate a numpy.ndarray backed by multiprocessing shared memory."""
+    dtype = np.dtype(dtype)
+    raw = mp.RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+class SharedEpisodicReplayBuffer(AbstractEpisodicReplayBuffer):
+    """Episodic replay buffer shared by processes via shared memory.
+
+    Transitions are stored in fixed-shape columns allocated in shared memory
+    when the buffer is created, so the buffer must be created before worker
+    processes are forked, e.g. before calling train_agent_async, and shared
+    by all the agents. Fields given to `append` other than those of
+    transitions are not stored, except that action distributions `mu` of
+    discrete actions, e.g. of ACER, are stored as their probabilities if
+    `mu_size` is given. They are sampled as a `mu` column of probabilities,
+    from which ACER restores SoftmaxDistributions.
+
+    Each process keeps its current episodes locally and copies one to the
+    shared memory at once when the episode is stopped, which is the only
+    time the lock is held except for reading the range of stored transitions
+    or the locations of episodes to sample. Sampled transitions are read
+    without the lock and sampled again if other processes overwrite them
+    while they are being read.
+
+    `sample_episodes` returns a dict of padded arrays like
+    ArrayEpisodicReplayBuffer, and `save` and `load` use its format.
+
+    Args:
+        capacity (int): Maximum number of transitions stored.
+        state_shape (tuple): Shape of states.
+        state_dtype: Data type of states.
+        action_shape (tuple): Shape of actions.
+        action_dtype: Data type of actions.
+        mu_size (int): Number of discrete actions of action distributions
+            `mu` to store. If set to None, `mu` is not stored.
+    """
+
+    def __init__(self, capacity, state_shape, state_dtype=np.float32,
+                 action_shape=(), action_dtype=np.int64, mu_size=None):
+        assert capacity is not None and capacity > 0
+        self.capacity = capacity
+        self.columns = collections.OrderedDict()
+        for key, shape, dtype in [
+                ('state', state_shape, state_dtype),
+                ('action', action_shape, action_dtype),
+                ('reward', (), np.float32),
+                ('next_state', state_shape, state_dtype),
+                ('next_action', action_shape, action_dtype),
+                ('is_state_terminal', (), np.bool_)]:
+            self.columns[key] = _shared_array(
+                (capacity,) + tuple(shape), dtype)
+        if mu_size is not None:
+            self.columns['mu'] = _shared_array((capacity, mu_size),
+                                               np.float32)
+        # Each episode needs at least one transition, so at most capacity
+        # episodes can be stored. The episode stored n-th is indexed by
+        # n % capacity.
+        self.episodes = collections.OrderedDict([
+            ('start', _shared_array((capacity,), np.int64)),
+            ('length', _shared_array((capacity,), np.int64)),
+        ])
+        self.lock = mp.Lock()
+        # The transition written n-th is stored at index n % capacity
+        self.n_written = mp.RawValue('l', 0)
+        self.n_stored_episodes = mp.RawValue('l', 0)
+        self.first_episode = mp.RawValue('l', 0)
+        self.size = mp.RawValue('l', 0)
+        # Transitions of the current episode of each env of this process
+        self.current_episodes = collections.defaultdict(list)
+
+    def append(self, state, action, reward, next_state=None, next_action=None,
+               is_state_terminal=False, env_id=0, **kwargs):
+        transition = _make_array_transition(
+            state, action, reward, next_state, next_action,
+            is_state_terminal)
+        if 'mu' in self.columns:
+            # The probabilities determine a distribution of discrete actions
+            transition['mu'] = cuda.to_cpu(kwargs['mu'].all_prob.data[0])
+        self.current_episodes[env_id].append(transition)
+        if is_state_terminal:
+            self.stop_current_episode(env_id=env_id)
+
+    def _is_overwritten(self, starts):
+        # A single integer can be read without the lock
+        return starts < self.n_written.value - self.capacity
+
+    def stop_current_episode(self, env_id=0):
+        episode = self.current_episodes.pop(env_id, [])
+        length = len(episode)
+        # An episode longer than capacity cannot be stored
+        if 0 < length <= self.capacity:
+            # Convert transitions before acquiring the lock
+            values = dict(
+                (key, np.asarray([trans[key] for trans in episode],
+                                 dtype=column.dtype))
+                for key, column in self.columns.items())
+            with self.lock:
+                start = self.n_written.value
+                # Discard episodes to be overwritten
+                while (self.first_episode.value <
+                       self.n_stored_episodes.value):
+                    i = self.first_episode.value % self.capacity
+                    if (self.episodes['start'][i] >=
+                            start + length - self.capacity):
+                        break
+                    self.size.value -= int(self.episodes['length'][i])
+                    self.first_episode.value += 1
+                # Readers check n_written after reading, so it must be
+                # updated before overwriting
+                self.n_written.value = start + length
+                indices = np.arange(start, start + length) % self.capacity
+                for key, column in self.columns.items():
+                    column[indices] = values[key]
+                i = self.n_stored_episodes.value % self.capacity
+                self.episodes['start'][i] = start
+                self.episodes['length'][i] = length
+                self.n_stored_episodes.value += 1
+                self.size.value += length
+
+    def _sample_episode_locations(self, n_episodes):
+        """Sample unique episodes and return their starts and lengths.
+
+        Episodes can be discarded by other processes after the caller checks
+        n_episodes, so fewer episodes are returned if not enough are stored.
+        """
+        with self.lock:
+            first = self.first_episode.value
+            n_stored = self.n_stored_episodes.value - first
+            n_episodes = min(n_episodes, n_stored)
+            episode_indices = (first + sample_n_k(
+                n_stored, n_episodes)) % self.capacity
+            return (self.episodes['start'][episode_indices],
+                    self.episodes['length'][episode_indices])
+
+    def _stored_transition_range(self):
+        """Return the global indices [start, stop) of stored transitions."""
+        with self.lock:
+            if self.first_episode.value == self.n_stored_episodes.value:
+                return 0, 0
+            # Stored episodes are contiguous in the ring buffers
+            i = self.first_episode.value % self.capacity
+            return int(self.episodes['start'][i]), self.n_written.value
+
+    def sample(self, n):
+        """Sample n transitions as a dict of batched arrays.
+
+        Transitions are sampled uniformly but not necessarily unique.
+
+        Args:
+            n (int): Number of transitions to sample.
+        Returns:
+            dict whose values are numpy.ndarray with n rows.
+        """
+        while True:
+            start, stop = self._stored_transition_range()
+            assert stop > start
+            global_indices = start + np.random.randint(stop - start, size=n)
+            batch = dict(
+                (key, column[global_indices % self.capacity])
+                for key, column in self.columns.items())
+            # Check that no transition is overwritten while being read
+            if not self._is_overwritten(global_indices).any():
+                return batch
+
+    def sample_episodes(self, n_episodes, max_len=None):
+        """Sample n unique (sub)episodes as a dict of padded arrays.
+
+        Args:
+            n_episodes (int): Number of episodes to sample. If other
+                processes have discarded episodes so that fewer are stored,
+                all the stored episodes are sampled.
+            max_len (int or None): Maximum length of sampled episodes. If it is
+                smaller than the length of some episode, a random subsequence
+                of the episode is sampled instead.
+        Returns:
+            dict whose values are numpy.ndarray of shape
+            (n_episodes, T, ...), plus `length` and `mask`.
+        """
+        while True:
+            starts, lengths = self._sample_episode_locations(n_episodes)
+            batch = _gather_episodes(self.columns, starts, lengths, max_len)
+            # Check that no episode is overwritten while being read
+            if not self._is_overwritten(starts).any():
+                return batch
+
+    def __len__(self):
+        return self.size.value
+
+    @property
+    def n_episodes(self):
+        return self.n_stored_episodes.value - self.first_episode.value
+
+    def _to_array_episodic_replay_buffer(self):
+        rbuf = ArrayEpisodicReplayBuffer(self.capacity)
+        with self.lock:
+            if self.n_written.value > 0:
+                rbuf.columns = collections.OrderedDict(
+                    (key, column.copy())
+                    for key, column in self.columns.items())
+            for key, column in self.episodes.items():
+                rbuf.episodes[key][:] = column
+            rbuf.n_appended = self.n_written.value
+            rbuf.n_stored_episodes = self.n_stored_episodes.value
+            rbuf.first_episode = self.first_episode.value
+            rbuf.size = self.size.value
+        return rbuf
+
+    def save(self, dirname):
+        """Save episodes to a directory.
+
+        Args:
+            dirname (str): Path to a directory.
+        """
+        self._to_array_episodic_replay_buffer().save(dirname)
+
+    def load(self, dirname):
+        """Load episodes from a directory.
+
+        Args:
+            dirname (str): Path to a directory.
+        """
+        rbuf = ArrayEpisodicReplayBuffer(self.capacity)
+        rbuf.load(dirname)
+        with self.lock:
+            if rbuf.columns is not None:
+                for key, column in self.columns.items():
+                    column[:] = rbuf.columns[key][:]
+            for key, column in self.episodes.items():
+                column[:] = rbuf.episodes[key]
+            self.n_written.value = rbuf.n_appended
+            self.n_stored_episodes.value = rbuf.n_stored_episodes
+            self.first_episode.value = rbuf.first_episode
+            self.size.value = rbuf.size
 
 
 def batch_experiences(experiences, xp, phi, batch_states=batch_states):
+    """Make a batch of transitions for model updates.
+
+    Args:
+        experiences (list or dict): Either a list of transition dicts or a
+            dict of already batched arrays, e.g. returned by
+            ArrayReplayBuffer.sample.
+        xp (module): numpy or cupy
+        phi (callable): Feature extractor applied to observations
+        batch_states (callable): Method which makes a batch of observations.
+    Returns:
+        dict of batched arrays
+    """
+
+    if isinstance(experiences, dict):
+        return _batch_array_experiences(experiences, xp, phi, batch_states)
 
-    return {
+    batch = {
         'state': batch_states(
             [elem['state'] for elem in experiences], xp, phi),
         'action': xp.asarray([elem['action'] for elem in experiences]),
@@ -390,16 +1897,95 @@ def batch_experiences(experiences, xp, phi, batch_states=batch_states):
             [elem['is_state_terminal'] for elem in experiences],
 
             dtype=np.float32)}
+    if 'discount' in experiences[0]:
+        # n-step transitions
+        batch['discount'] = xp.asarray(
+            [elem['discount'] for elem in experiences], dtype=np.float32)
+    return batch
+
+
+def _batch_array_experiences(experiences, xp, phi, batch_states):
+    batch = {
+        'state': batch_states(experiences['state'], xp, phi),
+        'action': xp.asarray(experiences['action']),
+        'reward': xp.asarray(experiences['reward'], dtype=np.float32),
+        'next_state': batch_states(experiences['next_state'], xp, phi),
+        'next_action': xp.asarray(experiences['next_action']),
+        'is_state_terminal': xp.asarray(
+            experiences['is_state_terminal'], dtype=np.float32)}
+    if 'discount' in experiences:
+        batch['discount'] = xp.asarray(
+            experiences['discount'], dtype=np.float32)
+    return batch
+
+
+def batch_episodes(episodes, xp, phi, batch_states=batch_states):
+    """Make a batch of transitions for each time step of episodes.
+
+    Episodes are sorted in descending order of their lengths so that the
+    batch of time step t consists of the first k episodes, where k is the
+    number of episodes longer than t.
+
+    Args:
+        episodes (list or dict): Either a list of episodes, each of which is
+            a list of transition dicts, or a dict of padded arrays, e.g.
+            returned by ArrayEpisodicReplayBuffer.sample_episodes.
+        xp (module): numpy or cupy
+        phi (callable): Feature extractor applied to observations
+        batch_states (callable): Method which makes a batch of observations.
+    Returns:
+        indices (numpy.ndarray): Indices of episodes sorted in descending
+            order of their lengths.
+        lengths (numpy.ndarray): Lengths of episodes in the same order.
+        batches (list): dicts of batched arrays of each time step.
+    """
+
+    if isinstance(episodes, dict):
+        lengths = np.asarray(episodes['length'])
+    else:
+        lengths = np.asarray([len(ep) for ep in episodes])
+    # Stable sort in descending order
+    indices = np.argsort(-lengths, kind='mergesort')
+    lengths = lengths[indices]
+    batches = []
+    for t in range(lengths[0]):
+        k = int(np.count_nonzero(lengths > t))
+        if isinstance(episodes, dict):
+            experiences = {
+                key: value[indices[:k], t]
+                for key, value in episodes.items()
+                if key not in ('length', 'mask')}
+        else:
+            experiences = [episodes[i][t] for i in indices[:k]]
+        batches.append(batch_experiences(
+            experiences, xp=xp, phi=phi, batch_states=batch_states))
+    return indices, lengths, batches
 
 
 class ReplayUpdater(object):
     """Object that handles update schedule and configurations.
 
+    If n_prefetch > 0, minibatches are sampled and passed to batch_func by a
+    background thread so that data preparation overlaps with updates and
+    environment steps. In this mode:
+
+    - All the operations that modify the replay buffer, e.g. append and
+      stop_current_episode, must be done while holding `lock`, which is also
+      held by the background thread during sampling.
+    - A minibatch can be sampled up to n_prefetch + 1 updates before it is
+      consumed, i.e., it may not contain the most recent transitions.
+    - Replay buffers with priority write-back (those that have
+      update_errors) and episodic updates are not supported, since the next
+      minibatch must not be sampled before the priorities of the previous
+      one are updated.
+
     Args:
         replay_buffer (ReplayBuffer): Replay buffer
         update_func (callable): Callable that accepts one of these:
             (1) a list of transition dicts (if episodic_update=False)
-            (2) a list of lists of transition dicts (if episodic_update=True)
+            (2) a list of lists of transition dicts or a dict of padded
+                arrays (if episodic_update=True)
+            (3) a value returned by batch_func (if batch_func is not None)
         replay_start_size (int): if the replay buffer's size is less than
             replay_start_size, skip update
         batchsize (int): Minibatch size
@@ -408,11 +1994,17 @@ class ReplayUpdater(object):
         episodic_update (bool): Use full episodes for update if set True
         episodic_update_len (int or None): Subsequences of this length are used
             for update if set int and episodic_update=True
+        batch_func (callable or None): Callable that converts sampled
+            transitions into the input of update_func, e.g. by applying phi
+            and batching them.
+        n_prefetch (int): Number of minibatches prepared in advance by a
+            background thread. If set to 0, minibatches are prepared on
+            demand.
     """
 
     def __init__(self, replay_buffer, update_func, batchsize, episodic_update,
                  n_times_update, replay_start_size, update_interval,
-                 episodic_update_len=None):
+                 episodic_update_len=None, batch_func=None, n_prefetch=0):
 
         assert batchsize <= replay_start_size
         self.replay_buffer = replay_buffer
@@ -423,6 +2015,21 @@ class ReplayUpdater(object):
         self.n_times_update = n_times_update
         self.replay_start_size = replay_start_size
         self.update_interval = update_interval
+        self.batch_func = batch_func
+        self.n_prefetch = n_prefetch
+        if n_prefetch > 0:
+            if episodic_update:
+                raise ValueError(
+                    'Prefetching is not supported for episodic updates')
+            if hasattr(replay_buffer, 'update_errors'):
+                raise ValueError(
+                    'Prefetching is not supported for replay buffers with'
+                    ' priority write-back')
+        self.lock = threading.Lock()
+        self.prefetch_queue = None
+        self.prefetch_thread = None
+        self.prefetch_exception = None
+        self.stop_prefetch_event = threading.Event()
 
     def update_if_necessary(self, iteration):
         if len(self.replay_buffer) < self.replay_start_size:
@@ -440,6 +2047,58 @@ class ReplayUpdater(object):
                 episodes = self.replay_buffer.sample_episodes(
                     self.batchsize, self.episodic_update_len)
                 self.update_func(episodes)
+            elif self.n_prefetch > 0:
+                self.update_func(self._get_prefetched_batch())
             else:
                 transitions = self.replay_buffer.sample(self.batchsize)
+                if self.batch_func is not None:
+                    transitions = self.batch_func(transitions)
                 self.update_func(transitions)
+
+    def stop_prefetch(self):
+        """Stop the background thread if it is running."""
+        if self.prefetch_thread is None:
+            return
+        self.stop_prefetch_event.set()
+        self.prefetch_thread.join()
+        self.prefetch_thread = None
+        self.prefetch_queue = None
+        self.stop_prefetch_event.clear()
+
+    def _get_prefetched_batch(self):
+        if self.prefetch_thread is None:
+            self.prefetch_queue = queue.Queue(maxsize=self.n_prefetch)
+            self.prefetch_thread = threading.Thread(target=self._prefetch)
+            self.prefetch_thread.daemon = True
+            self.prefetch_thread.start()
+        batch = self.prefetch_queue.get()
+        if batch is None:
+            # The background thread has died
+            self.prefetch_thread.join()
+            self.prefetch_thread = None
+            exception = self.prefetch_exception
+            self.prefetch_exception = None
+            raise exception
+        return batch
+
+    def _prefetch(self):
+        try:
+            while not self.stop_prefetch_event.is_set():
+                with self.lock:
+                    batch = self.replay_buffer.sample(self.batchsize)
+                if self.batch_func is not None:
+                    batch = self.batch_func(batch)
+                self._put_prefetched_batch(batch)
+        except Exception as e:
+            self.prefetch_exception = e
+            self._put_prefetched_batch(None)
+
+    def _put_prefetched_batch(self, batch):
+        # Time out periodically so that stop_prefetch is never blocked by a
+        # full queue
+        while not self.stop_prefetch_event.is_set():
+            try:
+                self.prefetch_queue.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                pass
@@ -133,7 +133,8 @@ def main():
 
     opt.setup(q_func)
 
-    rbuf = replay_buffer.ReplayBuffer(10 ** 6)
+    # Each screen is stored only once by FrameStackReplayBuffer
+    rbuf = replay_buffer.FrameStackReplayBuffer(10 ** 6, n_frames=4)
 
     explorer = explorers.LinearDecayEpsilonGreedy(
         1.0, args.final_epsilon,
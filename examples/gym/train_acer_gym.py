@@ -29,6 +29,7 @@ from chainerrl.optimizers import rmsprop_async
 from chainerrl import policies
 from chainerrl import q_functions
 from chainerrl.replay_buffer import EpisodicReplayBuffer
+from chainerrl.replay_buffer import SharedEpisodicReplayBuffer
 from chainerrl import spaces
 from chainerrl import v_functions
 
@@ -148,7 +149,16 @@ def main():
     opt.setup(model)
     opt.add_hook(chainer.optimizer.GradientClipping(40))
 
-    replay_buffer = EpisodicReplayBuffer(args.replay_capacity)
+    if isinstance(action_space, spaces.Box):
+        # Gaussian distributions of continuous actions cannot be stored in
+        # shared memory, so each process has its own replay buffer
+        replay_buffer = EpisodicReplayBuffer(args.replay_capacity)
+    else:
+        # Share a single replay buffer among all the processes
+        replay_buffer = SharedEpisodicReplayBuffer(
+            args.replay_capacity,
+            state_shape=obs_space.low.shape,
+            mu_size=action_space.n)
     agent = acer.ACER(model, opt, t_max=args.t_max, gamma=0.99,
                       replay_buffer=replay_buffer,
                       n_times_replay=args.n_times_replay,
@@ -173,6 +173,19 @@ def main():
                 default_priority_func=exp_return_of_episode,
                 wait_priority_after_sampling=False,
                 return_sample_weights=False)
+    elif args.train_async:
+        # Share a single replay buffer among all the processes
+        if isinstance(action_space, gym.spaces.Box):
+            action_shape = action_space.low.shape
+            action_dtype = np.float32
+        else:
+            action_shape = ()
+            action_dtype = np.int64
+        replay_buffer = chainerrl.replay_buffer.SharedEpisodicReplayBuffer(
+            capacity=5 * 10 ** 3,
+            state_shape=obs_space.low.shape,
+            action_shape=action_shape,
+            action_dtype=action_dtype)
     else:
         replay_buffer = chainerrl.replay_buffer.EpisodicReplayBuffer(
             capacity=5 * 10 ** 3)
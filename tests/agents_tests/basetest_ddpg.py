@@ -18,6 +18,7 @@ from chainerrl.q_functions import FCBNLateActionSAQFunction
 from chainerrl.q_functions import FCLSTMSAQFunction
 from chainerrl import replay_buffer
 
+from basetest_training import _TestBatchTraining
 from basetest_training import _TestTraining
 
 
@@ -109,3 +110,13 @@ class _TestDDPGOnContinuousABC(_TestDDPGOnABC):
 
     def make_env_and_successful_return(self, test):
         return ABC(discrete=False, deterministic=test), 1
+
+
+class _TestBatchDDPGOnContinuousPOABC(_TestDDPGOnContinuousPOABC,
+                                      _TestBatchTraining):
+    pass
+
+
+class _TestBatchDDPGOnContinuousABC(_TestDDPGOnContinuousABC,
+                                    _TestBatchTraining):
+    pass
@@ -14,6 +14,7 @@ from chainerrl.explorers.epsilon_greedy import LinearDecayEpsilonGreedy
 from chainerrl import q_functions
 from chainerrl import replay_buffer
 
+from basetest_training import _TestBatchTraining
 from basetest_training import _TestTraining
 
 
@@ -117,3 +118,17 @@ class _TestDQNOnContinuousABC(_TestDQNOnABC):
 
     def make_env_and_successful_return(self, test):
         return ABC(discrete=False, deterministic=test), 1
+
+
+class _TestBatchDQNOnDiscreteABC(_TestDQNOnDiscreteABC, _TestBatchTraining):
+    pass
+
+
+class _TestBatchDQNOnDiscretePOABC(_TestDQNOnDiscretePOABC,
+                                   _TestBatchTraining):
+    pass
+
+
+class _TestBatchDQNOnContinuousABC(_TestDQNOnContinuousABC,
+                                   _TestBatchTraining):
+    pass
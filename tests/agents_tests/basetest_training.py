@@ -16,6 +16,47 @@ from chainerrl.experiments import train_agent_with_evaluation
 from chainerrl.misc import random_seed
 
 
+def run_batch_training(agent, envs, steps, max_episode_len=None):
+    """Train an agent in multiple envs by its batch_* methods."""
+    batch_obs = [env.reset() for env in envs]
+    episode_len = [0] * len(envs)
+    for _ in range(steps // len(envs)):
+        batch_action = agent.batch_act_and_train(batch_obs)
+        batch_obs, batch_reward, batch_done, _ = zip(*[
+            env.step(action) for env, action in zip(envs, batch_action)])
+        episode_len = [n + 1 for n in episode_len]
+        batch_reset = [n == max_episode_len for n in episode_len]
+        agent.batch_observe_and_train(
+            batch_obs, batch_reward, batch_done, batch_reset)
+        batch_obs = list(batch_obs)
+        for i, env in enumerate(envs):
+            if batch_done[i] or batch_reset[i]:
+                batch_obs[i] = env.reset()
+                episode_len[i] = 0
+
+
+def run_batch_evaluation(agent, envs):
+    """Run an episode in each of envs by batch_act and return the returns."""
+    batch_obs = [env.reset() for env in envs]
+    returns = [0.0] * len(envs)
+    finished = [False] * len(envs)
+    while not all(finished):
+        batch_action = agent.batch_act(batch_obs)
+        batch_reward = [0.0] * len(envs)
+        batch_done = [False] * len(envs)
+        for i, env in enumerate(envs):
+            # Finished envs are not stepped any more
+            if finished[i]:
+                continue
+            batch_obs[i], batch_reward[i], batch_done[i], _ = env.step(
+                batch_action[i])
+            returns[i] += batch_reward[i]
+            finished[i] = batch_done[i]
+        agent.batch_observe(batch_obs, batch_reward, batch_done,
+                            [False] * len(envs))
+    return returns
+
+
 class _TestTraining(unittest.TestCase):
 
     def setUp(self):
@@ -92,3 +133,39 @@ class _TestTraining(unittest.TestCase):
         self._test_training(-1, steps=10, require_success=False)
         self._test_training(-1, steps=0, load_model=True,
                             require_success=False)
+
+
+class _TestBatchTraining(_TestTraining):
+    """Runs the tests of _TestTraining by the batch_* methods of agents."""
+
+    num_envs = 3
+
+    def _test_training(self, gpu, steps=5000, load_model=False,
+                       require_success=True):
+
+        random_seed.set_random_seed(1)
+        logging.basicConfig(level=logging.DEBUG)
+
+        envs = [self.make_env_and_successful_return(test=False)[0]
+                for _ in range(self.num_envs)]
+        test_envs = [self.make_env_and_successful_return(test=True)[0]
+                     for _ in range(self.num_envs)]
+        _, successful_return = self.make_env_and_successful_return(test=True)
+        agent = self.make_agent(envs[0], gpu)
+
+        if load_model:
+            print('Load agent from', self.agent_dirname)
+            agent.load(self.agent_dirname)
+            agent.replay_buffer.load(self.rbuf_filename)
+
+        # Train
+        run_batch_training(agent, envs, steps)
+
+        # Test
+        for total_r in run_batch_evaluation(agent, test_envs):
+            if require_success:
+                self.assertAlmostEqual(total_r, successful_return)
+
+        # Save
+        agent.save(self.agent_dirname)
+        agent.replay_buffer.save(self.rbuf_filename)
@@ -0,0 +1,142 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import logging
+import tempfile
+import unittest
+
+import chainer
+from chainer import links as L
+from chainer import testing
+import numpy as np
+
+from chainerrl.agents import a2c
+from chainerrl.agents import a3c
+from chainerrl.envs.abc import ABC
+from chainerrl.envs import SerialVectorEnv
+from chainerrl.experiments.train_agent_batch import \
+    train_agent_batch_with_evaluation
+from chainerrl import policies
+from chainerrl import v_function
+
+
+class TestComputeNStepReturns(unittest.TestCase):
+
+    def test_compute_n_step_returns(self):
+        gamma = 0.5
+        # Env 0 continues, env 1 reaches a terminal state at t=0 and env 2
+        # is reset at t=1 without reaching a terminal state
+        rewards = np.asarray([[1, 2, 3], [4, 5, 6]], dtype=np.float32)
+        dones = np.asarray([[False, True, False], [False, False, False]])
+        resets = np.asarray([[False, False, False], [False, False, True]])
+        reset_values = np.asarray([[0, 0, 0], [0, 0, 10]], dtype=np.float32)
+        next_values = np.asarray([8, 8, 8], dtype=np.float32)
+        returns = a2c.compute_n_step_returns(
+            rewards, dones, resets, reset_values, next_values, gamma)
+        np.testing.assert_allclose(returns, [
+            [1 + 0.5 * 4 + 0.25 * 8, 2, 3 + 0.5 * 6 + 0.25 * 10],
+            [4 + 0.5 * 8, 5 + 0.5 * 8, 6 + 0.5 * 10],
+        ])
+
+
+@testing.parameterize(*(
+    testing.product({
+        't_max': [1, 5],
+        'use_lstm': [False, True],
+        'discrete': [True, False],
+    })
+))
+class TestA2C(unittest.TestCase):
+
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp()
+        logging.basicConfig(level=logging.DEBUG)
+
+    @testing.attr.slow
+    def test_abc(self):
+        self._test_abc(steps=1000000)
+
+    def test_abc_fast(self):
+        self._test_abc(steps=100, require_success=False)
+
+    def _test_abc(self, steps=1000000, require_success=True):
+
+        num_envs = 4
+
+        def make_env(process_idx, test):
+            size = 2
+            return ABC(size=size, discrete=self.discrete, episodic=True,
+                       partially_observable=self.use_lstm,
+                       deterministic=test)
+
+        sample_env = make_env(0, False)
+        action_space = sample_env.action_space
+        obs_space = sample_env.observation_space
+
+        n_hidden_channels = 20
+        if self.discrete:
+            pi = policies.FCSoftmaxPolicy(
+                n_hidden_channels, action_space.n,
+                n_hidden_channels=n_hidden_channels,
+                n_hidden_layers=2,
+                min_prob=1e-1)
+        else:
+            pi = policies.FCGaussianPolicy(
+                n_hidden_channels, action_space.low.size,
+                n_hidden_channels=n_hidden_channels,
+                n_hidden_layers=2,
+                bound_mean=True,
+                min_action=action_space.low,
+                max_action=action_space.high,
+                min_var=0.1)
+        if self.use_lstm:
+            shared = L.LSTM(obs_space.low.size, n_hidden_channels)
+        else:
+            shared = L.Linear(obs_space.low.size, n_hidden_channels)
+        model = a3c.A3CSharedModel(
+            shared=shared,
+            pi=pi,
+            v=v_function.FCVFunction(
+                n_hidden_channels,
+                n_hidden_channels=n_hidden_channels,
+                n_hidden_layers=2),
+        )
+        eps = 1e-1 if self.discrete else 1e-2
+        opt = chainer.optimizers.RMSprop(lr=5e-4, eps=eps, alpha=0.99)
+        opt.setup(model)
+        agent = a2c.A2C(model, opt, t_max=self.t_max, gamma=0.9, beta=1e-2,
+                        act_deterministically=True)
+
+        env = SerialVectorEnv(
+            [make_env(i, False) for i in range(num_envs)])
+        train_agent_batch_with_evaluation(
+            agent=agent, env=env, steps=steps, outdir=self.outdir,
+            eval_interval=500, eval_n_runs=5, successful_score=1,
+            eval_env=make_env(0, True))
+        env.close()
+
+        agent.stop_episode()
+
+        # Test
+        env = make_env(0, True)
+        n_test_runs = 5
+
+        for _ in range(n_test_runs):
+            total_r = 0
+            obs = env.reset()
+            done = False
+            reward = 0.0
+
+            while not done:
+                action = agent.act(obs)
+                print('state:', obs, 'action:', action)
+                obs, reward, done, _ = env.step(action)
+                total_r += reward
+            if require_success:
+                self.assertAlmostEqual(total_r, 1)
+            agent.stop_episode()
@@ -60,8 +60,46 @@ class TestA3C(unittest.TestCase):
                        discrete=False, episodic=self.episodic,
                        steps=10, require_success=False)
 
+    @testing.attr.slow
+    def test_abc_discrete_dedicated_evaluator(self):
+        self._test_abc(self.t_max, self.use_lstm, episodic=self.episodic,
+                       dedicated_evaluator=True)
+
+    def test_abc_discrete_dedicated_evaluator_fast(self):
+        self._test_abc(self.t_max, self.use_lstm, episodic=self.episodic,
+                       steps=10, require_success=False,
+                       dedicated_evaluator=True)
+
+    @testing.attr.slow
+    def test_abc_discrete_inference_server(self):
+        if self.use_lstm:
+            self.skipTest('Recurrent models are not supported')
+        self._test_abc(self.t_max, self.use_lstm, episodic=self.episodic,
+                       inference_server=True)
+
+    def test_abc_inference_server_fast(self):
+        if self.use_lstm:
+            self.skipTest('Recurrent models are not supported')
+        for discrete in [True, False]:
+            self._test_abc(self.t_max, self.use_lstm, discrete=discrete,
+                           episodic=self.episodic, steps=10,
+                           require_success=False, dedicated_evaluator=True,
+                           inference_server=True)
+
+    @testing.attr.slow
+    def test_abc_discrete_gradient_applier(self):
+        self._test_abc(self.t_max, self.use_lstm, episodic=self.episodic,
+                       gradient_applier=True)
+
+    def test_abc_discrete_gradient_applier_fast(self):
+        self._test_abc(self.t_max, self.use_lstm, episodic=self.episodic,
+                       steps=10, require_success=False,
+                       gradient_applier=True, grad_accumulation_steps=2)
+
     def _test_abc(self, t_max, use_lstm, discrete=True, episodic=True,
-                  steps=1000000, require_success=True):
+                  steps=1000000, require_success=True,
+                  dedicated_evaluator=False, inference_server=False,
+                  gradient_applier=False, grad_accumulation_steps=1):
 
         nproc = 8
 
@@ -144,7 +182,8 @@ class TestA3C(unittest.TestCase):
         beta = 1e-2
         agent = a3c.A3C(model, opt, t_max=t_max, gamma=gamma, beta=beta,
                         phi=phi,
-                        act_deterministically=True)
+                        act_deterministically=True,
+                        grad_accumulation_steps=grad_accumulation_steps)
 
         max_episode_len = None if episodic else 2
 
@@ -155,7 +194,10 @@ class TestA3C(unittest.TestCase):
                 max_episode_len=max_episode_len,
                 eval_interval=500,
                 eval_n_runs=5,
-                successful_score=1)
+                successful_score=1,
+                dedicated_evaluator=dedicated_evaluator,
+                inference_server=inference_server,
+                gradient_applier=gradient_applier)
             assert len(warns) == 0, warns[0]
 
         # The agent returned by train_agent_async is not guaranteed to be
@@ -28,6 +28,7 @@ from chainerrl.optimizers import rmsprop_async
 from chainerrl import policies
 from chainerrl import q_function
 from chainerrl.replay_buffer import EpisodicReplayBuffer
+from chainerrl.replay_buffer import SharedEpisodicReplayBuffer
 from chainerrl import v_function
 
 
@@ -356,8 +357,40 @@ class TestACER(unittest.TestCase):
         self._test_abc(self.t_max, self.use_lstm, discrete=self.discrete,
                        episodic=self.episodic, steps=10, require_success=False)
 
+    @testing.attr.slow
+    def test_abc_inference_server(self):
+        if self.use_lstm:
+            self.skipTest('Recurrent models are not supported')
+        self._test_abc(self.t_max, self.use_lstm, discrete=self.discrete,
+                       episodic=self.episodic, inference_server=True)
+
+    def test_abc_inference_server_fast(self):
+        if self.use_lstm:
+            self.skipTest('Recurrent models are not supported')
+        self._test_abc(self.t_max, self.use_lstm, discrete=self.discrete,
+                       episodic=self.episodic, steps=10, require_success=False,
+                       inference_server=True)
+
+    @testing.attr.slow
+    def test_abc_shared_replay_buffer(self):
+        if not self.discrete or self.n_times_replay == 0:
+            self.skipTest('Only discrete actions are stored with mu')
+        self._test_abc(self.t_max, self.use_lstm, discrete=self.discrete,
+                       episodic=self.episodic, shared_replay_buffer=True)
+
+    def test_abc_shared_replay_buffer_fast(self):
+        if not self.discrete or self.n_times_replay == 0:
+            self.skipTest('Only discrete actions are stored with mu')
+        if self.disable_online_update or not self.use_trust_region:
+            self.skipTest('Other options are covered by test_abc_fast')
+        # Enough steps to start updates from replay
+        self._test_abc(self.t_max, self.use_lstm, discrete=self.discrete,
+                       episodic=self.episodic, steps=300,
+                       require_success=False, shared_replay_buffer=True)
+
     def _test_abc(self, t_max, use_lstm, discrete=True, episodic=True,
-                  steps=1000000, require_success=True):
+                  steps=1000000, require_success=True,
+                  inference_server=False, shared_replay_buffer=False):
 
         nproc = 8
 
@@ -377,7 +410,13 @@ class TestACER(unittest.TestCase):
         n_hidden_channels = 20
         n_hidden_layers = 1
         nonlinearity = F.leaky_relu
-        replay_buffer = EpisodicReplayBuffer(10 ** 4)
+        if shared_replay_buffer:
+            # Shared by all the processes
+            replay_buffer = SharedEpisodicReplayBuffer(
+                10 ** 4, state_shape=obs_space.low.shape,
+                mu_size=action_space.n)
+        else:
+            replay_buffer = EpisodicReplayBuffer(10 ** 4)
         if use_lstm:
             if discrete:
                 model = acer.ACERSharedModel(
@@ -481,7 +520,8 @@ class TestACER(unittest.TestCase):
                 max_episode_len=max_episode_len,
                 eval_interval=500,
                 eval_n_runs=5,
-                successful_score=1)
+                successful_score=1,
+                inference_server=inference_server)
             assert len(warns) == 0, warns[0]
 
         # The agent returned by train_agent_async is not guaranteed to be
@@ -8,6 +8,7 @@ standard_library.install_aliases()
 
 import basetest_ddpg as base
 from chainerrl.agents.ddpg import DDPG
+from chainerrl import replay_buffer
 
 
 class TestDDPGOnContinuousPOABC(base._TestDDPGOnContinuousPOABC):
@@ -28,3 +29,39 @@ class TestDDPGOnContinuousABC(base._TestDDPGOnContinuousABC):
                     explorer=explorer, replay_start_size=100,
                     target_update_method='soft', target_update_interval=1,
                     episodic_update=False)
+
+
+class TestDDPGOnContinuousPOABCWithArrayEpisodicReplayBuffer(
+        base._TestDDPGOnContinuousPOABC):
+
+    def make_replay_buffer(self, env):
+        return replay_buffer.ArrayEpisodicReplayBuffer(10 ** 5)
+
+    def make_ddpg_agent(self, env, model, actor_opt, critic_opt, explorer,
+                        rbuf, gpu):
+        return DDPG(model, actor_opt, critic_opt, rbuf, gpu=gpu, gamma=0.9,
+                    explorer=explorer, replay_start_size=100,
+                    target_update_method='soft', target_update_interval=1,
+                    episodic_update=True, update_interval=1)
+
+
+class TestBatchDDPGOnContinuousPOABC(
+        base._TestBatchDDPGOnContinuousPOABC):
+
+    def make_ddpg_agent(self, env, model, actor_opt, critic_opt, explorer,
+                        rbuf, gpu):
+        return DDPG(model, actor_opt, critic_opt, rbuf, gpu=gpu, gamma=0.9,
+                    explorer=explorer, replay_start_size=100,
+                    target_update_method='soft', target_update_interval=1,
+                    episodic_update=True, update_interval=1)
+
+
+class TestBatchDDPGOnContinuousABC(
+        base._TestBatchDDPGOnContinuousABC):
+
+    def make_ddpg_agent(self, env, model, actor_opt, critic_opt, explorer,
+                        rbuf, gpu):
+        return DDPG(model, actor_opt, critic_opt, rbuf, gpu=gpu, gamma=0.9,
+                    explorer=explorer, replay_start_size=100,
+                    target_update_method='soft', target_update_interval=1,
+                    episodic_update=False)
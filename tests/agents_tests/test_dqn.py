@@ -39,3 +39,87 @@ class TestDQNOnDiscretePOABC(base._TestDQNOnDiscretePOABC):
         return DQN(q_func, opt, rbuf, gpu=gpu, gamma=0.9, explorer=explorer,
                    replay_start_size=100, target_update_interval=100,
                    episodic_update=True)
+
+
+class TestDQNOnDiscreteABCWithArrayReplayBuffer(base._TestDQNOnDiscreteABC):
+
+    def make_replay_buffer(self, env):
+        return chainerrl.replay_buffer.ArrayReplayBuffer(10 ** 5)
+
+    def make_dqn_agent(self, env, q_func, opt, explorer, rbuf, gpu):
+        return DQN(q_func, opt, rbuf, gpu=gpu, gamma=0.9, explorer=explorer,
+                   replay_start_size=100, target_update_interval=100)
+
+
+class TestDQNOnDiscreteABCWithSpillingReplayBuffer(
+        base._TestDQNOnDiscreteABC):
+
+    def make_replay_buffer(self, env):
+        return chainerrl.replay_buffer.SpillingReplayBuffer(
+            10 ** 5, memory_capacity=100, segment_size=100)
+
+    def make_dqn_agent(self, env, q_func, opt, explorer, rbuf, gpu):
+        return DQN(q_func, opt, rbuf, gpu=gpu, gamma=0.9, explorer=explorer,
+                   replay_start_size=100, target_update_interval=100)
+
+
+class TestDQNOnDiscreteABCWithPrefetch(base._TestDQNOnDiscreteABC):
+
+    def make_dqn_agent(self, env, q_func, opt, explorer, rbuf, gpu):
+        return DQN(q_func, opt, rbuf, gpu=gpu, gamma=0.9, explorer=explorer,
+                   replay_start_size=100, target_update_interval=100,
+                   n_prefetch=2)
+
+
+class TestDQNOnDiscretePOABCWithArrayEpisodicReplayBuffer(
+        base._TestDQNOnDiscretePOABC):
+
+    def make_replay_buffer(self, env):
+        return chainerrl.replay_buffer.ArrayEpisodicReplayBuffer(10 ** 5)
+
+    def make_dqn_agent(self, env, q_func, opt, explorer, rbuf, gpu):
+        return DQN(q_func, opt, rbuf, gpu=gpu, gamma=0.9, explorer=explorer,
+                   replay_start_size=100, target_update_interval=100,
+                   episodic_update=True)
+
+
+class TestDQNOnDiscreteABCWithNStepReplayBuffer(base._TestDQNOnDiscreteABC):
+
+    def make_replay_buffer(self, env):
+        return chainerrl.replay_buffer.ReplayBuffer(
+            10 ** 5, n_step=3, gamma=0.9)
+
+    def make_dqn_agent(self, env, q_func, opt, explorer, rbuf, gpu):
+        return DQN(q_func, opt, rbuf, gpu=gpu, gamma=0.9, explorer=explorer,
+                   replay_start_size=100, target_update_interval=100)
+
+
+class TestBatchDQNOnDiscreteABC(base._TestBatchDQNOnDiscreteABC):
+
+    def make_dqn_agent(self, env, q_func, opt, explorer, rbuf, gpu):
+        return DQN(q_func, opt, rbuf, gpu=gpu, gamma=0.9, explorer=explorer,
+                   replay_start_size=100, target_update_interval=100)
+
+
+class TestBatchDQNOnDiscreteABCBoltzmann(
+        base._TestBatchDQNOnDiscreteABC):
+
+    def make_dqn_agent(self, env, q_func, opt, explorer, rbuf, gpu):
+        explorer = chainerrl.explorers.Boltzmann()
+        return DQN(q_func, opt, rbuf, gpu=gpu, gamma=0.9, explorer=explorer,
+                   replay_start_size=100, target_update_interval=100)
+
+
+class TestBatchDQNOnContinuousABC(base._TestBatchDQNOnContinuousABC):
+
+    def make_dqn_agent(self, env, q_func, opt, explorer, rbuf, gpu):
+        return DQN(q_func, opt, rbuf, gpu=gpu, gamma=0.9, explorer=explorer,
+                   replay_start_size=100, target_update_interval=100)
+
+
+class TestBatchDQNOnDiscretePOABC(base._TestBatchDQNOnDiscretePOABC):
+
+    def make_dqn_agent(self, env, q_func, opt, explorer, rbuf, gpu):
+        return DQN(q_func, opt, rbuf, gpu=gpu, gamma=0.9, explorer=explorer,
+                   replay_start_size=100, target_update_interval=100,
+                   episodic_update=True)
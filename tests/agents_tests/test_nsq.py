@@ -57,7 +57,20 @@ class TestNSQ(unittest.TestCase):
     def test_abc_fast(self):
         self._test_abc(steps=10, require_success=False)
 
-    def _test_abc(self, steps=100000, require_success=True):
+    @testing.attr.slow
+    def test_abc_inference_server(self):
+        if self.use_lstm:
+            self.skipTest('Recurrent models are not supported')
+        self._test_abc(inference_server=True)
+
+    def test_abc_inference_server_fast(self):
+        if self.use_lstm:
+            self.skipTest('Recurrent models are not supported')
+        self._test_abc(steps=10, require_success=False,
+                       inference_server=True)
+
+    def _test_abc(self, steps=100000, require_success=True,
+                  inference_server=False):
 
         nproc = 8
 
@@ -107,6 +120,7 @@ class TestNSQ(unittest.TestCase):
                 eval_interval=500,
                 eval_n_runs=5,
                 successful_score=1,
+                inference_server=inference_server,
             )
             assert len(warns) == 0, warns[0]
 
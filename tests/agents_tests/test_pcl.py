@@ -70,8 +70,24 @@ class TestPCL(unittest.TestCase):
                        discrete=False, episodic=self.episodic,
                        steps=10, require_success=False)
 
+    @testing.attr.slow
+    def test_abc_discrete_inference_server(self):
+        if self.use_lstm or not self.train_async:
+            self.skipTest('Only asynchronous feedforward models are served')
+        self._test_abc(self.t_max, self.use_lstm, episodic=self.episodic,
+                       inference_server=True)
+
+    def test_abc_inference_server_fast(self):
+        if self.use_lstm or not self.train_async:
+            self.skipTest('Only asynchronous feedforward models are served')
+        for discrete in [True, False]:
+            self._test_abc(self.t_max, self.use_lstm, discrete=discrete,
+                           episodic=self.episodic, steps=10,
+                           require_success=False, inference_server=True)
+
     def _test_abc(self, t_max, use_lstm, discrete=True, episodic=True,
-                  steps=100000, require_success=True):
+                  steps=100000, require_success=True,
+                  inference_server=False):
 
         nproc = 8
 
@@ -199,7 +215,8 @@ class TestPCL(unittest.TestCase):
                     max_episode_len=2,
                     eval_interval=200,
                     eval_n_runs=5,
-                    successful_score=1)
+                    successful_score=1,
+                    inference_server=inference_server)
                 assert len(warns) == 0, warns[0]
             # The agent returned by train_agent_async is not guaranteed to be
             # successful because parameters could be modified by other
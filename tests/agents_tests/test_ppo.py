@@ -15,12 +15,17 @@ from chainer import testing
 import numpy as np
 
 from chainerrl.agents.a3c import A3CSeparateModel
+from chainerrl.agents.ppo import _RolloutBuffer
+from chainerrl.agents.ppo import _yield_minibatch_indices
 from chainerrl.agents.ppo import PPO
 from chainerrl.envs.abc import ABC
 from chainerrl.experiments import train_agent_with_evaluation
 from chainerrl import policies
 from chainerrl import v_functions
 
+from basetest_training import run_batch_evaluation
+from basetest_training import run_batch_training
+
 
 @testing.parameterize(*(
     testing.product({
@@ -96,6 +101,32 @@ class TestPPO(unittest.TestCase):
         # Save
         agent.save(self.agent_dirname)
 
+    @testing.attr.slow
+    def test_batch_abc_cpu(self):
+        self._test_batch_abc()
+
+    def test_batch_abc_fast_cpu(self):
+        self._test_batch_abc(steps=100, require_success=False)
+
+    def _test_batch_abc(self, steps=100000, require_success=True, gpu=-1):
+
+        envs = [self.make_env_and_successful_return(test=False)[0]
+                for _ in range(3)]
+        test_envs = [self.make_env_and_successful_return(test=True)[0]
+                     for _ in range(10)]
+        _, successful_return = self.make_env_and_successful_return(test=True)
+        agent = self.make_agent(envs[0], gpu)
+
+        # Train
+        run_batch_training(agent, envs, steps)
+
+        # Test
+        returns = run_batch_evaluation(agent, test_envs)
+        n_succeeded = sum(np.isclose(total_r, successful_return)
+                          for total_r in returns)
+        if require_success:
+            self.assertGreater(n_succeeded, 0.8 * len(test_envs))
+
     def make_agent(self, env, gpu):
         model = self.make_model(env)
 
@@ -138,3 +169,71 @@ class TestPPO(unittest.TestCase):
 
     def make_env_and_successful_return(self, test):
         return ABC(discrete=self.discrete, deterministic=test), 1
+
+
+@testing.parameterize(*(
+    testing.product({
+        'dataset_size': [1, 7, 64],
+        'minibatch_size': [1, 4, 64],
+        'epochs': [1, 3],
+    })
+))
+class TestYieldMinibatchIndices(unittest.TestCase):
+
+    def test(self):
+        minibatches = list(_yield_minibatch_indices(
+            self.dataset_size, self.minibatch_size, self.epochs))
+        # Every minibatch except the last one is full
+        for indices in minibatches[:-1]:
+            self.assertEqual(len(indices), self.minibatch_size)
+        self.assertLessEqual(len(minibatches[-1]), self.minibatch_size)
+        # Each epoch visits every sample exactly once
+        indices = np.concatenate(minibatches)
+        self.assertEqual(len(indices), self.dataset_size * self.epochs)
+        for epoch in range(self.epochs):
+            epoch_indices = indices[epoch * self.dataset_size:
+                                    (epoch + 1) * self.dataset_size]
+            np.testing.assert_array_equal(
+                np.sort(epoch_indices), np.arange(self.dataset_size))
+
+
+class TestRolloutBuffer(unittest.TestCase):
+
+    def _add_actions(self, rollout, t):
+        n_envs = rollout.n_envs
+        rollout.add_actions(
+            states=np.full((n_envs, 2), t, dtype=np.float32),
+            actions=np.arange(n_envs, dtype=np.int32) + t,
+            log_probs=np.full(n_envs, -t, dtype=np.float32),
+            vs=np.full((n_envs, 1), 0.5 * t, dtype=np.float32))
+
+    def test_rows(self):
+        rollout = _RolloutBuffer(n_envs=2, n_steps=3)
+        self._add_actions(rollout, 0)
+        self.assertEqual(rollout.n_rows, 1)
+        self.assertEqual(rollout.n_complete_rows, 0)
+
+        # The episode of env 1 ends, while that of env 0 continues
+        rollout.set_rewards(slice(None), [1, 2])
+        rollout.set_next_values([1], [3], nonterminals=0, episode_ends=True)
+        self.assertEqual(rollout.n_complete_rows, 0)
+        rollout.set_next_values([0], [4], nonterminals=1, episode_ends=False)
+        self.assertEqual(rollout.n_complete_rows, 1)
+        self._add_actions(rollout, 1)
+        self.assertEqual(rollout.n_complete_rows, 1)
+
+        c = rollout.columns
+        np.testing.assert_array_equal(c['reward'][0], [1, 2])
+        np.testing.assert_array_equal(c['next_v_pred'][0], [4, 3])
+        np.testing.assert_array_equal(c['nonterminal'][0], [1, 0])
+        np.testing.assert_array_equal(c['episode_end'][0], [False, True])
+        np.testing.assert_array_equal(c['v_pred'][1], [0.5, 0.5])
+        self.assertEqual(c['state'].shape, (3, 2, 2))
+        self.assertEqual(c['action'].dtype, np.int32)
+
+        # The incomplete row is moved to the top
+        rollout.discard_complete_rows()
+        self.assertEqual(rollout.n_rows, 1)
+        self.assertEqual(rollout.n_complete_rows, 0)
+        np.testing.assert_array_equal(c['action'][0], [1, 2])
+        np.testing.assert_array_equal(c['log_prob'][0], [-1, -1])
@@ -20,6 +20,9 @@ import chainerrl
 from chainerrl.envs.abc import ABC
 from chainerrl import policies
 
+from basetest_training import run_batch_evaluation
+from basetest_training import run_batch_training
+
 
 @testing.parameterize(*(
     testing.product({
@@ -53,8 +56,21 @@ class TestREINFORCE(unittest.TestCase):
         self._test_abc(self.use_lstm, discrete=self.discrete,
                        steps=10, require_success=False, gpu=0)
 
+    @testing.attr.slow
+    def test_batch_abc_cpu(self):
+        if self.use_lstm:
+            self.skipTest('batch_act_and_train does not support LSTM')
+        self._test_abc(self.use_lstm, discrete=self.discrete, steps=100000,
+                       batch=True)
+
+    def test_batch_abc_fast_cpu(self):
+        if self.use_lstm:
+            self.skipTest('batch_act_and_train does not support LSTM')
+        self._test_abc(self.use_lstm, discrete=self.discrete,
+                       steps=10, require_success=False, batch=True)
+
     def _test_abc(self, use_lstm, discrete=True, steps=1000000,
-                  require_success=True, gpu=-1):
+                  require_success=True, gpu=-1, batch=False):
 
         def make_env(process_idx, test):
             size = 2
@@ -131,6 +147,17 @@ class TestREINFORCE(unittest.TestCase):
             act_deterministically=True,
         )
 
+        if batch:
+            run_batch_training(
+                agent, [make_env(i, False) for i in range(3)], steps,
+                max_episode_len=2)
+            returns = run_batch_evaluation(
+                agent, [make_env(i, True) for i in range(5)])
+            if require_success:
+                for total_r in returns:
+                    self.assertAlmostEqual(total_r, 1)
+            return
+
         chainerrl.experiments.train_agent_with_evaluation(
             agent=agent,
             env=make_env(0, False),
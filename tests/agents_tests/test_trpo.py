@@ -23,6 +23,9 @@ from chainerrl.experiments import train_agent_with_evaluation
 from chainerrl import policies
 from chainerrl import v_functions
 
+from basetest_training import run_batch_evaluation
+from basetest_training import run_batch_training
+
 
 _is_double_backprop_supported = trpo._is_double_backprop_supported
 
@@ -248,6 +251,33 @@ class TestTRPO(unittest.TestCase):
         # Save
         agent.save(self.agent_dirname)
 
+    @testing.attr.slow
+    def test_batch_abc_cpu(self):
+        self._test_batch_abc()
+
+    def test_batch_abc_fast_cpu(self):
+        self._test_batch_abc(steps=100, require_success=False)
+
+    def _test_batch_abc(self, steps=100000, require_success=True, gpu=-1):
+
+        envs = [self.make_env_and_successful_return(test=False)[0]
+                for _ in range(3)]
+        test_envs = [self.make_env_and_successful_return(test=True)[0]
+                     for _ in range(5)]
+        _, successful_return = self.make_env_and_successful_return(test=True)
+        agent = self.make_agent(envs[0], gpu)
+
+        max_episode_len = None if self.episodic else 2
+
+        # Train
+        run_batch_training(agent, envs, steps,
+                           max_episode_len=max_episode_len)
+
+        # Test
+        for total_r in run_batch_evaluation(agent, test_envs):
+            if require_success:
+                self.assertAlmostEqual(total_r, successful_return)
+
     def make_agent(self, env, gpu):
         policy, vf = self.make_model(env)
 
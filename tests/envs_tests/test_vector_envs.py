@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+import functools
+import unittest
+
+from chainer import testing
+import numpy as np
+
+import chainerrl
+from chainerrl.envs.abc import ABC
+
+
+@testing.parameterize(*testing.product({
+    'num_envs': [1, 3],
+    'vector_env_to_test': [
+        'SerialVectorEnv',
+        'MultiprocessVectorEnv',
+        'SharedMemoryMultiprocessVectorEnv',
+    ],
+    'auto_reset': [True, False],
+}))
+class TestVectorEnv(unittest.TestCase):
+
+    def setUp(self):
+        # Deterministic envs give the same results as single envs
+        env_fns = [functools.partial(ABC, size=3, deterministic=True)
+                   for _ in range(self.num_envs)]
+        self.single_envs = [env_fn() for env_fn in env_fns]
+        if self.vector_env_to_test == 'SerialVectorEnv':
+            self.vec_env = chainerrl.envs.SerialVectorEnv(
+                [env_fn() for env_fn in env_fns],
+                auto_reset=self.auto_reset)
+        else:
+            self.vec_env = chainerrl.envs.MultiprocessVectorEnv(
+                env_fns, auto_reset=self.auto_reset,
+                shared_memory=self.vector_env_to_test.startswith(
+                    'SharedMemory'))
+
+    def tearDown(self):
+        if not getattr(self.vec_env, 'closed', False):
+            self.vec_env.close()
+
+    def test_num_envs(self):
+        self.assertEqual(self.vec_env.num_envs, self.num_envs)
+
+    def test_spaces(self):
+        self.assertEqual(self.vec_env.action_space,
+                         self.single_envs[0].action_space)
+        self.assertEqual(self.vec_env.observation_space.shape,
+                         self.single_envs[0].observation_space.shape)
+
+    def test_seed(self):
+        seeds = list(range(self.num_envs))
+        results = self.vec_env.seed(seeds)
+        self.assertEqual(len(results), self.num_envs)
+
+    def test_step_and_reset(self):
+        obss = self.vec_env.reset()
+        self.assertEqual(len(obss), self.num_envs)
+        for obs, env in zip(obss, self.single_envs):
+            np.testing.assert_allclose(obs, env.reset())
+
+        for t in range(10):
+            # Env i takes a correct action only at even steps from env 1 on,
+            # so that envs end their episodes at different timings
+            actions = [
+                int(env._state) if i == 0 or t % 2 == 0 else 2
+                for i, env in enumerate(self.single_envs)]
+            obss, rs, dones, infos = self.vec_env.step(actions)
+            self.assertEqual(len(obss), self.num_envs)
+            self.assertEqual(len(rs), self.num_envs)
+            self.assertEqual(len(dones), self.num_envs)
+            self.assertEqual(len(infos), self.num_envs)
+            for i, env in enumerate(self.single_envs):
+                obs, r, done, info = env.step(actions[i])
+                np.testing.assert_allclose(obss[i], obs)
+                self.assertEqual(rs[i], r)
+                self.assertEqual(dones[i], done)
+
+            # Reset only envs that have finished their episodes
+            obss = self.vec_env.reset(mask=np.logical_not(dones))
+            self.assertEqual(len(obss), self.num_envs)
+            for i, env in enumerate(self.single_envs):
+                if dones[i]:
+                    np.testing.assert_allclose(obss[i], env.reset())
+                else:
+                    np.testing.assert_allclose(obss[i], env.observe())
+
+    def test_observations_are_not_overwritten(self):
+        obss = self.vec_env.reset()
+        kept = [np.array(obs) for obs in obss]
+        # Every env goes to the terminal state
+        self.vec_env.step([2] * self.num_envs)
+        for obs, kept_obs in zip(obss, kept):
+            np.testing.assert_allclose(obs, kept_obs)
+
+    def test_close(self):
+        self.vec_env.close()
+        if self.vector_env_to_test != 'SerialVectorEnv':
+            for p in self.vec_env.ps:
+                self.assertFalse(p.is_alive())
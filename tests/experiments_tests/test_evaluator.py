@@ -11,6 +11,7 @@ import unittest
 
 from chainer import testing
 import mock
+import numpy as np
 
 import chainerrl
 
@@ -143,3 +144,48 @@ class TestAsyncEvaluator(unittest.TestCase):
             self.assertEqual(agent.save.call_count, 2)
         else:
             self.assertEqual(agent.save.call_count, 0)
+
+
+@testing.parameterize(
+    *testing.product({
+        'n_runs': [1, 3, 4],
+        'max_episode_len': [None, 2],
+    })
+)
+class TestBatchRunEvaluationEpisodes(unittest.TestCase):
+
+    def test_batch_run_evaluation_episodes(self):
+        agent = mock.Mock()
+        agent.batch_act.side_effect = lambda obss: ['action'] * len(obss)
+
+        env = mock.Mock(spec=chainerrl.env.VectorEnv)
+        env.num_envs = 2
+        env.reset.return_value = ['obs', 'obs']
+        # Episodes never end unless max_episode_len is specified
+        done = self.max_episode_len is None
+        env.step.return_value = (
+            ['obs', 'obs'], [1, 2], [done, done], [{}, {}])
+
+        scores = chainerrl.experiments.evaluator.batch_run_evaluation_episodes(
+            env=env, agent=agent, n_runs=self.n_runs,
+            max_episode_len=self.max_episode_len)
+
+        # Episodes are evenly assigned to the two envs
+        episode_len = self.max_episode_len or 1
+        n_steps = episode_len * ((self.n_runs + 1) // 2)
+        self.assertEqual(agent.batch_act.call_count, n_steps)
+        expected_scores = (
+            [episode_len * 1.0] * ((self.n_runs + 1) // 2) +
+            [episode_len * 2.0] * (self.n_runs // 2))
+        self.assertEqual(sorted(scores), expected_scores)
+        for score in scores:
+            self.assertIsInstance(score, float)
+
+        # eval_performance runs episodes in parallel for VectorEnv
+        stats = chainerrl.experiments.evaluator.eval_performance(
+            env=env, agent=agent, n_runs=self.n_runs,
+            max_episode_len=self.max_episode_len)
+        self.assertEqual(agent.batch_act.call_count, 2 * n_steps)
+        self.assertAlmostEqual(stats['mean'], np.mean(expected_scores))
+        self.assertEqual(stats['max'], max(expected_scores))
+        self.assertEqual(stats['min'], min(expected_scores))
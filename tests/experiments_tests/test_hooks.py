@@ -7,6 +7,7 @@ from future import standard_library
 standard_library.install_aliases()
 import unittest
 
+import mock
 import numpy as np
 
 import chainerrl
@@ -32,3 +33,19 @@ class TestLinearInterpolationHook(unittest.TestCase):
 
         np.testing.assert_allclose(
             buf, np.arange(1, 10 + 1, dtype=np.float32) / 10)
+
+
+class TestReplayBufferCheckpointHook(unittest.TestCase):
+
+    def test_call(self):
+        agent = mock.Mock()
+        hook = chainerrl.experiments.ReplayBufferCheckpointHook(
+            interval=3, dirname='rbuf')
+
+        for step in range(1, 10 + 1):
+            hook(env=None, agent=agent, step=step)
+
+        self.assertEqual(agent.replay_buffer.save.call_count, 3)
+        for call in agent.replay_buffer.save.call_args_list:
+            args, kwargs = call
+            self.assertEqual(args, ('rbuf',))
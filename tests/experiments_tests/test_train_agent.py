@@ -5,12 +5,14 @@ from __future__ import absolute_import
 from builtins import *  # NOQA
 from future import standard_library
 standard_library.install_aliases()
+import os
 import tempfile
 import unittest
 
 import mock
 
 import chainerrl
+from chainerrl.experiments.train_agent import save_agent_replay_buffer
 
 
 class TestTrainAgent(unittest.TestCase):
@@ -53,3 +55,18 @@ class TestTrainAgent(unittest.TestCase):
             self.assertEqual(args[1], agent)
             # step starts with 1
             self.assertEqual(args[2], i + 1)
+
+
+class TestSaveAgentReplayBuffer(unittest.TestCase):
+
+    def test_same_path(self):
+        outdir = tempfile.mkdtemp()
+        agent = mock.Mock()
+        for t in [10, 20]:
+            save_agent_replay_buffer(agent, t, outdir, suffix='_except')
+        # The same path is used so that buffers can be saved incrementally
+        self.assertEqual(agent.replay_buffer.save.call_count, 2)
+        for call in agent.replay_buffer.save.call_args_list:
+            args, kwargs = call
+            self.assertEqual(
+                args, (os.path.join(outdir, 'replay_buffer_except'),))
@@ -0,0 +1,74 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+import os
+import sys
+import tempfile
+import unittest
+
+from chainer import testing
+import numpy as np
+
+from chainerrl.agents import a3c
+from chainerrl.envs.abc import ABC
+from chainerrl.experiments.train_agent_async import train_agent_async
+from chainerrl.optimizers import rmsprop_async
+from chainerrl import policies
+from chainerrl import v_functions
+
+
+# Module-level functions so that they can be pickled by start methods other
+# than 'fork'
+def make_env(process_idx, test):
+    return ABC(discrete=True, deterministic=test)
+
+
+def make_agent(process_idx):
+    env = make_env(process_idx, test=False)
+    obs_size = env.observation_space.low.size
+    model = a3c.A3CSeparateModel(
+        pi=policies.FCSoftmaxPolicy(obs_size, env.action_space.n),
+        v=v_functions.FCVFunction(obs_size))
+    opt = rmsprop_async.RMSpropAsync(lr=1e-3)
+    opt.setup(model)
+    return a3c.A3C(model, opt, t_max=5, gamma=0.9)
+
+
+@testing.parameterize(*testing.product({
+    'start_method': ['fork', 'spawn', 'forkserver'],
+    'sync_start': [False, True],
+    'inference_server': [False, True],
+}))
+class TestTrainAgentAsync(unittest.TestCase):
+
+    def test(self):
+        if self.start_method != 'fork' and sys.version_info < (3, 4):
+            self.skipTest('Start methods require Python 3.4 or later')
+
+        outdir = tempfile.mkdtemp()
+        steps = 50
+        agent = make_agent(0)
+        initial_params = [param.data.copy()
+                          for param in agent.shared_model.params()]
+
+        agent = train_agent_async(
+            outdir=outdir, processes=2, make_env=make_env,
+            make_agent=make_agent, agent=agent, steps=steps,
+            eval_interval=20, eval_n_runs=1, max_episode_len=5,
+            start_method=self.start_method, sync_start=self.sync_start,
+            inference_server=self.inference_server)
+
+        self.assertTrue(os.path.exists(
+            os.path.join(outdir, '{}_finish'.format(steps))))
+        # Evaluations share their schedule among the processes
+        with open(os.path.join(outdir, 'scores.txt')) as f:
+            self.assertGreater(len(f.readlines()), 1)
+        # Updates by the processes are visible through the shared params
+        changed = [not np.array_equal(param.data, initial)
+                   for param, initial in zip(agent.shared_model.params(),
+                                             initial_params)]
+        self.assertTrue(any(changed))
@@ -0,0 +1,84 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+import tempfile
+import unittest
+
+from chainer import testing
+import mock
+import numpy as np
+
+import chainerrl
+
+
+@testing.parameterize(*testing.product({
+    'max_episode_len': [None, 2],
+}))
+class TestTrainAgentBatch(unittest.TestCase):
+
+    def test(self):
+
+        outdir = tempfile.mkdtemp()
+
+        agent = mock.Mock()
+        agent.batch_act_and_train.side_effect = lambda obss: [0] * len(obss)
+        env = mock.Mock()
+        env.num_envs = 2
+        # Env 0 reaches the terminal state after three steps, while env 1
+        # never does
+        env.reset.side_effect = [
+            [('state', 0), ('state', 0)],
+            [('state', 3), ('state', 3)],
+            [('state', 0), ('state', 2)],
+            [('state', 1), ('state', 0)],
+            [('state', 2), ('state', 1)],
+        ]
+        env.step.side_effect = [
+            ([('state', 1), ('state', 1)], [0, 0], [False, False], [{}, {}]),
+            ([('state', 2), ('state', 2)], [0, 1], [False, False], [{}, {}]),
+            ([('state', 3), ('state', 3)], [1, 0], [True, False], [{}, {}]),
+            ([('state', 1), ('state', 4)], [0, 0], [False, False], [{}, {}]),
+        ]
+        hook = mock.Mock()
+
+        chainerrl.experiments.train_agent_batch(
+            agent=agent,
+            env=env,
+            steps=8,
+            outdir=outdir,
+            max_episode_len=self.max_episode_len,
+            step_hooks=[hook])
+
+        self.assertEqual(agent.batch_act_and_train.call_count, 4)
+        self.assertEqual(agent.batch_observe_and_train.call_count, 4)
+        self.assertEqual(env.step.call_count, 4)
+
+        # Which envs are reset is given as a mask of envs to keep running
+        masks = [list(args[0]) for args, _ in env.reset.call_args_list[1:]]
+        if self.max_episode_len is None:
+            self.assertEqual(masks, [
+                [True, True], [True, True], [False, True], [True, True]])
+        else:
+            self.assertEqual(masks, [
+                [True, True], [False, False], [False, True], [True, False]])
+
+        # Resets are given to agents only when episodes are truncated
+        resets = [list(args[3]) for args, _ in
+                  agent.batch_observe_and_train.call_args_list]
+        if self.max_episode_len is None:
+            self.assertFalse(np.any(resets))
+        else:
+            self.assertEqual(resets, [
+                [False, False], [True, True], [False, False], [False, True]])
+
+        # A hook is called every time step, which starts with 1
+        self.assertEqual(hook.call_count, 8)
+        for i, call in enumerate(hook.call_args_list):
+            args, kwargs = call
+            self.assertEqual(args[0], env)
+            self.assertEqual(args[1], agent)
+            self.assertEqual(args[2], i + 1)
@@ -0,0 +1,119 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+import unittest
+
+from chainer import testing
+import numpy as np
+
+from chainerrl.misc import advantage
+
+
+def _compute_gae_by_loop(episodes, gamma, lambd):
+    advs = []
+    for episode in episodes:
+        adv = 0.0
+        episode_advs = []
+        for r, v, next_v, nonterminal in reversed(episode):
+            td_err = r + gamma * nonterminal * next_v - v
+            adv = td_err + gamma * lambd * adv
+            episode_advs.append(adv)
+        advs.extend(reversed(episode_advs))
+    return advs
+
+
+@testing.parameterize(*testing.product({
+    'gamma': [1.0, 0.9],
+    'lambd': [1.0, 0.95, 0.0],
+}))
+class TestComputeGAE(unittest.TestCase):
+
+    def test_episodes(self):
+        episode_lens = [3, 1, 5, 2]
+        episodes = []
+        for n in episode_lens:
+            episode = [
+                (np.random.rand(), np.random.rand(), np.random.rand(), 1.0)
+                for _ in range(n)]
+            # The last episode is not finished
+            if len(episodes) < len(episode_lens) - 1:
+                episode[-1] = episode[-1][:3] + (0.0,)
+            episodes.append(episode)
+        transitions = [t for ep in episodes for t in ep]
+        rewards, values, next_values, nonterminals = [
+            np.asarray(x, dtype=np.float32) for x in zip(*transitions)]
+        episode_ends = np.zeros(len(transitions), dtype=bool)
+        episode_ends[np.cumsum(episode_lens) - 1] = True
+
+        advs = advantage.compute_gae(
+            rewards, values, next_values, nonterminals,
+            self.gamma, self.lambd, episode_ends=episode_ends)
+        self.assertEqual(advs.dtype, np.float32)
+        np.testing.assert_allclose(
+            advs, _compute_gae_by_loop(episodes, self.gamma, self.lambd),
+            rtol=1e-5)
+
+    def test_parallel_sequences(self):
+        T, N = 6, 3
+        rewards, values, next_values = np.random.rand(3, T, N)
+        nonterminals = np.ones((T, N))
+        advs = advantage.compute_gae(
+            rewards, values, next_values, nonterminals,
+            self.gamma, self.lambd)
+        self.assertEqual(advs.shape, (T, N))
+        for i in range(N):
+            expected = _compute_gae_by_loop(
+                [list(zip(rewards[:, i], values[:, i], next_values[:, i],
+                          nonterminals[:, i]))],
+                self.gamma, self.lambd)
+            np.testing.assert_allclose(advs[:, i], expected)
+
+    def _split_episodes(self, rewards, values, next_values, nonterminals,
+                        episode_ends, i):
+        episodes = [[]]
+        for t in range(len(rewards)):
+            episodes[-1].append((rewards[t, i], values[t, i],
+                                 next_values[t, i], nonterminals[t, i]))
+            if episode_ends[t, i]:
+                episodes.append([])
+        return episodes
+
+    def test_parallel_sequences_with_episode_ends(self):
+        T, N = 7, 3
+        rewards, values, next_values = np.random.rand(3, T, N)
+        nonterminals = np.ones((T, N))
+        # Episodes of the envs end in the middle of the rollout
+        nonterminals[2, 0] = 0
+        nonterminals[4, 1] = 0
+        nonterminals[0, 2] = 0
+        nonterminals[5, 2] = 0
+
+        # Terminal transitions end episodes by default
+        advs = advantage.compute_gae(
+            rewards, values, next_values, nonterminals,
+            self.gamma, self.lambd)
+        self.assertEqual(advs.shape, (T, N))
+        for i in range(N):
+            episodes = self._split_episodes(
+                rewards, values, next_values, nonterminals,
+                nonterminals == 0, i)
+            np.testing.assert_allclose(
+                advs[:, i], _compute_gae_by_loop(
+                    episodes, self.gamma, self.lambd))
+
+        # Episodes can also be truncated without terminal states
+        episode_ends = nonterminals == 0
+        episode_ends[3, 1] = True
+        advs = advantage.compute_gae(
+            rewards, values, next_values, nonterminals,
+            self.gamma, self.lambd, episode_ends=episode_ends)
+        for i in range(N):
+            episodes = self._split_episodes(
+                rewards, values, next_values, nonterminals, episode_ends, i)
+            np.testing.assert_allclose(
+                advs[:, i], _compute_gae_by_loop(
+                    episodes, self.gamma, self.lambd))
@@ -10,6 +10,7 @@ import multiprocessing as mp
 import os
 import signal
 import sys
+import time
 import unittest
 import warnings
 
@@ -183,6 +184,44 @@ class TestAsync(unittest.TestCase):
         self.assertEqual(a_copy_params['/0/b'].data.ctypes.data,
                          b_copy_params['/0/b'].data.ctypes.data)
 
+    def test_as_shared_objects(self):
+        model = chainer.ChainList(L.Linear(2, 3), L.Linear(3, 4))
+        model[1].W.data = model[1].W.data.astype(np.float64)
+        # Reset grads so that their dtypes match the new ones of the data
+        model.cleargrads()
+        opt = optimizers.RMSprop()
+        opt.setup(model)
+        shared_params, shared_states = async.as_shared_objects((model, opt))
+
+        model_b = copy.deepcopy(model)
+        opt_b = optimizers.RMSprop()
+        opt_b.setup(model_b)
+        async.synchronize_to_shared_objects(
+            (model_b, opt_b), (shared_params, shared_states))
+
+        # dtypes of params are kept
+        self.assertEqual(model_b[1].W.data.dtype, np.float64)
+        for (_, param_a), (_, param_b) in zip(
+                sorted(model.namedparams()), sorted(model_b.namedparams())):
+            self.assertEqual(param_a.data.ctypes.data,
+                             param_b.data.ctypes.data)
+            for state_name, state_val in param_a.update_rule.state.items():
+                self.assertEqual(
+                    state_val.ctypes.data,
+                    param_b.update_rule.state[state_name].ctypes.data)
+
+        # Updates by other processes are visible
+        def run():
+            model_b[1].W.data[...] = 1
+            model_b[0].W.update_rule.state['ms'][...] = 2
+
+        p = mp.Process(target=run)
+        p.start()
+        p.join()
+        np.testing.assert_array_equal(model[1].W.data, 1)
+        np.testing.assert_array_equal(
+            model[0].W.update_rule.state['ms'], 2)
+
     def test_run_async(self):
         counter = mp.Value('l', 0)
 
@@ -210,3 +249,45 @@ class TestAsync(unittest.TestCase):
             async.run_async(4, run_with_exit_code_11)
             # There should be 4 warnings
             assert len(w) == 4
+
+    def test_run_async_restart(self):
+        n_calls = mp.Array('l', 2)
+
+        def run_func(process_idx):
+            with n_calls.get_lock():
+                n_calls[process_idx] += 1
+            # Only process 1 fails, and only at its first call
+            if process_idx == 1 and n_calls[process_idx] == 1:
+                sys.exit(1)
+
+        with warnings.catch_warnings(record=True) as w:
+            async.run_async(2, run_func, max_restarts=1, poll_interval=0.01)
+            # The failure is warned even if the process is restarted
+            self.assertEqual(len(w), 1)
+        self.assertEqual(list(n_calls), [1, 2])
+
+    def test_run_async_sync_start(self):
+        counter = mp.Value('l', 0)
+
+        def run_func(process_idx):
+            with counter.get_lock():
+                counter.value += 1
+
+        async.run_async(3, run_func, sync_start=True, poll_interval=0.01)
+        self.assertEqual(counter.value, 3)
+
+    def test_run_async_notify_ready(self):
+        ready_at = mp.RawArray('d', 3)
+        resumed_at = mp.RawArray('d', 3)
+
+        def run_func(process_idx, ready):
+            # Setup that takes longer in some workers
+            time.sleep(0.1 * process_idx)
+            ready_at[process_idx] = time.time()
+            ready()
+            resumed_at[process_idx] = time.time()
+
+        async.run_async(3, run_func, sync_start=True, notify_ready=True,
+                        poll_interval=0.01)
+        # No worker resumes until all of them have finished their setup
+        self.assertGreaterEqual(min(resumed_at), max(ready_at))
@@ -0,0 +1,33 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+import unittest
+
+import numpy as np
+
+from chainerrl.misc.batch_states import batch_states
+
+
+class TestBatchStates(unittest.TestCase):
+
+    def test_list(self):
+        states = [np.full(3, i, dtype=np.float32) for i in range(2)]
+        batch = batch_states(states, np, lambda x: x * 2)
+        np.testing.assert_allclose(batch, [[0, 0, 0], [2, 2, 2]])
+
+    def test_ndarray_without_copy(self):
+        states = np.arange(6, dtype=np.uint8).reshape(2, 3)
+        batch = batch_states(states, np, lambda x: x)
+        self.assertIs(batch, states)
+
+    def test_ndarray_with_phi(self):
+        states = np.arange(6, dtype=np.uint8).reshape(2, 3)
+        batch = batch_states(
+            states, np, lambda x: x.astype(np.float32) / 2)
+        self.assertEqual(batch.dtype, np.float32)
+        np.testing.assert_allclose(batch, states / 2)
+        self.assertFalse(np.shares_memory(batch, states))
@@ -11,6 +11,7 @@ from chainer import links as L
 import numpy as np
 
 from chainerrl.misc import copy_param
+from chainerrl.misc import shared_arena
 
 
 class TestCopyParam(unittest.TestCase):
@@ -66,3 +67,38 @@ class TestCopyParam(unittest.TestCase):
 
         with self.assertRaises(TypeError):
             copy_param.soft_copy_param(target_link=a, source_link=b, tau=0.1)
+
+    def test_copy_param_contiguous(self):
+        a = chainer.ChainList(L.Linear(1, 5), L.BatchNormalization(5))
+        b = chainer.ChainList(L.Linear(1, 5), L.BatchNormalization(5))
+        shared_arena.make_params_contiguous(a)
+        shared_arena.make_params_contiguous(b)
+        self.assertIsNotNone(shared_arena.get_flat_pair(a, b))
+        b[1].avg_mean[:] = 2
+
+        copy_param.copy_param(a, b)
+
+        for (_, a_param), (_, b_param) in zip(
+                sorted(a.namedparams()), sorted(b.namedparams())):
+            np.testing.assert_array_equal(a_param.data, b_param.data)
+            self.assertNotEqual(a_param.data.ctypes.data,
+                                b_param.data.ctypes.data)
+        np.testing.assert_array_equal(a[1].avg_mean, b[1].avg_mean)
+
+    def test_soft_copy_param_contiguous(self):
+        a = L.Linear(1, 5)
+        b = L.Linear(1, 5)
+        shared_arena.make_params_contiguous(a)
+        shared_arena.make_params_contiguous(b)
+        self.assertIsNotNone(shared_arena.get_flat_pair(a, b))
+
+        a.W.data[:] = 0.5
+        a.b.data[:] = 0
+        b.W.data[:] = 1
+        b.b.data[:] = 2
+
+        copy_param.soft_copy_param(target_link=a, source_link=b, tau=0.1)
+
+        np.testing.assert_almost_equal(a.W.data, np.full(a.W.data.shape, 0.55))
+        np.testing.assert_almost_equal(a.b.data, np.full(a.b.data.shape, 0.2))
+        np.testing.assert_almost_equal(b.W.data, np.full(b.W.data.shape, 1.0))
@@ -0,0 +1,73 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import copy
+import multiprocessing as mp
+import unittest
+
+from chainer import links as L
+from chainer import optimizers
+import numpy as np
+
+from chainerrl.misc.gradient_slots import GradientSlots
+
+
+class TestGradientSlots(unittest.TestCase):
+
+    def setUp(self):
+        self.shared_model = L.Linear(2, 3)
+        self.optimizer = optimizers.SGD(lr=1)
+        self.optimizer.setup(self.shared_model)
+        self.slots = GradientSlots(self.shared_model, n_slots=2)
+
+    def _make_local_model(self, grad_value):
+        model = copy.deepcopy(self.shared_model)
+        for param in model.params():
+            param.grad = np.full_like(param.data, grad_value)
+        return model
+
+    def test_push_and_apply(self):
+        initial_W = self.shared_model.W.data.copy()
+        self.assertTrue(self.slots.push(
+            0, self._make_local_model(1), version=0))
+        self.assertTrue(self.slots.push(
+            1, self._make_local_model(2), version=0))
+
+        # The slot is still full
+        self.assertFalse(self.slots.push(
+            0, self._make_local_model(1), version=0))
+
+        self.assertEqual(self.slots.apply(self.optimizer), 2)
+        np.testing.assert_allclose(self.shared_model.W.data, initial_W - 3)
+        self.assertEqual(self.slots.update_count.value, 2)
+
+        # Nothing to apply
+        self.assertEqual(self.slots.apply(self.optimizer), 0)
+
+        # The second push was applied after an update
+        stats = dict(self.slots.get_statistics())
+        self.assertEqual(stats['average_staleness'], 0.5)
+        self.assertEqual(stats['applied_pushes'], 2)
+        self.assertEqual(stats['push_conflicts'], 1)
+
+    def test_push_from_other_processes(self):
+        initial_W = self.shared_model.W.data.copy()
+
+        def run(index):
+            model = self._make_local_model(index + 1)
+            assert self.slots.push(index, model, version=0)
+
+        processes = [mp.Process(target=run, args=(i,)) for i in range(2)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        self.assertEqual(self.slots.apply(self.optimizer), 2)
+        np.testing.assert_allclose(self.shared_model.W.data, initial_W - 3)
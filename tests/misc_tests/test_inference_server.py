@@ -0,0 +1,207 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import multiprocessing as mp
+import unittest
+
+import chainer
+from chainer import links as L
+from chainer import testing
+import numpy as np
+
+from chainerrl.agents.a3c import A3CSeparateModel
+from chainerrl.agents.a3c import A3CSharedModel
+from chainerrl.misc.inference_server import InferenceServer
+from chainerrl import policies
+from chainerrl import q_functions
+from chainerrl import v_functions
+
+
+def _make_model(obs_size, n_actions):
+    return A3CSeparateModel(
+        pi=policies.FCSoftmaxPolicy(obs_size, n_actions),
+        v=v_functions.FCVFunction(obs_size))
+
+
+@testing.parameterize(*testing.product({
+    'n_clients': [1, 3],
+    'max_batch_size': [None, 1, 2],
+}))
+class TestInferenceServer(unittest.TestCase):
+
+    def setUp(self):
+        self.obs_size = 3
+        self.n_actions = 4
+        self.model = _make_model(self.obs_size, self.n_actions)
+        self.server = InferenceServer(
+            self.model, n_clients=self.n_clients,
+            max_batch_size=self.max_batch_size)
+
+    def _expected(self, obs):
+        with chainer.no_backprop_mode():
+            pout, vout = self.model(obs[None])
+            action = pout.most_probable
+            return (action.data[0], pout.log_prob(action).data[0],
+                    vout.data[0, 0])
+
+    def _check(self, obs, result):
+        action, log_prob, value, action_distrib = result
+        expected_action, expected_log_prob, expected_value = \
+            self._expected(obs)
+        self.assertEqual(action, expected_action)
+        np.testing.assert_allclose(log_prob, expected_log_prob, rtol=1e-5)
+        np.testing.assert_allclose(value, expected_value, rtol=1e-5)
+        # The action distribution of the observation is sent, too
+        np.testing.assert_allclose(
+            action_distrib.log_prob(np.asarray([action])).data[0],
+            expected_log_prob, rtol=1e-5)
+
+    def test_compute(self):
+        batch_obs = np.random.rand(5, self.obs_size).astype(np.float32)
+        results = self.server.compute(list(batch_obs), deterministic=True)
+        batch_action, batch_log_prob, batch_value, action_distribs = results
+        self.assertEqual(batch_value.shape, (5,))
+        self.assertEqual(len(action_distribs), 5)
+        for i, obs in enumerate(batch_obs):
+            self._check(obs, [x[i] for x in results])
+
+    def test_compute_sampled(self):
+        # Only the first observation is acted on deterministically
+        batch_obs = np.zeros((1000, self.obs_size), dtype=np.float32)
+        deterministic = [True] + [False] * 999
+        results = self.server.compute(list(batch_obs), deterministic)
+        batch_action, batch_log_prob, _, _ = results
+        self._check(batch_obs[0], [x[0] for x in results])
+        # Sampled actions are not always the most probable one
+        self.assertGreater(len(np.unique(batch_action[1:])), 1)
+        with chainer.no_backprop_mode():
+            pout, _ = self.model(batch_obs)
+            np.testing.assert_allclose(
+                batch_log_prob, pout.log_prob(batch_action).data, rtol=1e-5)
+
+    def test_clients(self):
+        n_steps = 5
+        batch_obs = np.random.rand(
+            self.n_clients, n_steps, self.obs_size).astype(np.float32)
+        results = mp.Queue()
+
+        def run_client(index):
+            client = self.server.make_client(index)
+            for obs in batch_obs[index]:
+                results.put(
+                    (index, client.compute(obs, deterministic=True)))
+
+        self.server.start()
+        processes = [mp.Process(target=run_client, args=(i,))
+                     for i in range(self.n_clients)]
+        for p in processes:
+            p.start()
+        received = [results.get() for _ in range(self.n_clients * n_steps)]
+        for p in processes:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+        self.server.stop()
+
+        # Responses to each client are in the order of its requests
+        for index in range(self.n_clients):
+            client_results = [r for i, r in received if i == index]
+            self.assertEqual(len(client_results), n_steps)
+            for obs, result in zip(batch_obs[index], client_results):
+                self._check(obs, result)
+
+
+class TestInferenceServerQFunction(unittest.TestCase):
+
+    def test_compute(self):
+        q_func = q_functions.FCStateQFunctionWithDiscreteAction(
+            3, 4, n_hidden_channels=10, n_hidden_layers=1)
+        server = InferenceServer(q_func, n_clients=1)
+        batch_obs = np.random.rand(5, 3).astype(np.float32)
+        batch_action, batch_log_prob, batch_value, action_values = \
+            server.compute(list(batch_obs))
+        with chainer.no_backprop_mode():
+            qout = q_func(batch_obs)
+        # Q-functions act greedily
+        np.testing.assert_array_equal(
+            batch_action, qout.greedy_actions.data)
+        np.testing.assert_array_equal(batch_log_prob, np.zeros(5))
+        np.testing.assert_allclose(batch_value, qout.max.data, rtol=1e-5)
+        for i, action_value in enumerate(action_values):
+            np.testing.assert_allclose(
+                action_value.q_values.data, qout.q_values.data[i:i + 1],
+                rtol=1e-5)
+
+    def test_clients(self):
+        q_func = q_functions.FCStateQFunctionWithDiscreteAction(
+            3, 4, n_hidden_channels=10, n_hidden_layers=1)
+        server = InferenceServer(q_func, n_clients=2)
+        batch_obs = np.random.rand(2, 3).astype(np.float32)
+        results = mp.Queue()
+
+        def run_client(index):
+            client = server.make_client(index)
+            action, _, value, action_value = client.compute(batch_obs[index])
+            results.put((index, action, value, action_value.q_values.data))
+
+        server.start()
+        processes = [mp.Process(target=run_client, args=(i,))
+                     for i in range(2)]
+        for p in processes:
+            p.start()
+        received = [results.get() for _ in range(2)]
+        for p in processes:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+        server.stop()
+
+        with chainer.no_backprop_mode():
+            qout = q_func(batch_obs)
+        for index, action, value, q_values in received:
+            self.assertEqual(action, qout.greedy_actions.data[index])
+            np.testing.assert_allclose(
+                value, qout.max.data[index], rtol=1e-5)
+            # ActionValues are rebuilt from Q-values by clients
+            np.testing.assert_allclose(
+                q_values, qout.q_values.data[index:index + 1], rtol=1e-5)
+
+
+class _FailingModel(chainer.Chain):
+
+    def __call__(self, x):
+        raise RuntimeError('Forward pass failed')
+
+
+class TestInferenceServerFailure(unittest.TestCase):
+
+    def test_client_raises(self):
+        server = InferenceServer(
+            _FailingModel(), n_clients=1, client_timeout=0.1)
+        client = server.make_client(0)
+        server.start()
+        # Clients do not wait forever for the dead server
+        with self.assertRaises(RuntimeError):
+            client.compute(np.zeros(3, dtype=np.float32))
+        server.process.join()
+        self.assertFalse(server.running.value)
+
+
+class TestInferenceServerRecurrent(unittest.TestCase):
+
+    def test_recurrent_model(self):
+        model = A3CSharedModel(
+            shared=L.LSTM(3, 5),
+            pi=policies.FCSoftmaxPolicy(5, 4),
+            v=v_functions.FCVFunction(5))
+        with self.assertRaises(ValueError):
+            InferenceServer(model, n_clients=1)
+
+    def test_feedforward_model(self):
+        # Models with RecurrentChainMixin are served unless they have any
+        # recurrent link
+        model = _make_model(3, 4)
+        InferenceServer(model, n_clients=1)
@@ -0,0 +1,114 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import copy
+import multiprocessing as mp
+import unittest
+
+import chainer
+from chainer import links as L
+from chainer import optimizers
+from chainer import testing
+import numpy as np
+
+from chainerrl.misc.parameter_server import ParameterServer
+from chainerrl.misc.parameter_server import RemoteParameterServer
+from chainerrl.misc.parameter_server import SharedMemoryParameterServer
+from chainerrl.misc.shared_arena import make_params_contiguous
+
+
+def _make_grads(link, value):
+    return dict((name, np.full_like(param.data, value))
+                for name, param in link.namedparams())
+
+
+class TestSharedMemoryParameterServer(unittest.TestCase):
+
+    def test_push_and_pull(self):
+        model = L.Linear(2, 3)
+        optimizer = optimizers.SGD(lr=1)
+        optimizer.setup(model)
+        server = SharedMemoryParameterServer(optimizer)
+        initial_W = model.W.data.copy()
+
+        server.push(_make_grads(model, 1))
+        np.testing.assert_allclose(model.W.data, initial_W - 1)
+
+        local_model = L.Linear(2, 3)
+        server.pull(local_model)
+        np.testing.assert_allclose(local_model.W.data, model.W.data)
+
+
+@testing.parameterize(*testing.product({
+    'compress': [False, True],
+    'contiguous': [False, True],
+}))
+class TestParameterServer(unittest.TestCase):
+
+    def setUp(self):
+        self.model = chainer.ChainList(L.Linear(2, 3), L.Linear(3, 4))
+        self.model[1].W.data = self.model[1].W.data.astype(np.float64)
+        # Reset grads so that their dtypes match the new ones of the data
+        self.model.cleargrads()
+        self.optimizer = optimizers.SGD(lr=1)
+        self.optimizer.setup(self.model)
+        self.initial_model = copy.deepcopy(self.model)
+        self.server = ParameterServer(self.optimizer)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _make_client(self):
+        return RemoteParameterServer(
+            self.server.address, self.initial_model, compress=self.compress)
+
+    def _make_local_model(self):
+        model = copy.deepcopy(self.initial_model)
+        if self.contiguous:
+            make_params_contiguous(model)
+        return model
+
+    def assert_updated_by(self, model, total_grad):
+        for (_, param), (_, initial_param) in zip(
+                sorted(model.namedparams()),
+                sorted(self.initial_model.namedparams())):
+            self.assertEqual(param.data.dtype, initial_param.data.dtype)
+            np.testing.assert_allclose(
+                param.data, initial_param.data - total_grad,
+                rtol=1e-2 if self.compress else 1e-5)
+
+    def test_push_and_pull(self):
+        client = self._make_client()
+        client.push(_make_grads(self.initial_model, 1))
+        client.push(_make_grads(self.initial_model, 2))
+        local_model = self._make_local_model()
+        client.pull(local_model)
+        client.close()
+        self.assert_updated_by(local_model, 3)
+
+    def test_push_from_other_processes(self):
+        client = self._make_client()
+
+        def run(value):
+            client.push(_make_grads(self.initial_model, value))
+            # Pulling waits for the push to be applied
+            client.pull(self._make_local_model())
+            client.close()
+
+        processes = [mp.Process(target=run, args=(i + 1,)) for i in range(2)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        local_model = self._make_local_model()
+        client.pull(local_model)
+        client.close()
+        self.assert_updated_by(local_model, 3)
@@ -14,12 +14,18 @@ from chainer import testing
 from chainerrl.misc import prioritized
 
 
+@testing.parameterize(
+    *testing.product({
+        'sum_tree_type': ['pointer', 'array'],
+    })
+)
 class TestPrioritizedBuffer(unittest.TestCase):
 
     def test_convergence(self):
         size = 100
 
-        buf = prioritized.PrioritizedBuffer(capacity=size)
+        buf = prioritized.PrioritizedBuffer(
+            capacity=size, sum_tree_type=self.sum_tree_type)
         for x in range(size):
             buf.append(x)
 
@@ -53,6 +59,19 @@ class TestPrioritizedBuffer(unittest.TestCase):
         corr = np.corrcoef(np.array([priority_init, count_sampled]))[0, 1]
         self.assertGreater(corr, 0.8)
 
+    def test_min_probability(self):
+        buf = prioritized.PrioritizedBuffer(
+            sum_tree_type=self.sum_tree_type)
+        self.assertIsNone(buf.min_probability())
+        for x, priority in enumerate([2.0, 1.0, 5.0]):
+            buf.append(x, priority=priority)
+        # Data without priorities are not counted
+        buf.append(3)
+        if self.sum_tree_type == 'array':
+            self.assertAlmostEqual(buf.min_probability(), 1.0 / 8.0)
+        else:
+            self.assertIsNone(buf.min_probability())
+
 
 @testing.parameterize(
     *testing.product({
@@ -60,6 +79,7 @@ class TestPrioritizedBuffer(unittest.TestCase):
         'wait_priority_after_sampling': [True, False],
         'initial_priority': [0.1, 1],
         'uniform_ratio': [0, 0.1, 1],
+        'sum_tree_type': ['pointer', 'array'],
     })
 )
 class TestPrioritizedBufferFlooding(unittest.TestCase):
@@ -67,7 +87,8 @@ class TestPrioritizedBufferFlooding(unittest.TestCase):
     def test_flood(self):
         buf = prioritized.PrioritizedBuffer(
             capacity=self.capacity,
-            wait_priority_after_sampling=self.wait_priority_after_sampling)
+            wait_priority_after_sampling=self.wait_priority_after_sampling,
+            sum_tree_type=self.sum_tree_type)
         for _ in range(100):
             for x in range(self.capacity + 1):
                 if self.wait_priority_after_sampling:
@@ -94,3 +115,54 @@ class TestSumTree(unittest.TestCase):
 
             k = random.choice(list(d.keys()))
             self.assertEqual(t[k], d[k])
+
+
+class TestArraySumTree(unittest.TestCase):
+
+    def test_read_write(self):
+        t = prioritized.ArraySumTree()
+        d = dict()
+        for _ in range(200):
+            k = random.randint(0, 20)
+            v = random.uniform(1e-6, 1e6)
+            t[k] = v
+            d[k] = v
+
+            k = random.choice(list(d.keys()))
+            self.assertEqual(t[k], d[k])
+            self.assertAlmostEqual(t.s / sum(d.values()), 1)
+            self.assertEqual(t.min(), min(d.values()))
+
+    def test_set_items(self):
+        t = prioritized.ArraySumTree(4)
+        t.set_items([0, 5, 2], [1.0, 2.0, 3.0])
+        np.testing.assert_array_equal(
+            t.get_items([0, 1, 2, 5]), [1.0, 0.0, 3.0, 2.0])
+        self.assertEqual(t.s, 6.0)
+        # Zero values are ignored by min
+        self.assertEqual(t.min(), 1.0)
+        del t[0]
+        self.assertEqual(t.s, 5.0)
+        self.assertEqual(t.min(), 2.0)
+
+    def test_prioritized_sample(self):
+        t = prioritized.ArraySumTree()
+        vals = [1.0, 0.0, 2.0, 4.0, 8.0, 0.5]
+        t.set_items(range(len(vals)), vals)
+        total = sum(vals)
+        counts = [0] * len(vals)
+        for _ in range(1000):
+            ixs, probs = t.prioritized_sample(2)
+            self.assertEqual(len(set(ixs)), 2)
+            self.assertNotIn(1, ixs)
+            for ix, p in zip(ixs, probs):
+                self.assertAlmostEqual(p, vals[ix] / total)
+                counts[ix] += 1
+        # Values are restored unless remove=True
+        np.testing.assert_array_equal(t.get_items(range(len(vals))), vals)
+        self.assertGreater(counts[4], counts[3])
+        self.assertGreater(counts[3], counts[0])
+
+        ixs, _ = t.prioritized_sample(5, remove=True)
+        self.assertEqual(sorted(ixs), [0, 2, 3, 4, 5])
+        self.assertEqual(t.s, 0.0)
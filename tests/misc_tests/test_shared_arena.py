@@ -0,0 +1,143 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import copy
+import multiprocessing as mp
+import pickle
+import unittest
+
+import chainer
+from chainer import links as L
+from chainer import testing
+import numpy as np
+
+from chainerrl.misc import shared_arena
+
+
+def _make_arrays():
+    return [
+        ('a', np.arange(6, dtype=np.float32).reshape(2, 3)),
+        ('b', np.arange(3, dtype=np.float64)),
+        ('c', np.arange(5, dtype=np.float32)),
+        ('d', np.asarray(7, dtype=np.int32)),
+    ]
+
+
+@testing.parameterize(*testing.product({
+    'shared': [True, False],
+}))
+class TestArena(unittest.TestCase):
+
+    def test_views(self):
+        arrays = _make_arrays()
+        arena = shared_arena.Arena(arrays, shared=self.shared)
+        self.assertEqual(len(arena), len(arrays))
+        self.assertEqual(sorted(arena.keys()), ['a', 'b', 'c', 'd'])
+        for key, a in arrays:
+            self.assertIn(key, arena)
+            self.assertEqual(arena[key].dtype, a.dtype)
+            np.testing.assert_array_equal(arena[key], a)
+        self.assertNotIn('e', arena)
+
+        # Arrays of the same dtype are viewed as a single flat array
+        flat_views = arena.flat_views()
+        self.assertEqual(len(flat_views), 3)
+        for flat in flat_views:
+            flat[...] = 1
+        for key, _ in arrays:
+            np.testing.assert_array_equal(arena[key], 1)
+
+    def test_copy_from(self):
+        arena = shared_arena.Arena(_make_arrays(), shared=self.shared)
+        other = shared_arena.Arena(_make_arrays(), shared=self.shared)
+        other['a'][...] = -1
+        other['b'][...] = -2
+        arena.copy_from(other)
+        np.testing.assert_array_equal(arena['a'], -1)
+        np.testing.assert_array_equal(arena['b'], -2)
+        # Arenas do not share memory
+        other['a'][...] = -3
+        np.testing.assert_array_equal(arena['a'], -1)
+
+    def test_soft_update_from(self):
+        arrays = [('a', np.full(3, 0.5, dtype=np.float32)),
+                  ('b', np.zeros(2, dtype=np.float64))]
+        arena = shared_arena.Arena(arrays, shared=self.shared)
+        other = shared_arena.Arena(arrays, shared=self.shared)
+        other['a'][...] = 1
+        other['b'][...] = 2
+        arena.soft_update_from(other, tau=0.1)
+        np.testing.assert_allclose(arena['a'], 0.55, rtol=1e-6)
+        np.testing.assert_allclose(arena['b'], 0.2)
+
+    def test_pickle(self):
+        arena = shared_arena.Arena(_make_arrays(), shared=False)
+        # Views are made before pickling
+        arena['a'][...] = -1
+        restored = pickle.loads(pickle.dumps(arena))
+        np.testing.assert_array_equal(restored['a'], -1)
+        restored['b'][...] = 3
+        # float64 arrays are next to float32 ones
+        np.testing.assert_array_equal(restored.flat_views()[1], 3)
+
+
+class TestSharedArenaAcrossProcesses(unittest.TestCase):
+
+    def test_shared(self):
+        arena = shared_arena.Arena(_make_arrays(), shared=True)
+
+        def run():
+            arena['a'][...] = -1
+            arena['b'][...] = -2
+
+        p = mp.Process(target=run)
+        p.start()
+        p.join()
+        self.assertEqual(p.exitcode, 0)
+        np.testing.assert_array_equal(arena['a'], -1)
+        np.testing.assert_array_equal(arena['b'], -2)
+
+
+class TestBindParams(unittest.TestCase):
+
+    def test_make_params_contiguous(self):
+        link = chainer.ChainList(L.Linear(2, 3), L.Linear(3, 4))
+        expected = dict((name, param.data.copy())
+                        for name, param in link.namedparams())
+        arena = shared_arena.make_params_contiguous(link)
+        self.assertIs(shared_arena.get_param_arena(link), arena)
+        for name, param in link.namedparams():
+            np.testing.assert_array_equal(param.data, expected[name])
+            self.assertIs(param.data, arena[name])
+
+    def test_uninitialized(self):
+        link = L.Linear(None, 3)
+        self.assertIsNone(shared_arena.make_params_contiguous(link))
+        self.assertIsNone(shared_arena.get_param_arena(link))
+
+    def test_replaced_params(self):
+        link = L.Linear(2, 3)
+        shared_arena.make_params_contiguous(link)
+        link.W.data = link.W.data.copy()
+        self.assertIsNone(shared_arena.get_param_arena(link))
+
+    def test_deepcopy(self):
+        link = L.Linear(2, 3)
+        shared_arena.make_params_contiguous(link)
+        copied = copy.deepcopy(link)
+        self.assertIsNone(shared_arena.get_param_arena(copied))
+
+    def test_get_flat_pair(self):
+        a = L.Linear(2, 3)
+        b = L.Linear(2, 3)
+        c = L.Linear(3, 3)
+        for link in (a, b, c):
+            shared_arena.make_params_contiguous(link)
+        self.assertIsNotNone(shared_arena.get_flat_pair(a, b))
+        # Layouts differ
+        self.assertIsNone(shared_arena.get_flat_pair(a, c))
@@ -0,0 +1,79 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import multiprocessing as mp
+import unittest
+
+import numpy as np
+
+from chainerrl.misc.stats_board import StatsBoard
+from chainerrl.misc.stats_board import ThroughputMeter
+
+
+class TestStatsBoard(unittest.TestCase):
+
+    def test_counts(self):
+        board = StatsBoard(n_workers=3)
+
+        def run(index):
+            for _ in range(100 * (index + 1)):
+                board.add_step(index)
+            board.add_episode(index, float(index))
+
+        processes = [mp.Process(target=run, args=(i,)) for i in range(3)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        self.assertEqual(board.value, 600)
+        self.assertEqual(board.episodes, 3)
+        np.testing.assert_array_equal(board.worker_steps(), [100, 200, 300])
+
+    def test_statistics(self):
+        board = StatsBoard(n_workers=3, stat_names=['a', 'b'])
+        self.assertEqual(board.get_statistics(), [])
+
+        board.add_episode(0, 1.0)
+        board.set_statistics(0, [('a', 1.0), ('b', 2.0), ('c', 3.0)],
+                             n_updates=5)
+        board.add_episode(2, 3.0)
+        board.set_statistics(2, [('a', 3.0), ('b', 4.0)])
+
+        # Worker 1 has not finished any episode
+        self.assertEqual(board.get_statistics(), [
+            ('mean_last_return', 2.0),
+            ('a', 2.0),
+            ('b', 3.0),
+        ])
+        np.testing.assert_array_equal(board.worker_updates(), [5, 0, 0])
+
+
+class TestThroughputMeter(unittest.TestCase):
+
+    def test_measure(self):
+        board = StatsBoard(n_workers=2)
+        meter = ThroughputMeter(board, t=10.0)
+        for _ in range(10):
+            board.add_step(0)
+        for _ in range(30):
+            board.add_step(1)
+        board.set_statistics(0, [], n_updates=4)
+
+        steps_per_sec, worker_steps_per_sec, updates_per_sec = \
+            meter.measure(t=12.0)
+        self.assertAlmostEqual(steps_per_sec, 20.0)
+        np.testing.assert_allclose(worker_steps_per_sec, [5.0, 15.0])
+        self.assertAlmostEqual(updates_per_sec, 2.0)
+
+        # Differences from the last measurement are used
+        board.add_step(0)
+        steps_per_sec, _, updates_per_sec = meter.measure(t=13.0)
+        self.assertAlmostEqual(steps_per_sec, 1.0)
+        self.assertAlmostEqual(updates_per_sec, 0.0)
@@ -66,6 +66,13 @@ class TestDiscreteActionValue(unittest.TestCase):
         self.assertEqual(len(self.qout.params), 1)
         self.assertEqual(id(self.qout.params[0]), id(self.qout.q_values))
 
+    def test_getitem(self):
+        sliced = self.qout[3:5]
+        self.assertIsInstance(sliced, action_value.DiscreteActionValue)
+        np.testing.assert_equal(sliced.q_values.data, self.q_values[3:5])
+        np.testing.assert_equal(sliced.greedy_actions.data,
+                                self.q_values[3:5].argmax(axis=1))
+
 
 class TestDistributionalDiscreteActionValue(unittest.TestCase):
 
@@ -140,6 +147,13 @@ class TestDistributionalDiscreteActionValue(unittest.TestCase):
         self.assertEqual(len(self.qout.params), 1)
         self.assertIs(self.qout.params[0], self.qout.q_dist)
 
+    def test_getitem(self):
+        sliced = self.qout[3:5]
+        self.assertIsInstance(
+            sliced, action_value.DistributionalDiscreteActionValue)
+        np.testing.assert_almost_equal(sliced.q_values.data,
+                                       self.q_values[3:5])
+
 
 class TestQuadraticActionValue(unittest.TestCase):
     def test_max_unbounded(self):
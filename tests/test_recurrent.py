@@ -0,0 +1,59 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+from builtins import *  # NOQA
+from future import standard_library
+standard_library.install_aliases()
+
+import unittest
+
+import chainer
+from chainer import links as L
+import numpy as np
+
+from chainerrl import links
+from chainerrl import recurrent
+
+
+class TestMaskRecurrentStateAt(unittest.TestCase):
+
+    def test_nested(self):
+        c = chainer.Variable(np.ones((3, 2), dtype=np.float32))
+        h = np.full((3, 2), 2, dtype=np.float32)
+        masked = recurrent.mask_recurrent_state_at([(c, h), None], [0, 2])
+        self.assertIsNone(masked[1])
+        masked_c, masked_h = masked[0]
+        self.assertIsInstance(masked_c, chainer.Variable)
+        np.testing.assert_array_equal(
+            masked_c.data, [[0, 0], [1, 1], [0, 0]])
+        np.testing.assert_array_equal(masked_h, [[0, 0], [2, 2], [0, 0]])
+        # The given state is not modified
+        np.testing.assert_array_equal(c.data, np.ones((3, 2)))
+
+    def test_lstm(self):
+        model = links.Sequence(L.LSTM(2, 3))
+        x = np.random.uniform(size=(2, 2)).astype(np.float32)
+        with recurrent.state_set(model, None):
+            model(x)
+            state = model.get_state()
+        state = recurrent.mask_recurrent_state_at(state, [1])
+        with recurrent.state_set(model, state):
+            y = model(x).data
+        # The masked one behaves as if it is in the initial state
+        with recurrent.state_set(model, None):
+            y_init = model(x).data
+        np.testing.assert_allclose(y[1], y_init[1], rtol=1e-5)
+        self.assertFalse(np.allclose(y[0], y_init[0]))
+
+
+class TestStateSet(unittest.TestCase):
+
+    def test_state_is_restored(self):
+        model = links.Sequence(L.LSTM(2, 3))
+        model(np.ones((1, 2), dtype=np.float32))
+        h = model.get_state()[0][1].data
+        with recurrent.state_set(model, None):
+            model(np.ones((4, 2), dtype=np.float32))
+            self.assertEqual(model.get_state()[0][1].shape, (4, 3))
+        np.testing.assert_array_equal(model.get_state()[0][1].data, h)
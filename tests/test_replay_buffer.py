@@ -5,6 +5,7 @@ from __future__ import absolute_import
 from builtins import *  # NOQA
 from future import standard_library
 standard_library.install_aliases()
+import multiprocessing as mp
 import os
 import tempfile
 import unittest
@@ -12,6 +13,7 @@ import unittest
 from chainer import testing
 import numpy as np
 
+from chainerrl import distribution
 from chainerrl import replay_buffer
 
 
@@ -95,6 +97,725 @@ class TestReplayBuffer(unittest.TestCase):
             self.assertEqual(s2[1], trans1)
 
 
+@testing.parameterize(*testing.product(
+    {
+        'capacity': [1, 5, 100],
+    }
+))
+class TestArrayReplayBuffer(unittest.TestCase):
+
+    def _make_transition(self, i):
+        return dict(state=np.full((2, 3), i, dtype=np.float32),
+                    action=i % 4, reward=0.5 * i,
+                    next_state=np.full((2, 3), i + 1, dtype=np.float32),
+                    next_action=(i + 1) % 4, is_state_terminal=(i % 3 == 0),
+                    mu=np.full(4, i, dtype=np.float32))
+
+    def _assert_batch_consistent(self, batch, n):
+        self.assertEqual(batch['state'].shape, (n, 2, 3))
+        self.assertEqual(batch['action'].shape, (n,))
+        self.assertEqual(batch['reward'].dtype, np.float32)
+        self.assertEqual(batch['is_state_terminal'].dtype, np.bool_)
+        self.assertEqual(batch['mu'].shape, (n, 4))
+        for k in range(n):
+            i = int(batch['state'][k, 0, 0])
+            expected = self._make_transition(i)
+            for key, value in expected.items():
+                np.testing.assert_array_equal(batch[key][k], value)
+
+    def test_append_and_sample(self):
+        capacity = self.capacity
+        rbuf = replay_buffer.ArrayReplayBuffer(capacity)
+        self.assertEqual(len(rbuf), 0)
+
+        for i in range(2 * capacity + 1):
+            rbuf.append(**self._make_transition(i))
+            self.assertEqual(len(rbuf), min(i + 1, capacity))
+
+        batch = rbuf.sample(capacity)
+        self._assert_batch_consistent(batch, capacity)
+
+        # Only the latest transitions are kept and sampled ones are unique
+        sampled = sorted(int(x) for x in batch['state'][:, 0, 0])
+        self.assertEqual(sampled, list(range(capacity + 1, 2 * capacity + 1)))
+
+    def test_next_state_none(self):
+        rbuf = replay_buffer.ArrayReplayBuffer(self.capacity)
+        rbuf.append(state=np.ones(2, dtype=np.float32), action=1, reward=1,
+                    next_state=None, is_state_terminal=True)
+        batch = rbuf.sample(1)
+        np.testing.assert_allclose(batch['next_state'], np.zeros((1, 2)))
+        self.assertTrue(batch['is_state_terminal'][0])
+
+    def test_batch_experiences(self):
+        rbuf = replay_buffer.ArrayReplayBuffer(self.capacity)
+        transs = [self._make_transition(i) for i in range(self.capacity)]
+        for trans in transs:
+            rbuf.append(**trans)
+        batch = rbuf.sample(self.capacity)
+        exp_batch = replay_buffer.batch_experiences(
+            batch, xp=np, phi=lambda x: x * 2)
+        self.assertEqual(exp_batch['state'].shape, (self.capacity, 2, 3))
+        np.testing.assert_allclose(exp_batch['state'], batch['state'] * 2)
+        np.testing.assert_allclose(
+            exp_batch['next_state'], batch['next_state'] * 2)
+        self.assertEqual(exp_batch['reward'].dtype, np.float32)
+        self.assertEqual(exp_batch['is_state_terminal'].dtype, np.float32)
+
+    def test_save_and_load(self):
+        capacity = self.capacity
+        tempdir = tempfile.mkdtemp()
+
+        rbuf = replay_buffer.ArrayReplayBuffer(capacity)
+        for i in range(capacity + 2):
+            rbuf.append(**self._make_transition(i))
+
+        dirname = os.path.join(tempdir, 'rbuf')
+        rbuf.save(dirname)
+
+        rbuf = replay_buffer.ArrayReplayBuffer(capacity)
+        self.assertEqual(len(rbuf), 0)
+        rbuf.load(dirname)
+        self.assertEqual(len(rbuf), capacity)
+        self._assert_batch_consistent(rbuf.sample(capacity), capacity)
+
+        # Appending after loading overwrites the oldest transition
+        rbuf.append(**self._make_transition(capacity + 2))
+        batch = rbuf.sample(capacity)
+        sampled = sorted(int(x) for x in batch['state'][:, 0, 0])
+        self.assertEqual(sampled, list(range(3, capacity + 3)))
+
+    def test_load_lazily(self):
+        capacity = self.capacity
+        dirname = os.path.join(tempfile.mkdtemp(), 'rbuf')
+        rbuf = replay_buffer.ArrayReplayBuffer(capacity)
+        # Transitions are saved as two shards
+        for i in range(capacity + 2):
+            rbuf.append(**self._make_transition(i))
+            if i == capacity // 2:
+                rbuf.save(dirname)
+        rbuf.save(dirname)
+
+        loaded = replay_buffer.ArrayReplayBuffer(capacity)
+        loaded.load(dirname)
+        state = loaded.columns['state']
+        # Nothing is read from the shards until sampled
+        self.assertEqual(state.n_pending, capacity)
+        self.assertFalse(state.array.any())
+        self._assert_batch_consistent(loaded.sample(1), 1)
+        self.assertEqual(state.n_pending, capacity - 1)
+
+        # Overwritten transitions need not be read
+        for i in range(capacity + 2, 2 * capacity + 2):
+            loaded.append(**self._make_transition(i))
+        self.assertIsNone(state.pending)
+        batch = loaded.sample(capacity)
+        self._assert_batch_consistent(batch, capacity)
+        sampled = sorted(int(x) for x in batch['state'][:, 0, 0])
+        self.assertEqual(sampled, list(range(capacity + 2, 2 * capacity + 2)))
+
+    def test_save_incrementally(self):
+        capacity = self.capacity
+        dirname = os.path.join(tempfile.mkdtemp(), 'rbuf')
+
+        rbuf = replay_buffer.ArrayReplayBuffer(capacity)
+        # Saving an empty buffer is allowed
+        rbuf.save(dirname)
+        n = 0
+        for n_new in [1, 2, capacity, 2 * capacity + 1, 0, 3]:
+            for i in range(n, n + n_new):
+                rbuf.append(**self._make_transition(i))
+            n += n_new
+            rbuf.save(dirname)
+
+            # Shards of discarded transitions are removed
+            n_state_shards = len([f for f in os.listdir(dirname)
+                                  if f.startswith('transitions.state.')])
+            self.assertLessEqual(n_state_shards, capacity)
+
+            loaded = replay_buffer.ArrayReplayBuffer(capacity)
+            loaded.load(dirname)
+            self.assertEqual(len(loaded), min(n, capacity))
+            batch = loaded.sample(len(loaded))
+            self._assert_batch_consistent(batch, len(loaded))
+            sampled = sorted(int(x) for x in batch['state'][:, 0, 0])
+            self.assertEqual(sampled, list(range(max(0, n - capacity), n)))
+
+        # Only new transitions are written after loading
+        loaded.append(**self._make_transition(n))
+        loaded.save(dirname)
+        self.assertTrue(os.path.exists(os.path.join(
+            dirname, 'transitions.state.{}-{}.npy'.format(n, n + 1))))
+
+        # Saving another buffer overwrites the directory
+        another = replay_buffer.ArrayReplayBuffer(capacity)
+        another.append(**self._make_transition(0))
+        another.save(dirname)
+        loaded = replay_buffer.ArrayReplayBuffer(capacity)
+        loaded.load(dirname)
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual(
+            len([f for f in os.listdir(dirname) if f.endswith('.npy')]),
+            len(loaded.columns))
+
+
+@testing.parameterize(*testing.product(
+    {
+        'capacity': [1, 20],
+        'memory_capacity': [1, 5],
+        'segment_size': [1, 3, 100],
+    }
+))
+class TestSpillingReplayBuffer(unittest.TestCase):
+
+    def _make_transition(self, i):
+        return dict(state=np.full((2, 3), i, dtype=np.float32),
+                    action=i % 4, reward=0.5 * i,
+                    next_state=np.full((2, 3), i + 1, dtype=np.float32),
+                    next_action=(i + 1) % 4, is_state_terminal=(i % 3 == 0))
+
+    def _make_rbuf(self):
+        return replay_buffer.SpillingReplayBuffer(
+            self.capacity, min(self.memory_capacity, self.capacity),
+            dirname=tempfile.mkdtemp(), segment_size=self.segment_size)
+
+    def _assert_batch_is_latest(self, batch, n):
+        for k in range(len(batch['reward'])):
+            i = int(batch['state'][k, 0, 0])
+            for key, value in self._make_transition(i).items():
+                np.testing.assert_array_equal(batch[key][k], value)
+        sampled = sorted(int(x) for x in batch['state'][:, 0, 0])
+        self.assertEqual(
+            sampled, list(range(max(0, n - self.capacity), n)))
+
+    def test_append_and_sample(self):
+        rbuf = self._make_rbuf()
+        self.assertEqual(len(rbuf), 0)
+        for n in range(1, 3 * self.capacity + 2):
+            rbuf.append(**self._make_transition(n - 1))
+            self.assertEqual(len(rbuf), min(n, self.capacity))
+            self._assert_batch_is_latest(rbuf.sample(len(rbuf)), n)
+
+            # Segment files of discarded transitions are removed
+            n_segments = len([f for f in os.listdir(rbuf.dirname)
+                              if f.endswith('.state.npy')])
+            self.assertLessEqual(
+                n_segments, self.capacity // self.segment_size + 2)
+
+        stats = dict(rbuf.get_statistics())
+        n_sampled = sum(min(n, self.capacity)
+                        for n in range(1, 3 * self.capacity + 2))
+        self.assertEqual(stats['n_hits'] + stats['n_misses'], n_sampled)
+        if rbuf.memory_capacity < self.capacity:
+            self.assertGreater(stats['n_misses'], 0)
+            self.assertGreater(stats['bytes_read'], 0)
+        else:
+            self.assertEqual(stats['n_misses'], 0)
+            self.assertEqual(stats['bytes_read'], 0)
+
+    def test_save_and_load(self):
+        rbuf = self._make_rbuf()
+        n = 2 * self.capacity + 1
+        for i in range(n):
+            rbuf.append(**self._make_transition(i))
+        dirname = os.path.join(tempfile.mkdtemp(), 'rbuf')
+        rbuf.save(dirname)
+
+        # It can be loaded by both SpillingReplayBuffer and ArrayReplayBuffer
+        rbuf = self._make_rbuf()
+        rbuf.load(dirname)
+        self.assertEqual(len(rbuf), self.capacity)
+        self._assert_batch_is_latest(rbuf.sample(self.capacity), n)
+        array_rbuf = replay_buffer.ArrayReplayBuffer(self.capacity)
+        array_rbuf.load(dirname)
+        self._assert_batch_is_latest(array_rbuf.sample(self.capacity), n)
+
+        # Appending after loading discards the oldest one
+        rbuf.append(**self._make_transition(n))
+        self._assert_batch_is_latest(rbuf.sample(self.capacity), n + 1)
+
+        # Segment files of transitions discarded after loading are removed
+        for i in range(n + 1, n + 1 + 2 * self.capacity):
+            rbuf.append(**self._make_transition(i))
+        n_segments = len([f for f in os.listdir(rbuf.dirname)
+                          if f.endswith('.state.npy')])
+        self.assertLessEqual(
+            n_segments, self.capacity // self.segment_size + 2)
+        for segment_id in rbuf.segments.keys():
+            self.assertGreaterEqual(segment_id, rbuf.oldest_segment_id)
+
+
+@testing.parameterize(*testing.product(
+    {
+        'capacity': [1, 10, 100],
+        'frame_capacity': [None, 8, 1000],
+    }
+))
+class TestFrameStackReplayBuffer(unittest.TestCase):
+
+    def _generate_transitions(self, episode_lens):
+        """Generate transitions like ALE with n_last_screens=4."""
+        transs = []
+        t = 0
+        for episode_len in episode_lens:
+            zero = np.zeros((2, 3), dtype=np.uint8)
+            screens = [zero] * 3 + [np.full((2, 3), t % 250 + 1, np.uint8)]
+            for i in range(episode_len):
+                t += 1
+                state = list(screens)
+                terminal = i == episode_len - 1
+                if not terminal:
+                    screens = screens[1:] + [
+                        np.full((2, 3), t % 250 + 1, np.uint8)]
+                transs.append(dict(
+                    state=state, action=t % 3, reward=float(t),
+                    next_state=list(screens), next_action=(t + 1) % 3,
+                    is_state_terminal=terminal))
+        return transs
+
+    def _assert_batch_equal(self, batch, transs_by_reward):
+        for k in range(len(batch['reward'])):
+            trans = transs_by_reward[float(batch['reward'][k])]
+            np.testing.assert_array_equal(
+                batch['state'][k], np.asarray(trans['state']))
+            np.testing.assert_array_equal(
+                batch['next_state'][k], np.asarray(trans['next_state']))
+            self.assertEqual(batch['action'][k], trans['action'])
+            self.assertEqual(batch['next_action'][k], trans['next_action'])
+            self.assertEqual(batch['is_state_terminal'][k],
+                             trans['is_state_terminal'])
+
+    def test_append_and_sample(self):
+        rbuf = replay_buffer.FrameStackReplayBuffer(
+            self.capacity, n_frames=4, frame_capacity=self.frame_capacity)
+        self.assertEqual(len(rbuf), 0)
+
+        transs = self._generate_transitions([1, 5, 30, 2, 100])
+        transs_by_reward = {}
+        for trans in transs:
+            rbuf.append(**trans)
+            transs_by_reward[trans['reward']] = trans
+            self.assertGreater(len(rbuf), 0)
+            self.assertLessEqual(len(rbuf), self.capacity)
+            batch = rbuf.sample(len(rbuf))
+            self.assertEqual(batch['state'].shape, (len(rbuf), 4, 2, 3))
+            self.assertEqual(batch['state'].dtype, np.uint8)
+            self._assert_batch_equal(batch, transs_by_reward)
+
+        # The latest transition is always kept
+        batch = rbuf.sample(len(rbuf))
+        self.assertIn(transs[-1]['reward'], batch['reward'])
+
+    def test_frames_are_shared(self):
+        rbuf = replay_buffer.FrameStackReplayBuffer(
+            self.capacity, n_frames=4, frame_capacity=self.frame_capacity)
+        episode_len = 10
+        for trans in self._generate_transitions([episode_len]):
+            rbuf.append(**trans)
+        # Only a single non-padding initial frame and a frame per non-terminal
+        # transition are written
+        self.assertEqual(rbuf.n_written_frames, episode_len)
+
+    def test_multiple_envs(self):
+        rbuf = replay_buffer.FrameStackReplayBuffer(
+            self.capacity, n_frames=4, frame_capacity=self.frame_capacity)
+        transs = self._generate_transitions([6, 6])
+        episodes = [transs[:6], transs[6:]]
+        transs_by_reward = {}
+        # Transitions of two envs are appended alternately
+        for t in range(6):
+            for env_id, episode in enumerate(episodes):
+                trans = dict(episode[t], reward=10 * env_id + t)
+                rbuf.append(env_id=env_id, **trans)
+                transs_by_reward[trans['reward']] = trans
+                self._assert_batch_equal(
+                    rbuf.sample(len(rbuf)), transs_by_reward)
+
+    def test_save_and_load(self):
+        tempdir = tempfile.mkdtemp()
+        rbuf = replay_buffer.FrameStackReplayBuffer(
+            self.capacity, n_frames=4, frame_capacity=self.frame_capacity)
+        transs = self._generate_transitions([3, 20])
+        for trans in transs:
+            rbuf.append(**trans)
+        n = len(rbuf)
+
+        dirname = os.path.join(tempdir, 'rbuf')
+        rbuf.save(dirname)
+
+        rbuf = replay_buffer.FrameStackReplayBuffer(
+            self.capacity, n_frames=4, frame_capacity=self.frame_capacity)
+        rbuf.load(dirname)
+        self.assertEqual(len(rbuf), n)
+        transs_by_reward = dict((t['reward'], t) for t in transs)
+        self._assert_batch_equal(rbuf.sample(n), transs_by_reward)
+
+        # Keep appending and saving to the same directory
+        more_transs = self._generate_transitions([5, 7])
+        for trans in more_transs:
+            trans['reward'] += len(transs)
+            transs_by_reward[trans['reward']] = trans
+            rbuf.append(**trans)
+            rbuf.save(dirname)
+        n = len(rbuf)
+        rbuf = replay_buffer.FrameStackReplayBuffer(1)
+        rbuf.load(dirname)
+        self.assertEqual(len(rbuf), n)
+        self._assert_batch_equal(rbuf.sample(n), transs_by_reward)
+
+
+@testing.parameterize(*testing.product(
+    {
+        'capacity': [10, 40, 100],
+    }
+))
+class TestArrayEpisodicReplayBuffer(unittest.TestCase):
+
+    def _append_episodes(self, rbuf, episode_lens, offset=0):
+        t = offset
+        for n in episode_lens:
+            for i in range(n):
+                rbuf.append(state=np.full(2, t, dtype=np.float32), action=t,
+                            reward=t, next_state=np.full(2, t + 1, np.float32),
+                            next_action=t + 1, is_state_terminal=(i == n - 1))
+                t += 1
+
+    def _assert_consistent(self, rbuf, episode_lens):
+        # Only the latest episodes that fit in the capacity are kept
+        kept = []
+        for n in reversed(episode_lens):
+            if sum(kept) + n > self.capacity:
+                break
+            kept.append(n)
+        self.assertEqual(len(rbuf), sum(kept))
+        self.assertEqual(rbuf.n_episodes, len(kept))
+
+        s = rbuf.sample(len(rbuf))
+        n_total = sum(episode_lens)
+        self.assertEqual(sorted(s['action'].tolist()),
+                         list(range(n_total - sum(kept), n_total)))
+
+        for max_len in [None, 3]:
+            s = rbuf.sample_episodes(rbuf.n_episodes, max_len=max_len)
+            self.assertEqual(sorted(s['length'].tolist()),
+                             sorted(min(n, max_len or n) for n in kept))
+            self.assertEqual(s['state'].shape,
+                             (rbuf.n_episodes, s['length'].max(), 2))
+            for k, length in enumerate(s['length']):
+                np.testing.assert_array_equal(
+                    s['mask'][k], np.arange(s['mask'].shape[1]) < length)
+                actions = s['action'][k, :length]
+                # Transitions are consecutive in an episode
+                np.testing.assert_array_equal(
+                    np.diff(actions), np.ones(length - 1))
+                np.testing.assert_array_equal(
+                    s['state'][k, :length, 0], actions)
+                if max_len is None:
+                    self.assertTrue(s['is_state_terminal'][k, length - 1])
+
+    def test_append_and_sample(self):
+        rbuf = replay_buffer.ArrayEpisodicReplayBuffer(self.capacity)
+        episode_lens = [5, 10, 3, 7, 9, 1, 4, 6]
+        self._append_episodes(rbuf, episode_lens)
+        self._assert_consistent(rbuf, episode_lens)
+
+    def test_stop_current_episode(self):
+        rbuf = replay_buffer.ArrayEpisodicReplayBuffer(self.capacity)
+        rbuf.append(state=0, action=0, reward=0)
+        # An unfinished episode is not sampled
+        self.assertEqual(len(rbuf), 0)
+        self.assertEqual(rbuf.n_episodes, 0)
+        rbuf.stop_current_episode()
+        self.assertEqual(len(rbuf), 1)
+        self.assertEqual(rbuf.n_episodes, 1)
+        rbuf.stop_current_episode()
+        self.assertEqual(rbuf.n_episodes, 1)
+
+    def test_multiple_envs(self):
+        rbuf = replay_buffer.ArrayEpisodicReplayBuffer(self.capacity)
+        # Episodes of two envs are appended alternately
+        for t in range(4):
+            for env_id in range(2):
+                rbuf.append(state=np.full(2, t, dtype=np.float32),
+                            action=100 * env_id + t, reward=0,
+                            is_state_terminal=(t == 3 and env_id == 0),
+                            env_id=env_id)
+        self.assertEqual(rbuf.n_episodes, 1)
+        rbuf.stop_current_episode(env_id=1)
+        self.assertEqual(rbuf.n_episodes, 2)
+        s = rbuf.sample_episodes(2)
+        self.assertEqual(sorted(s['action'][:, 0].tolist()), [0, 100])
+        for k in range(2):
+            np.testing.assert_array_equal(
+                s['action'][k], s['action'][k, 0] + np.arange(4))
+            np.testing.assert_array_equal(
+                s['state'][k, :, 0], np.arange(4))
+
+    def test_save_and_load(self):
+        tempdir = tempfile.mkdtemp()
+        rbuf = replay_buffer.ArrayEpisodicReplayBuffer(self.capacity)
+        episode_lens = [5, 10, 3, 7]
+        self._append_episodes(rbuf, episode_lens)
+        # The unfinished episode is not saved
+        rbuf.append(state=np.zeros(2, np.float32), action=-1, reward=0)
+        rbuf.save(tempdir)
+
+        rbuf = replay_buffer.ArrayEpisodicReplayBuffer(self.capacity)
+        rbuf.load(tempdir)
+        self._assert_consistent(rbuf, episode_lens)
+
+        # Keep appending and saving to the same directory
+        more_episode_lens = [9, 1, 4, 6]
+        self._append_episodes(rbuf, more_episode_lens,
+                              offset=sum(episode_lens))
+        rbuf.save(tempdir)
+        rbuf = replay_buffer.ArrayEpisodicReplayBuffer(self.capacity)
+        rbuf.load(tempdir)
+        self._assert_consistent(rbuf, episode_lens + more_episode_lens)
+
+
+class TestSharedEpisodicReplayBuffer(unittest.TestCase):
+
+    def _append_episodes(self, rbuf, episode_lens, offset=0):
+        t = offset
+        for n in episode_lens:
+            for i in range(n):
+                rbuf.append(state=np.full(2, t, dtype=np.float32), action=t,
+                            reward=t, next_state=np.full(2, t + 1, np.float32),
+                            next_action=t + 1, is_state_terminal=(i == n - 1),
+                            mu=None)
+                t += 1
+
+    def _assert_episodes_consistent(self, batch):
+        for k, length in enumerate(batch['length']):
+            actions = batch['action'][k, :length]
+            np.testing.assert_array_equal(
+                np.diff(actions), np.ones(length - 1))
+            np.testing.assert_array_equal(
+                batch['state'][k, :length, 0], actions)
+            np.testing.assert_array_equal(
+                batch['next_state'][k, :length, 0], actions + 1)
+
+    def test_append_and_sample(self):
+        rbuf = replay_buffer.SharedEpisodicReplayBuffer(
+            20, state_shape=(2,))
+        self._append_episodes(rbuf, [5, 10, 3, 7])
+        # The first episode is overwritten by the last one
+        self.assertEqual(len(rbuf), 20)
+        self.assertEqual(rbuf.n_episodes, 3)
+
+        s = rbuf.sample(1000)
+        self.assertEqual(s['state'].shape, (1000, 2))
+        self.assertEqual(set(s['action']), set(range(5, 25)))
+
+        s = rbuf.sample_episodes(3)
+        self.assertEqual(sorted(s['length']), [3, 7, 10])
+        self._assert_episodes_consistent(s)
+        s = rbuf.sample_episodes(3, max_len=2)
+        np.testing.assert_array_equal(s['length'], [2, 2, 2])
+        self._assert_episodes_consistent(s)
+
+    def test_sample_episodes_discarded(self):
+        rbuf = replay_buffer.SharedEpisodicReplayBuffer(
+            20, state_shape=(2,))
+        self._append_episodes(rbuf, [1, 1, 1, 1, 1])
+        self.assertEqual(rbuf.n_episodes, 5)
+        # Another process may discard episodes after n_episodes is checked
+        self._append_episodes(rbuf, [18], offset=5)
+        self.assertEqual(rbuf.n_episodes, 3)
+        s = rbuf.sample_episodes(5)
+        self.assertEqual(sorted(s['length']), [1, 1, 18])
+        self._assert_episodes_consistent(s)
+
+    def test_save_and_load(self):
+        tempdir = tempfile.mkdtemp()
+        rbuf = replay_buffer.SharedEpisodicReplayBuffer(
+            20, state_shape=(2,))
+        self._append_episodes(rbuf, [5, 10, 3, 7])
+        rbuf.save(tempdir)
+
+        rbuf = replay_buffer.SharedEpisodicReplayBuffer(
+            20, state_shape=(2,))
+        rbuf.load(tempdir)
+        self.assertEqual(len(rbuf), 20)
+        self.assertEqual(rbuf.n_episodes, 3)
+        self._assert_episodes_consistent(rbuf.sample_episodes(3))
+
+        rbuf = replay_buffer.ArrayEpisodicReplayBuffer(20)
+        rbuf.load(tempdir)
+        self.assertEqual(len(rbuf), 20)
+        self.assertEqual(rbuf.n_episodes, 3)
+
+    def test_multiprocess(self):
+        rbuf = replay_buffer.SharedEpisodicReplayBuffer(
+            100, state_shape=(2,))
+
+        def run_func(process_idx):
+            self._append_episodes(
+                rbuf, [3, 9, 4, 7, 1, 5] * 10, offset=process_idx * 1000)
+            # Episodes appended by other processes can be sampled
+            self._assert_episodes_consistent(rbuf.sample_episodes(5))
+
+        processes = [mp.Process(target=run_func, args=(process_idx,))
+                     for process_idx in range(4)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        self.assertEqual(rbuf.n_written.value, 4 * 29 * 10)
+        self.assertLessEqual(len(rbuf), 100)
+        s = rbuf.sample_episodes(rbuf.n_episodes)
+        self.assertEqual(s['length'].sum(), len(rbuf))
+        self._assert_episodes_consistent(s)
+
+    def test_mu(self):
+        rbuf = replay_buffer.SharedEpisodicReplayBuffer(
+            20, state_shape=(2,), mu_size=3)
+        for t in range(4):
+            logits = np.asarray([[t, 0, -t]], dtype=np.float32)
+            rbuf.append(state=np.full(2, t, dtype=np.float32), action=t,
+                        reward=t, next_state=np.full(2, t + 1, np.float32),
+                        next_action=t + 1, is_state_terminal=(t == 3),
+                        mu=distribution.SoftmaxDistribution(logits))
+        s = rbuf.sample_episodes(1)
+        self.assertEqual(s['mu'].shape, (1, 4, 3))
+        # Probabilities of the distributions are stored
+        for t in range(4):
+            logits = np.asarray([[t, 0, -t]], dtype=np.float32)
+            np.testing.assert_allclose(
+                s['mu'][0, t],
+                distribution.SoftmaxDistribution(logits).all_prob.data[0],
+                rtol=1e-5)
+
+
+class TestBatchEpisodes(unittest.TestCase):
+
+    def test_list_and_dict(self):
+        episodes = []
+        rbuf = replay_buffer.ArrayEpisodicReplayBuffer(100)
+        t = 0
+        for n in [2, 5, 3]:
+            episode = []
+            for i in range(n):
+                trans = dict(state=np.full(2, t, dtype=np.float32), action=t,
+                             reward=t, next_state=np.zeros(2, np.float32),
+                             next_action=0, is_state_terminal=(i == n - 1))
+                rbuf.append(**trans)
+                episode.append(trans)
+                t += 1
+            episodes.append(episode)
+
+        indices, lengths, batches = replay_buffer.batch_episodes(
+            episodes, xp=np, phi=lambda x: x)
+        np.testing.assert_array_equal(indices, [1, 2, 0])
+        np.testing.assert_array_equal(lengths, [5, 3, 2])
+        self.assertEqual(len(batches), 5)
+        np.testing.assert_array_equal(batches[0]['action'], [2, 7, 0])
+        np.testing.assert_array_equal(batches[2]['action'], [4, 9])
+        np.testing.assert_array_equal(batches[4]['action'], [6])
+
+        sampled = rbuf.sample_episodes(3)
+        _, d_lengths, d_batches = replay_buffer.batch_episodes(
+            sampled, xp=np, phi=lambda x: x)
+        np.testing.assert_array_equal(d_lengths, [5, 3, 2])
+        self.assertEqual(len(d_batches), 5)
+        for batch, d_batch in zip(batches, d_batches):
+            for key in batch:
+                np.testing.assert_array_equal(batch[key], d_batch[key])
+
+
+@testing.parameterize(*testing.product(
+    {
+        'n_step': [1, 3],
+        'buffer_type': ['list', 'array', 'prioritized'],
+    }
+))
+class TestNStepReplayBuffer(unittest.TestCase):
+
+    def _make_buffer(self, gamma):
+        if self.buffer_type == 'list':
+            return replay_buffer.ReplayBuffer(
+                100, n_step=self.n_step, gamma=gamma)
+        elif self.buffer_type == 'array':
+            return replay_buffer.ArrayReplayBuffer(
+                100, n_step=self.n_step, gamma=gamma)
+        else:
+            return replay_buffer.PrioritizedReplayBuffer(
+                100, n_step=self.n_step, gamma=gamma)
+
+    def _sample_all(self, rbuf):
+        n = len(rbuf)
+        batch = replay_buffer.batch_experiences(
+            rbuf.sample(n), xp=np, phi=lambda x: x)
+        if self.buffer_type == 'prioritized':
+            rbuf.update_errors([1.0] * n)
+        order = np.argsort(batch['state'])
+        return {key: value[order] for key, value in batch.items()}
+
+    def test_append_and_sample(self):
+        gamma = 0.5
+        rbuf = self._make_buffer(gamma)
+        # A terminated episode of length 5 followed by an interrupted one
+        rewards = [1, 2, 4, 8, 16, 32, 64]
+        for t, r in enumerate(rewards):
+            rbuf.append(state=t, action=t, reward=r, next_state=t + 1,
+                        next_action=t + 1, is_state_terminal=(t == 4))
+        rbuf.stop_current_episode()
+        self.assertEqual(len(rbuf), len(rewards))
+
+        batch = self._sample_all(rbuf)
+        episodes = [(0, 5, True), (5, 7, False)]
+        for start, stop, terminal in episodes:
+            for t in range(start, stop):
+                last = min(t + self.n_step, stop) - 1
+                expected_return = sum(gamma ** (k - t) * rewards[k]
+                                      for k in range(t, last + 1))
+                self.assertEqual(batch['state'][t], t)
+                self.assertEqual(batch['action'][t], t)
+                self.assertAlmostEqual(batch['reward'][t], expected_return)
+                self.assertEqual(batch['next_state'][t], last + 1)
+                self.assertEqual(batch['next_action'][t], last + 1)
+                self.assertEqual(batch['is_state_terminal'][t],
+                                 terminal and last == stop - 1)
+                if self.n_step == 1:
+                    self.assertNotIn('discount', batch)
+                else:
+                    self.assertAlmostEqual(
+                        batch['discount'][t], gamma ** (last - t + 1))
+
+    def test_multiple_envs(self):
+        gamma = 0.5
+        rbuf = self._make_buffer(gamma)
+        # Transitions of two envs are appended alternately
+        for t in range(4):
+            for env_id in range(2):
+                s = 10 * env_id + t
+                rbuf.append(state=s, action=s, reward=2 ** t,
+                            next_state=s + 1, next_action=s + 1,
+                            env_id=env_id)
+        rbuf.stop_current_episode(env_id=0)
+        rbuf.stop_current_episode(env_id=1)
+        self.assertEqual(len(rbuf), 8)
+
+        batch = self._sample_all(rbuf)
+        for k, s in enumerate([0, 1, 2, 3, 10, 11, 12, 13]):
+            t = s % 10
+            last = min(t + self.n_step, 4) - 1
+            self.assertEqual(batch['state'][k], s)
+            self.assertEqual(batch['next_state'][k], s + last - t + 1)
+            self.assertAlmostEqual(
+                batch['reward'][k],
+                sum(gamma ** (i - t) * 2 ** i for i in range(t, last + 1)))
+
+    def test_gamma_required(self):
+        if self.n_step == 1:
+            return
+        with self.assertRaises(ValueError):
+            self._make_buffer(None)
+
+
 @testing.parameterize(*testing.product(
     {
         'capacity': [100, None],
@@ -196,13 +917,15 @@ class TestEpisodicReplayBuffer(unittest.TestCase):
 @testing.parameterize(*testing.product(
     {
         'capacity': [100, None],
+        'sum_tree_type': ['pointer', 'array'],
     }
 ))
 class TestPrioritizedReplayBuffer(unittest.TestCase):
 
     def test_append_and_sample(self):
         capacity = self.capacity
-        rbuf = replay_buffer.PrioritizedReplayBuffer(capacity)
+        rbuf = replay_buffer.PrioritizedReplayBuffer(
+            capacity, sum_tree_type=self.sum_tree_type)
 
         self.assertEqual(len(rbuf), 0)
 
@@ -244,6 +967,26 @@ class TestPrioritizedReplayBuffer(unittest.TestCase):
         s4 = rbuf.sample(2)
         self.assertAlmostEqual(s4[0]['weight'], s4[1]['weight'])
 
+    def test_weights_normalized_by_global_max(self):
+        rbuf = replay_buffer.PrioritizedReplayBuffer(
+            self.capacity, alpha=1.0, beta0=1.0, eps=0.0,
+            sum_tree_type=self.sum_tree_type)
+        for x in range(4):
+            rbuf.append(state=x, action=0, reward=0, next_state=x + 1)
+        sampled = rbuf.sample(4)
+        errors = [1.0 + e['state'] for e in sampled]
+        rbuf.update_errors(errors)
+        # priorities are 1, 2, 3 and 4, so the minimum probability is 0.1
+        for _ in range(10):
+            s = rbuf.sample(1)
+            rbuf.update_errors([1.0 + s[0]['state']])
+            if self.sum_tree_type == 'array':
+                expected = 1.0 / (1.0 + s[0]['state'])
+            else:
+                # The minimum is taken within the minibatch
+                expected = 1.0
+            self.assertAlmostEqual(s[0]['weight'], expected)
+
     def test_capacity(self):
         capacity = self.capacity
         if capacity is None:
@@ -310,6 +1053,72 @@ class TestPrioritizedReplayBuffer(unittest.TestCase):
             self.assertEqual(s2[1], trans1)
 
 
+@testing.parameterize(*testing.product(
+    {
+        'normalize_by_max': [True, False],
+        'probabilities_type': ['list', 'ndarray'],
+    }
+))
+class TestPriorityWeightError(unittest.TestCase):
+
+    def setUp(self):
+        self.pwe = replay_buffer.PriorityWeightError(
+            alpha=0.5, beta0=0.4, betasteps=10, eps=1e-2,
+            normalize_by_max=self.normalize_by_max)
+        self.pwe.memory = [None] * 10
+
+    def test_priority_from_errors(self):
+        errors = [0.0, 1.0, 4.0]
+        if self.probabilities_type == 'ndarray':
+            errors = np.asarray(errors, dtype=np.float32)
+        priority = self.pwe.priority_from_errors(errors)
+        self.assertIsInstance(priority, np.ndarray)
+        np.testing.assert_allclose(priority, [0.01, 1.01, 2.01])
+
+    def test_weights_from_probabilities(self):
+        if self.probabilities_type == 'list':
+            probabilities = [0.1, None, 0.4, 0.2]
+        else:
+            probabilities = np.asarray([0.1, np.nan, 0.4, 0.2])
+        weights = self.pwe.weights_from_probabilities(probabilities)
+        self.assertIsInstance(weights, np.ndarray)
+        # Not prioritized data are treated as having the min probability
+        expected = np.asarray([0.1, 0.1, 0.4, 0.2])
+        if self.normalize_by_max:
+            expected = (expected / 0.1) ** -0.4
+        else:
+            expected = (10 * expected) ** -0.4
+        np.testing.assert_allclose(weights, expected)
+        # beta is annealed
+        self.assertAlmostEqual(self.pwe.beta, 0.46)
+
+    def test_weights_from_probabilities_not_prioritized(self):
+        if self.probabilities_type == 'list':
+            probabilities = [None, None]
+        else:
+            probabilities = np.asarray([np.nan, np.nan])
+        weights = self.pwe.weights_from_probabilities(probabilities)
+        if self.normalize_by_max:
+            np.testing.assert_allclose(weights, [1.0, 1.0])
+        else:
+            np.testing.assert_allclose(weights, [10 ** -0.4] * 2)
+
+    def test_weights_from_probabilities_with_min_probability(self):
+        if self.probabilities_type == 'list':
+            probabilities = [0.1, None, 0.4, 0.2]
+        else:
+            probabilities = np.asarray([0.1, np.nan, 0.4, 0.2])
+        weights = self.pwe.weights_from_probabilities(
+            probabilities, min_probability=0.05)
+        # Not prioritized data are treated as having the global min
+        expected = np.asarray([0.1, 0.05, 0.4, 0.2])
+        if self.normalize_by_max:
+            expected = (expected / 0.05) ** -0.4
+        else:
+            expected = (10 * expected) ** -0.4
+        np.testing.assert_allclose(weights, expected)
+
+
 def exp_return_of_episode(episode):
     return sum(np.exp(x['reward']) for x in episode)
 
@@ -409,3 +1218,92 @@ class TestReplayBufferFail(unittest.TestCase):
         self._sample1()
         self._set1()
         self.assertRaises(AssertionError, self._set1)
+
+
+@testing.parameterize(*testing.product(
+    {
+        'n_prefetch': [0, 1, 3],
+        'use_batch_func': [True, False],
+    }
+))
+class TestReplayUpdater(unittest.TestCase):
+
+    def test_update(self):
+        rbuf = replay_buffer.ReplayBuffer(100)
+        for i in range(10):
+            rbuf.append(state=i, action=i, reward=0, next_state=i + 1)
+
+        updated = []
+
+        if self.use_batch_func:
+            def batch_func(experiences):
+                return sorted(elem['state'] for elem in experiences)
+        else:
+            batch_func = None
+
+        updater = replay_buffer.ReplayUpdater(
+            replay_buffer=rbuf,
+            update_func=updated.append,
+            batchsize=4,
+            episodic_update=False,
+            n_times_update=2,
+            replay_start_size=10,
+            update_interval=2,
+            batch_func=batch_func,
+            n_prefetch=self.n_prefetch,
+        )
+        for t in range(1, 11):
+            # Modifications must be done while holding the lock
+            with updater.lock:
+                rbuf.append(state=9 + t, action=0, reward=0,
+                            next_state=10 + t)
+            updater.update_if_necessary(t)
+        updater.stop_prefetch()
+
+        self.assertEqual(len(updated), 10)
+        for batch in updated:
+            self.assertEqual(len(batch), 4)
+            if self.use_batch_func:
+                self.assertEqual(batch, sorted(batch))
+            else:
+                for elem in batch:
+                    self.assertIsInstance(elem, dict)
+
+    def test_prefetch_error(self):
+        if self.n_prefetch == 0:
+            return
+        rbuf = replay_buffer.ReplayBuffer(100)
+        for i in range(10):
+            rbuf.append(state=i, action=i, reward=0, next_state=i + 1)
+
+        def batch_func(experiences):
+            raise RuntimeError('error in batch_func')
+
+        updater = replay_buffer.ReplayUpdater(
+            replay_buffer=rbuf,
+            update_func=lambda batch: None,
+            batchsize=4,
+            episodic_update=False,
+            n_times_update=1,
+            replay_start_size=10,
+            update_interval=1,
+            batch_func=batch_func,
+            n_prefetch=self.n_prefetch,
+        )
+        with self.assertRaises(RuntimeError):
+            updater.update_if_necessary(1)
+
+    def test_prefetch_prioritized(self):
+        if self.n_prefetch == 0:
+            return
+        with self.assertRaises(ValueError):
+            replay_buffer.ReplayUpdater(
+                replay_buffer=replay_buffer.PrioritizedReplayBuffer(100),
+                update_func=lambda batch: None,
+                batchsize=4,
+                episodic_update=False,
+                n_times_update=1,
+                replay_start_size=10,
+                update_interval=1,
+                n_prefetch=self.n_prefetch,
+            )